@@ -1,9 +1,22 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 import math
+import numpy as np
 import streamlit as st
-import plotly.graph_objects as go
-from PIL import Image, ImageDraw, ImageFont
-import io
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+from duiker_kern import (DuikerArray, Afvoerkromme, DuikerResultaat, DuikerKern, bereken_duiker,
+                         benodigde_opstuwing, toelaatbare_lengte, benodigde_diameter, toelaatbare_sliblaag)
+from duiker_geometrie import PROFIELEN, doorsnede_scalair, profielhoogte
+from duiker_tekening import LRUCache, DuikerRenderer, duiker_labels, duiker_renderer, duiker_visualisatie
+from duiker_gevoeligheid import gevoeligheden
 
 ## Duiker tool
 # ============================================================================= 
@@ -17,35 +30,53 @@ class Duiker(BaseModel):
     manning: float
     bovenwaterstand: float
     benedenwaterstand: float
-            
+    # Profiel (zie duiker_geometrie); diameter is dan de breedte en de
+    # hoogte geldt alleen voor rechthoek en ellips
+    profiel: str = 'rond'
+    hoogte: Optional[float] = None
+    # Ligging (x, y, bijvoorbeeld RD [m]) voor de ruimtelijke index (zie
+    # duiker_ruimte); telt niet mee in de berekening
+    x: Optional[float] = None
+    y: Optional[float] = None
+
+    @validator('profiel', allow_reuse=True)
+    def bekend_profiel(cls, profiel):
+        if profiel not in PROFIELEN:
+            raise ValueError(f"onbekend profiel '{profiel}', kies uit {', '.join(PROFIELEN)}")
+        return profiel
+
+    ## Natte doorsnede:
+    # ===================================
+    @property
+    def doorsnede(self):
+        # (sliblaag, nat oppervlak, natte omtrek) uit de profieltabel
+        return doorsnede_scalair(self.profiel, self.diameter, self.hoogte, self.sliblaag_procent)
+
     ## Oppervlak onder de grond:
     # ===================================
     @property
     def sliblaag(self):
-        # Straal
-        r = self.diameter/2 
-        # Afstand midden tot koorde                   
-        d = r - (self.diameter * self.sliblaag_procent)
-        # Koorde 
-        k = 2 * (r**2 - d**2)**0.5
-        # Oppervlak onder de grond                      
-        opp = r**2 *  math.asin((k/2)/r) - (0.5 * k * d) 
-        return opp
+        return self.doorsnede[0]
    
     ## Hydraulische ruwheid:
     # ===================================
     @property
     def ruwheid(self):
-        # Natte oppervlak duiker
-        nat_opp_duiker = ((self.diameter/2.0)**2.0 * 3.14) - self.sliblaag
+        # Natte oppervlak en natte omtrek duiker
+        _, nat_opp_duiker, natte_omtrek = self.doorsnede
+        # Volledig dichtgeslibd: geen doorstroming
+        if nat_opp_duiker <= 0:
+            return 0.0
+        # Hydraulische straal
+        straal = nat_opp_duiker/natte_omtrek
         # Chezy coefficient
-        chezy = self.manning * (nat_opp_duiker/(2.0 * 3.14 * (self.diameter/2.0)))**(1.0/6.0)
+        chezy = self.manning * straal**(1.0/6.0)
         # Intreedverlies Ei
         Ei = self.intreedweerstand
         # Uitreedverlies E0
         E0 = self.uittreedweerstand * (1.0-(nat_opp_duiker/self.ben_str_nat_opp))**2.0
         # Wrijvingsverlies Ef
-        Ef = (2 * 9.81 * self.lengte) / (chezy**2 * (self.diameter/4))
+        Ef = (2 * 9.81 * self.lengte) / (chezy**2 * straal)
         # Totaal weerstand
         mu = (Ei + E0 + Ef)**-0.5 
         return mu
@@ -64,7 +95,7 @@ class Duiker(BaseModel):
         # Totaal weerstand
         mu = self.ruwheid
         # Natte oppervlak duiker
-        nat_opp_duiker = ((self.diameter/2.0)**2.0 * 3.14) - self.sliblaag
+        nat_opp_duiker = self.doorsnede[1]
         # Opstuwing
         opstuwing = self.opstuwing
         # Debiet
@@ -76,12 +107,16 @@ class Duiker(BaseModel):
     @property
     def stroomsnelheid(self):
         # Natte oppervlak duiker
-        nat_opp_duiker = ((self.diameter/2.0)**2.0 * 3.14) - self.sliblaag
-        # Stroomsnelheid in duiker
+        nat_opp_duiker = self.doorsnede[1]
+        # Stroomsnelheid in duiker, 0 bij een volledig dichtgeslibde duiker
+        if nat_opp_duiker <= 0:
+            return 0.0
         stroomsnelheid = self.debiet/nat_opp_duiker
         return stroomsnelheid
 
     def plotly_figure(self):
+        # Plotly wordt pas geladen als er een figuur nodig is
+        import plotly.graph_objects as go
         scale_ratio = self.lengte / self.diameter / 2.0
         fig = go.Figure(layout=go.Layout(autosize=True, width=800, height=400,
                                          margin=dict(l=20, r=20, t=20, b=20),
@@ -116,18 +151,69 @@ class Duiker(BaseModel):
         fig.add_annotation(dict(x=0.0, y=0.0, text=f'DUIKER: {self.debiet:.2f}m³/s'))
         return fig
 
+    def afvoerkromme_figuur(self, max_verval=None, punten=200):
+        # Debiet als functie van het verval (Q-h), met het huidige verval als punt
+        import plotly.graph_objects as go
+        kromme = Afvoerkromme(DuikerArray.from_duikers([self]))
+        opstuwing = self.opstuwing
+        if max_verval is None:
+            max_verval = max(2.0 * opstuwing, 0.10)
+        verval = np.linspace(0.0, max_verval, punten)
+        fig = go.Figure(layout=go.Layout(autosize=True, width=800, height=400,
+                                         margin=dict(l=20, r=20, t=20, b=20),
+                                         template='simple_white',
+                                         xaxis=dict(title='Verval [m]'),
+                                         yaxis=dict(title='Debiet [m³/s]')))
+        fig.add_trace(dict(x=verval,
+                           y=kromme.debiet(verval),
+                           name='afvoerkromme',
+                           line=dict(color='lightblue'),
+                           showlegend=True,
+                           hoverlabel=dict(namelength=-1)))
+        if opstuwing >= 0:
+            fig.add_trace(dict(x=[opstuwing],
+                               y=kromme.debiet([opstuwing]),
+                               name=f'huidig verval = {opstuwing:.2f}m',
+                               mode='markers',
+                               marker=dict(color='brown', size=10),
+                               showlegend=True,
+                               hoverlabel=dict(namelength=-1)))
+        return fig
+
+    ## Alle resultaten in één keer:
+    # ===================================
+    def kern(self):
+        # De ligging telt niet mee in de berekening
+        return DuikerKern(**self.dict(exclude={'x', 'y'}))
+
+    def bereken(self):
+        return bereken_duiker(**self.dict(exclude={'x', 'y'}))
+
 ## GUI
 # =============================================================================
    
 ## Input:
 # ===================================
 def invoer_sidebar():
-    # Diameter
-    diameter = st.number_input(label='Diameter [meter]', 
+    # Profiel
+    profiel = st.selectbox('Profiel',
+                           options=PROFIELEN,
+                           index=0,
+                           key='profiel')
+    # Diameter (breedte bij een ander profiel dan rond)
+    diameter = st.number_input(label='Diameter [meter]' if profiel == 'rond' else 'Breedte [meter]', 
                                format="%.2f",
                                step=1.00,
                                value=0.50,  
                                min_value=0.10)
+    # Hoogte, alleen voor rechthoek en ellips
+    hoogte = None
+    if profiel in ('rechthoek', 'ellips'):
+        hoogte = st.number_input(label='Hoogte [meter]',
+                                 format="%.2f",
+                                 step=1.00,
+                                 value=diameter,
+                                 min_value=0.10)
     # Lengte
     lengte = st.number_input(label='Lengte [meter]', 
                              format="%.2f",
@@ -145,7 +231,7 @@ def invoer_sidebar():
     # percentage ondergronds
     with st.expander('percentage ondergronds'):
         if st.checkbox('Hulp', value=False, key='percentage ondergronds'):
-            st.image(Image.open('DiaDuiker.jpg'),
+            st.image(lees_afbeelding('DiaDuiker.jpg'),
                      caption='Dia Duiker')
         keuze_sliblaag = st.selectbox('Keuze: sliblaag in cm of percentage T.O.V. duiker?',
                                              options=('cm sliblaag', 'percentage T.O.V. duiker'),
@@ -163,14 +249,14 @@ def invoer_sidebar():
                                             step=1,
                                             value=5,
                                             min_value=0,
-                                            max_value=int((diameter * 100)))
-            sliblaag_cm = float((sliblaag_cm1/100) / diameter)
+                                            max_value=int((profielhoogte(profiel, diameter, hoogte) * 100)))
+            sliblaag_cm = float((sliblaag_cm1/100) / profielhoogte(profiel, diameter, hoogte))
     # Intreedweerstand
     with st.expander("In- en uitreedweerstand"):
         if st.checkbox('Hulp', value=False, key='intreedweerstand'):
             st.write('Gebuik onderstaand figuur voor het bepalen van de intreedweerstand')
             st.write('Standaardwaarde intreedweerstand = 0.4')
-            st.image(Image.open('EiWaardes.jpg'),
+            st.image(lees_afbeelding('EiWaardes.jpg'),
                      caption='Ei-waarden')
             st.write('Standaardwaarde uitreedweerstand = 1.0')
         intreedweerstand = st.number_input(label='Intreedweerstand [dimensieloos]',
@@ -191,7 +277,7 @@ def invoer_sidebar():
         if st.checkbox('Hulp', value=False, key='Hydraulische weerstand'):
             st.write('Hydraulische weerstand wordt in Manning uitgedrukt')
             st.write('Gebuik onderstaand tabel voor het bepalen van de hydraulische weerstand')
-            st.image(Image.open('kWaardem.jpg'),
+            st.image(lees_afbeelding('kWaardem.jpg'),
                      caption='k-Waardem')
         manning = st.number_input(label='Manning [s∙m ^-1/3]',
                                   value=75)
@@ -234,106 +320,418 @@ def invoer_sidebar():
                 bovenwaterstand=bovenwaterstand,
                 benedenwaterstand=benedenwaterstand,
                 keuze_sliblaag=keuze_sliblaag,
-                keuze_verval=keuze_verval)
+                keuze_verval=keuze_verval,
+                profiel=profiel,
+                hoogte=hoogte)
 
 
 
-## Visualisatie:
+## Cache (gedeeld tussen sessies en reruns):
 # ===================================
-def duiker_visualisatie(diameter: float,
-                        lengte: float,
-                        sliblaag_cm: float,
-                        sliblaag_procent: float,
-                        intreedweerstand: float,
-                        uittreedweerstand: float,
-                        ben_str_nat_opp: float,
-                        manning: float,
-                        verval: float,
-                        bovenwaterstand: float,
-                        benedenwaterstand: float,
-                        keuze_sliblaag: str,
-                        keuze_verval: str,  **kwargs):
-    # Upload achtergrondfiguur
-    with Image.open("DuikerSchematisch_V2.jpg").convert("RGBA") as base:
-    
-        # Figuur(box) waar tekst in geschreven wordt, met doorzichtige achtergrond
-        txt = Image.new("RGBA", base.size, (255, 255, 255, 0))
-    
-        # Upload een letertype
-        fnt = ImageFont.truetype(font='AllerBd.TTF', size=15, index=0, encoding='', layout_engine=None)
-        # Format om makkelijk tekst te schrijven. bij oproepen van d wordt ImageDraw.Draw(Image.new) opgeroepen
-        d = ImageDraw.Draw(txt)
-    
-        # Diameter
-        d.text((760, 280), f'Diameter: {diameter} [m]', font=fnt, fill=(0,0,0,1000))
-        # Lengte duiker
-        d.text((650, 360), f'Lengte: {lengte} [m]', font=fnt, fill=(0,0,0,1000))
-        # Keuze "percentage ondergronds" of "cm sliblaag"
-        if keuze_sliblaag == 'percentage T.O.V. duiker':
-            # Percentage ondergronds
-            d.text((1150, 345), f'Sliblaag: {sliblaag_procent * 100} [%]', font=fnt, fill=(0,0,0,1000))
-        elif keuze_sliblaag == 'cm sliblaag':
-            # cm Sliblaag
-            d.text((1150, 345), f'Sliblaag: {sliblaag_cm} [cm]', font=fnt, fill=(0,0,0,1000))
-        # Intreedweerstand
-        d.text((400, 17),  f'Intreedweerstand: {intreedweerstand}', font=fnt, fill=(0,0,0,1000))
-        # Uittreedweerstand
-        d.text((950, 17),  f'Uittreedweerstand: {uittreedweerstand}', font=fnt, fill=(0,0,0,1000))
-        # Manning
-        d.text((670, 17),  f'Manning: {manning}', font=fnt, fill=(0,0,0,1000))
-        # Keuze "Verval" of "Werkelijke hoogte in +mNAP"
-        if keuze_verval == 'Verval':
-            # Bovenwaterstand
-            d.text((210, 200), 'Bovenwaterstand: N.V.T.', font=fnt, fill=(0,0,0,1000))
-            # Benedenwaterstand              
-            d.text((1060, 300), 'Benedenwaterstand: N.V.T.', font=fnt, fill=(0,0,0,1000))
-            # Verval Duiker
-            d.text((1120, 180), f'Verval: {verval*100} [cm]', font=fnt, fill=(0,0,0,1000))                           
-        elif keuze_verval == 'Werkelijke hoogte in +mNAP':
-            # Bovenwaterstand
-            d.text((110, 200), f'Bovenwaterstand: {bovenwaterstand} [+mNAP]', font=fnt, fill=(0,0,0,1000))      
-            # Benedenwaterstand
-            d.text((1060, 300), f'Benedenwaterstand: {benedenwaterstand} [+mNAP]', font=fnt, fill=(0,0,0,1000))  
-            # Verval Duiker
-            d.text((1120, 180), 'Verval: N.V.T', font=fnt, fill=(0,0,0,1000))                                    
-            
-        out = Image.alpha_composite(base, txt)
-        buff = io.BytesIO()
-        out.save(buff, format='PNG')
-        return buff
+# Streamlit voert het script bij elke wijziging van een widget opnieuw uit.
+# Vaste afbeeldingen, de renderer en de uitvoer per invoer worden daarom
+# eenmalig per serverproces bewaard en door alle sessies gedeeld.
+@st.experimental_singleton
+def lees_afbeelding(pad: str) -> bytes:
+    # De gecodeerde bytes gaan zonder decoderen naar st.image
+    with open(pad, 'rb') as bestand:
+        return bestand.read()
+
+
+@st.experimental_singleton
+def gedeelde_renderer():
+    return DuikerRenderer()
+
+
+UITVOERCACHE_BYTES = 64 * 2**20
+
+
+def uitvoer_grootte(waarde):
+    # Geschatte grootte [bytes] van een item in de uitvoercache: de
+    # gecodeerde tekening, de JSON van een Plotly-figuur, anders getsizeof
+    if isinstance(waarde, (bytes, bytearray)):
+        return len(waarde)
+    if hasattr(waarde, 'to_json'):
+        return len(waarde.to_json())
+    if isinstance(waarde, (tuple, list)):
+        return sys.getsizeof(waarde) + sum(uitvoer_grootte(deel) for deel in waarde)
+    if isinstance(waarde, dict):
+        return sys.getsizeof(waarde) + sum(uitvoer_grootte(deel) for deel in waarde.values())
+    return sys.getsizeof(waarde)
+
+
+@st.experimental_singleton
+def gedeelde_uitvoercache():
+    # Resultaten, Plotly-figuren en tekeningen per invoer, begrensd op
+    # UITVOERCACHE_BYTES (en 1024 items)
+    return LRUCache(1024, max_bytes=UITVOERCACHE_BYTES, grootte=uitvoer_grootte)
+
+
+@st.experimental_singleton
+def gedeelde_renderpool():
+    return RenderPool(werkers=2)
+
+
+def _sleutel(invoer: dict):
+    return tuple(sorted(invoer.items()))
+
+
+def duiker_resultaat(invoer: dict, meting=None):
+    # Alleen de getallen; bij een treffer wordt er geen Duiker gebouwd
+    meting = meting or GeenMeting()
+
+    def maak():
+        with meting.span('model'):
+            return Duiker(**invoer).bereken()
+    return gedeelde_uitvoercache().ophalen(('resultaat', _sleutel(invoer)), maak)
+
+
+def weergave_taken(invoer: dict):
+    # {'tekening': ..., 'figuren': ...} als functies voor de RenderPool. Elke
+    # taak krijgt actueel() mee, stopt met VervallenWeergave zodra een nieuwere
+    # rerun het werk overbodig maakt, en geeft (waarde, spans, tellers) terug:
+    # de meting wordt alleen in de thread van het script bijgewerkt. De
+    # gedeelde cache en renderer worden hier opgehaald, want Streamlit-
+    # functies horen niet in de pool.
+    cache, renderer, sleutel = gedeelde_uitvoercache(), gedeelde_renderer(), _sleutel(invoer)
+
+    def ophalen(naam, maak, actueel):
+        spans = {}
+        tellers = {'uitvoercache_treffers' if (naam, sleutel) in cache else 'uitvoercache_missers': 1}
+
+        def stap(spannaam, functie, *args, **kwargs):
+            # Voor elke stap controleren of de rerun nog de laatste is
+            if not actueel():
+                raise VervallenWeergave(naam)
+            start = time.perf_counter()
+            try:
+                return functie(*args, **kwargs)
+            finally:
+                spans[spannaam] = spans.get(spannaam, 0.0) + time.perf_counter() - start
+        return cache.ophalen((naam, sleutel), lambda: maak(stap)), spans, tellers
+
+    def maak_figuren(stap):
+        duiker = Duiker(**invoer)
+        figuur = stap('plotly_figure', duiker.plotly_figure)
+        return figuur, stap('afvoerkromme_figuur', duiker.afvoerkromme_figuur)
+
+    def maak_tekening(stap):
+        return stap('visualisatie', renderer.render, 'JPEG', **invoer)
+    return {'tekening': lambda actueel: ophalen('tekening', maak_tekening, actueel),
+            'figuren': lambda actueel: ophalen('figuren', maak_figuren, actueel)}
+
+
+def duiker_uitvoer(invoer: dict, meting=None):
+    # (resultaat, figuur, afvoerkromme, tekening) voor een invoer uit
+    # invoer_sidebar, na elkaar in deze thread. Deelt de cache met de
+    # weergave via de RenderPool.
+    meting = meting or GeenMeting()
+    taken = weergave_taken(invoer)
+    resultaat = duiker_resultaat(invoer, meting)
+    (figuur, kromme), spans, tellers = taken['figuren'](lambda: True)
+    meting.voeg_toe(spans, tellers)
+    tekening, spans, tellers = taken['tekening'](lambda: True)
+    meting.voeg_toe(spans, tellers)
+    return resultaat, figuur, kromme, tekening
+
+
+def duiker_ontwerp(invoer: dict, debiet: float, opstuwing: float):
+    # Benodigde diameter voor het ontwerpdebiet bij de toegestane opstuwing
+    def maak():
+        ontwerp = DuikerArray.from_duikers([Duiker(**invoer)])
+        return float(benodigde_diameter(ontwerp, debiet, opstuwing=opstuwing)[0])
+    return gedeelde_uitvoercache().ophalen(('ontwerp', tuple(sorted(invoer.items())), debiet, opstuwing), maak)
+
+
+def duiker_gevoeligheid(invoer: dict, elasticiteit: bool = True):
+    # Elasticiteiten (of afgeleiden) van debiet, stroomsnelheid en ruwheid
+    # per invoerveld, als rijen voor een tabel
+    def maak():
+        return gevoeligheden(DuikerArray.from_duikers([Duiker(**invoer)])).tabel(0, elasticiteit)
+    return gedeelde_uitvoercache().ophalen(('gevoeligheid', tuple(sorted(invoer.items())), elasticiteit), maak)
+
+## Weergave op de achtergrond:
+# ===================================
+# De getallen komen direct op het scherm; de tekening (PIL codeert buiten
+# de GIL) en de Plotly-figuren worden ondertussen in een begrensde pool
+# gemaakt. Een nieuwe rerun van dezelfde sessie annuleert het werk van de
+# vorige rerun dat nog niet gestart is, zodat snel schuiven met de invoer
+# geen wachtrij opbouwt. Werk dat al loopt stopt bij zijn volgende stap met
+# VervallenWeergave en laat de cache ongemoeid.
+class VervallenWeergave(Exception):
+    # Een taak in de RenderPool is ingehaald door een nieuwere rerun
+    pass
+
+
+class RenderPool:
+    def __init__(self, werkers=2):
+        self.pool = ThreadPoolExecutor(max_workers=werkers, thread_name_prefix='duiker_weergave')
+        self.geannuleerd = 0
+        self._generatie = {}
+        self._lopend = {}
+        self._slot = threading.Lock()
+
+    def indienen(self, sessie, taken: dict):
+        # naam -> functie(actueel); geeft naam -> Future. Elke indiening
+        # verhoogt de generatie van de sessie: taken van een eerdere generatie
+        # die nog wachten worden geannuleerd, lopende taken stoppen bij hun
+        # volgende stap.
+        with self._slot:
+            generatie = self._generatie.get(sessie, 0) + 1
+            self._generatie[sessie] = generatie
+            for future in self._lopend.pop(sessie, ()):
+                if future.cancel():
+                    self.geannuleerd += 1
+            # Sessies waarvan alles klaar is hoeven niet onthouden te worden
+            for klaar in [naam for naam, lopend in self._lopend.items() if all(f.done() for f in lopend)]:
+                del self._lopend[klaar], self._generatie[klaar]
+
+            def actueel():
+                return self._generatie.get(sessie) == generatie
+            futures = {naam: self.pool.submit(self._uitvoeren, functie, actueel) for naam, functie in taken.items()}
+            self._lopend[sessie] = list(futures.values())
+        return futures
+
+    def _uitvoeren(self, functie, actueel):
+        try:
+            if not actueel():
+                raise VervallenWeergave()
+            return functie(actueel)
+        except VervallenWeergave:
+            with self._slot:
+                self.geannuleerd += 1
+            raise
+
+
+def render_sessie():
+    # Sleutel van de browsersessie voor de RenderPool; zonder `streamlit run`
+    # bewaart Streamlit niets en krijgt elke run een eigen sleutel
+    sessie = st.session_state.get('render_sessie')
+    if sessie is None:
+        sessie = os.urandom(8).hex()
+        st.session_state['render_sessie'] = sessie
+    return sessie
+
+
+## Meting (opt-in):
+# ===================================
+# Tijden per onderdeel van een rerun en tellers voor caches en verstuurde
+# afbeeldingsbytes. Aan met DUIKERTOOL_METING=1 of ?meting=1 in de url;
+# met DUIKERTOOL_METING_PAD=metingen.jsonl komt elke rerun als JSON-regel
+# in dat bestand. Uit kost de meting niets: GeenMeting doet niets.
+class RerunMeting:
+    def __init__(self):
+        self.tijdstip = time.time()
+        self.totaal = None
+        self.spans = {}
+        self.tellers = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, naam):
+        # Tijd [s] van een onderdeel; een naam die vaker voorkomt telt op
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[naam] = self.spans.get(naam, 0.0) + time.perf_counter() - start
+
+    def tel(self, naam, aantal=1):
+        self.tellers[naam] = self.tellers.get(naam, 0) + aantal
+
+    def voeg_toe(self, spans, tellers):
+        # Tijden en tellers die een taak buiten deze thread heeft gemeten
+        for naam, tijd in spans.items():
+            self.spans[naam] = self.spans.get(naam, 0.0) + tijd
+        for naam, aantal in tellers.items():
+            self.tel(naam, aantal)
+
+    @contextmanager
+    def volg_cache(self, naam, cache: LRUCache):
+        # Treffers en missers van een gedeelde cache tijdens dit blok (andere
+        # sessies die tegelijk rekenen tellen mee)
+        treffers, missers = cache.treffers, cache.missers
+        try:
+            yield
+        finally:
+            self.tel(f'{naam}_treffers', cache.treffers - treffers)
+            self.tel(f'{naam}_missers', cache.missers - missers)
+
+    def afsluiten(self):
+        self.totaal = time.perf_counter() - self._start
+
+    def als_dict(self):
+        return dict(tijdstip=time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.tijdstip)),
+                    totaal=self.totaal, spans=dict(self.spans), tellers=dict(self.tellers))
+
+
+class GeenMeting:
+    def span(self, naam):
+        return nullcontext()
+
+    def tel(self, naam, aantal=1):
+        pass
+
+    def voeg_toe(self, spans, tellers):
+        pass
+
+    def volg_cache(self, naam, cache):
+        return nullcontext()
+
+    def afsluiten(self):
+        pass
+
+
+class MetingLog:
+    # De laatste `maximum` reruns, en optioneel alle reruns als JSON-lines
+    # in een lokaal bestand
+    def __init__(self, maximum=20, pad=None):
+        self.metingen = deque(maxlen=maximum)
+        self.pad = pad
+        self._slot = threading.Lock()
+
+    def toevoegen(self, meting: RerunMeting):
+        regel = meting.als_dict()
+        with self._slot:
+            self.metingen.append(regel)
+            if self.pad:
+                with open(self.pad, 'a') as bestand:
+                    bestand.write(json.dumps(regel) + '\n')
+
+    def tabel(self):
+        # Eén rij per rerun, nieuwste boven, tijden in ms
+        rijen = []
+        for regel in reversed(self.metingen):
+            rij = {'tijdstip': regel['tijdstip'], 'totaal [ms]': round(regel['totaal'] * 1000, 2)}
+            rij.update({f'{naam} [ms]': round(tijd * 1000, 2) for naam, tijd in regel['spans'].items()})
+            rij.update(regel['tellers'])
+            rijen.append(rij)
+        return rijen
+
+    def jsonl(self):
+        return ''.join(json.dumps(regel) + '\n' for regel in self.metingen)
+
+
+def meting_aan():
+    if os.environ.get('DUIKERTOOL_METING', '0') not in ('', '0'):
+        return True
+    # Zonder `streamlit run` geeft Streamlit geen dict maar een lege tekst
+    parameters = st.experimental_get_query_params() or {}
+    return parameters.get('meting', ['0'])[0] not in ('', '0')
+
+
+def start_meting():
+    return RerunMeting() if meting_aan() else GeenMeting()
+
+
+_metinglog = None
+
+
+def sessie_metinglog():
+    # Eén log per browsersessie; zonder `streamlit run` één per proces
+    global _metinglog
+    log = st.session_state.get('metinglog')
+    if log is None:
+        log = _metinglog or MetingLog(pad=os.environ.get('DUIKERTOOL_METING_PAD') or None)
+        st.session_state['metinglog'] = log
+        _metinglog = log
+    return log
+
+
+def toon_meting(meting):
+    # Sluit de meting af en toont het debugpaneel met de laatste reruns
+    meting.afsluiten()
+    if not isinstance(meting, RerunMeting):
+        return
+    log = sessie_metinglog()
+    log.toevoegen(meting)
+    with st.expander(f'Meting (laatste {len(log.metingen)} reruns)'):
+        st.dataframe(log.tabel())
+        st.download_button('Download als JSON-lines', log.jsonl(), file_name='metingen.jsonl',
+                           mime='application/x-ndjson')
 
 ## Layout:
 # ===================================
-st.markdown("<h1 style='text-align: right; color: black; font-size:10px;'>Geproduceerd door: Niels van der Maaden</h1>", unsafe_allow_html=True)
-#st.markdown("<h1 style='text-align: right; color: black; font-size:10px;'>In samenwerking met: Harm Nomden</h1>", unsafe_allow_html=True)
-st.image(Image.open('WRIJ_Sweco.jpg'))
-st.markdown('##')
-st.title('Duiker tool')
-#st.markdown('##')
-
-with st.sidebar:
-    invoer = invoer_sidebar()
-    duiker = Duiker(**invoer)
+# Alleen bij `streamlit run DuikerTool.py` (dan is __name__ '__main__'); bij
+# een import blijven alleen de berekeningen over.
+if __name__ == '__main__':
+    meting = start_meting()
+    st.markdown("<h1 style='text-align: right; color: black; font-size:10px;'>Geproduceerd door: Niels van der Maaden</h1>", unsafe_allow_html=True)
+    #st.markdown("<h1 style='text-align: right; color: black; font-size:10px;'>In samenwerking met: Harm Nomden</h1>", unsafe_allow_html=True)
+    logo = lees_afbeelding('WRIJ_Sweco.jpg')
+    with meting.span('st.image'):
+        st.image(logo)
+    meting.tel('afbeelding_bytes', len(logo))
+    st.markdown('##')
+    st.title('Duiker tool')
+    #st.markdown('##')
+
+    with st.sidebar, meting.span('invoer_sidebar'):
+        invoer = invoer_sidebar()
+    with meting.span('duiker_resultaat'), meting.volg_cache('uitvoercache', gedeelde_uitvoercache()):
+        resultaat = duiker_resultaat(invoer, meting)
+    weergave = gedeelde_renderpool().indienen(render_sessie(), weergave_taken(invoer))
     
-## Output:
-# ===================================    
-with st.container():
-    st.image(Image.open(duiker_visualisatie(**invoer)))
-    st.plotly_chart(duiker.plotly_figure())
-    st.markdown("<h1 style='text-align: left; color: black; font-size:30px;'>Resultaten</h1>", unsafe_allow_html=True)
-    keuze_eenheid = st.selectbox(label='Eenheid', options = ['m3/h', 'm3/s', 'l/s'])
-    if keuze_eenheid == 'm3/h':
-        st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Debiet: {round(duiker.debiet * 60 * 60,3)} [m3/h]</h1>", unsafe_allow_html=True)
-        st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Stroomsnelheid: {round(duiker.stroomsnelheid *60 *60,2)} [m/h]</h1>", unsafe_allow_html=True)
-        st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Opstuwing: {round(duiker.opstuwing,2)} [m]</h1>", unsafe_allow_html=True)
-        st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Hydraulische ruwheid: {round(duiker.ruwheid,3)}</h1>", unsafe_allow_html=True)
-    elif keuze_eenheid == 'm3/s':
-        st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Debiet: {round(duiker.debiet,3)} [m3/s]</h1>", unsafe_allow_html=True)
-        st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Stroomsnelheid: {round(duiker.stroomsnelheid,2)} [m/s]</h1>", unsafe_allow_html=True)
-        st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Opstuwing: {round(duiker.opstuwing,2)} [m]</h1>", unsafe_allow_html=True)
-        st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Hydraulische ruwheid: {round(duiker.ruwheid,3)}</h1>", unsafe_allow_html=True)
-    elif keuze_eenheid == 'l/s':
-        st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Debiet: {round(duiker.debiet*1000,3)} [l/s]</h1>", unsafe_allow_html=True)
-        st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Stroomsnelheid: {round(duiker.stroomsnelheid,2)} [m/s]</h1>", unsafe_allow_html=True)
-        st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Opstuwing: {round(duiker.opstuwing,2)} [m]</h1>", unsafe_allow_html=True)
-        st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Hydraulische ruwheid: {round(duiker.ruwheid,3)}</h1>", unsafe_allow_html=True)
+    ## Output:
+    # ===================================    
+    with st.container():
+        # Plaatsen voor de tekening en figuren; die worden na de resultaten gevuld
+        plek_tekening, plek_figuur, plek_kromme = st.empty(), st.empty(), st.empty()
+        st.markdown("<h1 style='text-align: left; color: black; font-size:30px;'>Resultaten</h1>", unsafe_allow_html=True)
+        keuze_eenheid = st.selectbox(label='Eenheid', options = ['m3/h', 'm3/s', 'l/s'])
+        if keuze_eenheid == 'm3/h':
+            st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Debiet: {round(resultaat.debiet * 60 * 60,3)} [m3/h]</h1>", unsafe_allow_html=True)
+            st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Stroomsnelheid: {round(resultaat.stroomsnelheid *60 *60,2)} [m/h]</h1>", unsafe_allow_html=True)
+            st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Opstuwing: {round(resultaat.opstuwing,2)} [m]</h1>", unsafe_allow_html=True)
+            st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Hydraulische ruwheid: {round(resultaat.ruwheid,3)}</h1>", unsafe_allow_html=True)
+        elif keuze_eenheid == 'm3/s':
+            st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Debiet: {round(resultaat.debiet,3)} [m3/s]</h1>", unsafe_allow_html=True)
+            st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Stroomsnelheid: {round(resultaat.stroomsnelheid,2)} [m/s]</h1>", unsafe_allow_html=True)
+            st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Opstuwing: {round(resultaat.opstuwing,2)} [m]</h1>", unsafe_allow_html=True)
+            st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Hydraulische ruwheid: {round(resultaat.ruwheid,3)}</h1>", unsafe_allow_html=True)
+        elif keuze_eenheid == 'l/s':
+            st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Debiet: {round(resultaat.debiet*1000,3)} [l/s]</h1>", unsafe_allow_html=True)
+            st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Stroomsnelheid: {round(resultaat.stroomsnelheid,2)} [m/s]</h1>", unsafe_allow_html=True)
+            st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Opstuwing: {round(resultaat.opstuwing,2)} [m]</h1>", unsafe_allow_html=True)
+            st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Hydraulische ruwheid: {round(resultaat.ruwheid,3)}</h1>", unsafe_allow_html=True)
+        # Inverse berekening: welke diameter is nodig?
+        with st.expander('Benodigde diameter'):
+            ontwerp_debiet = st.number_input(label='Ontwerpdebiet [m3/s]',
+                                             format="%.3f",
+                                             value=0.100,
+                                             min_value=0.001)
+            toegestane_opstuwing_cm = st.number_input(label='Toegestane opstuwing [cm]',
+                                                      format="%.1f",
+                                                      step=1.00,
+                                                      value=5.00,
+                                                      min_value=0.10)
+            with meting.span('duiker_ontwerp'):
+                benodigd = duiker_ontwerp(invoer, ontwerp_debiet, toegestane_opstuwing_cm/100)
+            if np.isnan(benodigd):
+                st.markdown("<h1 style='text-align: left; color: black; font-size:20px;'>Benodigde diameter: geen oplossing tussen 0.10 en 10.00 [m]</h1>", unsafe_allow_html=True)
+            else:
+                st.markdown(f"<h1 style='text-align: left; color: black; font-size:20px;'>Benodigde diameter: {round(benodigd,3)} [m]</h1>", unsafe_allow_html=True)
+        # Gevoeligheid: welke invoer telt het zwaarst?
+        with st.expander('Gevoeligheid'):
+            if st.checkbox('Hulp', value=False, key='gevoeligheid'):
+                st.write('Elasticiteit: verandering van de uitkomst in % bij 1% meer invoer')
+                st.write('Afgeleide: verandering van de uitkomst per eenheid invoer')
+            keuze_gevoeligheid = st.selectbox('Weergave', options=('Elasticiteit', 'Afgeleide'), index=0)
+            with meting.span('duiker_gevoeligheid'):
+                gevoeligheid = duiker_gevoeligheid(invoer, keuze_gevoeligheid == 'Elasticiteit')
+            st.table([{naam: (round(waarde, 4) if isinstance(waarde, float) else waarde)
+                       for naam, waarde in rij.items()} for rij in gevoeligheid])
+
+    with meting.span('wachten_op_weergave'):
+        tekening, spans, tellers = weergave['tekening'].result()
+    meting.voeg_toe(spans, tellers)
+    with meting.span('st.image'):
+        plek_tekening.image(tekening)
+    meting.tel('afbeelding_bytes', len(tekening))
+    with meting.span('wachten_op_weergave'):
+        (figuur, kromme), spans, tellers = weergave['figuren'].result()
+    meting.voeg_toe(spans, tellers)
+    with meting.span('st.plotly_chart'):
+        plek_figuur.plotly_chart(figuur)
+        plek_kromme.plotly_chart(kromme)
+    toon_meting(meting)
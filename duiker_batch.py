@@ -0,0 +1,261 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from duiker_geometrie import PROFIELEN, profielcodes, profielhoogtes
+from duiker_gevoeligheid import GEVOELIGHEID_UITVOER, gevoeligheden
+from duiker_kern import DuikerArray
+
+## Duiker batch
+# =============================================================================
+# Rekent een registerexport (CSV of Parquet) blok voor blok door, zonder
+# Streamlit te starten. Per blok wordt alleen dat blok in het geheugen
+# gehouden; resultaten en afgekeurde rijen worden direct weggeschreven.
+#
+#   python duiker_batch.py register.csv resultaten.csv --afgekeurd fouten.csv
+#
+# Kolommen heten standaard zoals de velden van Duiker en kunnen worden
+# omgezet met --kolom veld=kolomnaam. Net als in invoer_sidebar kan de
+# sliblaag als percentage T.O.V. duiker (kolom sliblaag_pct, 0-100; het
+# veld sliblaag_procent is een fractie 0-1) of in cm worden opgegeven en het
+# verval in cm of als werkelijke hoogte in +mNAP. Zonder kolom 'profiel' is
+# elke duiker rond; met de kolommen 'profiel' (rond, rechthoek, eivorm of
+# ellips) en 'hoogte' [m] is diameter de breedte. Een lege hoogte geeft de
+# standaardhoogte van het profiel. Met --gevoeligheid debiet komt er per
+# invoerveld een kolom elasticiteit_debiet_<veld> bij.
+
+RESULTAATKOLOMMEN = ('sliblaag', 'nat_opp_duiker', 'ruwheid', 'opstuwing', 'debiet', 'stroomsnelheid')
+
+# Invoerkolommen per keuze; de vaste velden gelden altijd
+VASTE_VELDEN = ('diameter', 'lengte', 'intreedweerstand', 'uittreedweerstand',
+                'ben_str_nat_opp', 'manning')
+SLIBLAAG_VELDEN = {'percentage': ('sliblaag_pct',),
+                   'cm': ('sliblaag_cm',)}
+VERVAL_VELDEN = {'cm': ('verval',),
+                 'nap': ('bovenwaterstand', 'benedenwaterstand')}
+# Optionele kolommen; ontbreken ze, dan is de duiker rond
+PROFIEL_VELDEN = ('profiel', 'hoogte')
+
+
+## Lezen en schrijven:
+# ===================================
+def lees_blokken(pad, blokgrootte):
+    if pad.lower().endswith('.parquet'):
+        import pyarrow.parquet as pq
+        bestand = pq.ParquetFile(pad)
+        for batch in bestand.iter_batches(batch_size=blokgrootte):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(pad, chunksize=blokgrootte, low_memory=False)
+
+
+class BlokSchrijver:
+    # Schrijft blokken achter elkaar weg naar CSV of Parquet. Het bestand
+    # wordt pas bij het eerste blok aangemaakt.
+    def __init__(self, pad):
+        self.pad = pad
+        self.parquet = pad.lower().endswith('.parquet')
+        self._schrijver = None
+        self._schema = None
+        self._gestart = False
+
+    def schrijf(self, blok):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            tabel = pa.Table.from_pandas(blok, schema=self._schema, preserve_index=False)
+            if self._schrijver is None:
+                self._schema = tabel.schema
+                self._schrijver = pq.ParquetWriter(self.pad, self._schema)
+            self._schrijver.write_table(tabel)
+        else:
+            blok.to_csv(self.pad, mode='a' if self._gestart else 'w', header=not self._gestart, index=False)
+        self._gestart = True
+
+    def sluit(self):
+        if self._schrijver is not None:
+            self._schrijver.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.sluit()
+
+
+## Berekening per blok:
+# ===================================
+def _kolom(blok, kolommen, veld):
+    naam = kolommen.get(veld, veld)
+    if naam not in blok.columns:
+        raise KeyError(f"kolom '{naam}' voor veld '{veld}' ontbreekt in de invoer")
+    return pd.to_numeric(blok[naam], errors='coerce').to_numpy(dtype=float)
+
+
+def invoerkolommen(kolommen=None, keuze_sliblaag='percentage', keuze_verval='cm'):
+    # Namen van de kolommen die voor de gekozen invoer worden gelezen
+    kolommen = kolommen or {}
+    if keuze_sliblaag not in SLIBLAAG_VELDEN:
+        raise ValueError(f'onbekende keuze voor sliblaag: {keuze_sliblaag}')
+    if keuze_verval not in VERVAL_VELDEN:
+        raise ValueError(f'onbekende keuze voor verval: {keuze_verval}')
+    velden = VASTE_VELDEN + SLIBLAAG_VELDEN[keuze_sliblaag] + VERVAL_VELDEN[keuze_verval]
+    return [kolommen.get(veld, veld) for veld in velden]
+
+
+def _profielkolommen(blok, kolommen):
+    # (profielcodes, hoogte) van het blok; zonder kolom 'profiel' rond. Een
+    # onbekende naam wordt geen fout voor het hele blok maar een afgekeurde rij
+    if kolommen.get('profiel', 'profiel') not in blok.columns:
+        return np.zeros(len(blok), dtype=np.int8), np.full(len(blok), np.nan)
+    namen = blok[kolommen.get('profiel', 'profiel')].fillna('rond').astype(str).str.strip().str.lower()
+    codes = profielcodes(namen.to_numpy(), streng=False)
+    if kolommen.get('hoogte', 'hoogte') in blok.columns:
+        return codes, _kolom(blok, kolommen, 'hoogte')
+    return codes, np.full(len(blok), np.nan)
+
+
+def duikers_uit_blok(blok, kolommen=None, keuze_sliblaag='percentage', keuze_verval='cm'):
+    # Zet een blok registerrijen om naar een DuikerArray
+    kolommen = kolommen or {}
+    velden = {veld: _kolom(blok, kolommen, veld) for veld in VASTE_VELDEN}
+    velden['profiel'], velden['hoogte'] = _profielkolommen(blok, kolommen)
+    if keuze_sliblaag == 'percentage':
+        velden['sliblaag_procent'] = _kolom(blok, kolommen, 'sliblaag_pct')/100
+    elif keuze_sliblaag == 'cm':
+        hoogte = profielhoogtes(velden['profiel'], velden['diameter'], velden['hoogte'])
+        velden['sliblaag_procent'] = (_kolom(blok, kolommen, 'sliblaag_cm')/100)/hoogte
+    else:
+        raise ValueError(f'onbekende keuze voor sliblaag: {keuze_sliblaag}')
+    if keuze_verval == 'cm':
+        velden['bovenwaterstand'] = _kolom(blok, kolommen, 'verval')/100
+        velden['benedenwaterstand'] = np.zeros(len(blok))
+    elif keuze_verval == 'nap':
+        velden['bovenwaterstand'] = _kolom(blok, kolommen, 'bovenwaterstand')
+        velden['benedenwaterstand'] = _kolom(blok, kolommen, 'benedenwaterstand')
+    else:
+        raise ValueError(f'onbekende keuze voor verval: {keuze_verval}')
+    return DuikerArray(**velden)
+
+
+def _foutmeldingen(duikers, debiet):
+    invoer = np.column_stack([getattr(duikers, naam) for naam in DuikerArray.velden])
+    condities = [~np.isfinite(invoer).all(axis=1),
+                 (duikers.profiel < 0) | (duikers.profiel >= len(PROFIELEN)),
+                 duikers.diameter <= 0,
+                 (duikers.sliblaag_procent < 0) | (duikers.sliblaag_procent > 1),
+                 duikers.opstuwing < 0,
+                 ~np.isfinite(debiet)]
+    meldingen = ['ontbrekende of niet-numerieke invoer',
+                 'onbekend profiel',
+                 'diameter moet groter dan 0 zijn',
+                 'sliblaag buiten 0-100% van de hoogte',
+                 'negatief verval',
+                 'debiet niet te berekenen']
+    return np.select(condities, meldingen, default='')
+
+
+def bereken_blok(blok, kolommen=None, keuze_sliblaag='percentage', keuze_verval='cm', gevoeligheid=()):
+    # Geeft (resultaten, afgekeurd) terug; afgekeurde rijen krijgen een kolom
+    # 'fout'. gevoeligheid: uitkomsten (uit GEVOELIGHEID_UITVOER) waarvoor de
+    # elasticiteiten naar elk invoerveld worden toegevoegd.
+    duikers = duikers_uit_blok(blok, kolommen, keuze_sliblaag, keuze_verval)
+    with np.errstate(all='ignore'):
+        resultaten = {'sliblaag': duikers.sliblaag,
+                      'nat_opp_duiker': duikers.nat_opp_duiker,
+                      'ruwheid': duikers.ruwheid,
+                      'opstuwing': duikers.opstuwing,
+                      'debiet': duikers.debiet}
+        resultaten['stroomsnelheid'] = np.where(resultaten['nat_opp_duiker'] > 0,
+                                                resultaten['debiet']/resultaten['nat_opp_duiker'], 0.0)
+    fouten = _foutmeldingen(duikers, resultaten['debiet'])
+    goed = fouten == ''
+    # Goedgekeurde invoer numeriek wegschrijven, zodat elk blok hetzelfde schema heeft
+    uitvoer = blok.loc[goed]
+    gelezen = invoerkolommen(kolommen, keuze_sliblaag, keuze_verval)
+    uitvoer = uitvoer.assign(**{naam: pd.to_numeric(uitvoer[naam]).astype(float) for naam in gelezen})
+    uitvoer = uitvoer.assign(**{naam: resultaten[naam][goed] for naam in RESULTAATKOLOMMEN})
+    if gevoeligheid:
+        elasticiteiten = gevoeligheden(duikers).kolommen(gevoeligheid)
+        uitvoer = uitvoer.assign(**{naam: kolom[goed] for naam, kolom in elasticiteiten.items()})
+    afgekeurd = blok.loc[~goed].assign(fout=fouten[~goed])
+    return uitvoer, afgekeurd
+
+
+## Batch:
+# ===================================
+def verwerk(invoer, uitvoer, afgekeurd=None, blokgrootte=100_000, kolommen=None,
+            keuze_sliblaag='percentage', keuze_verval='cm', meld=None, gevoeligheid=()):
+    # Verwerkt het hele bestand en geeft de tellingen terug
+    if afgekeurd is None:
+        basis, _ = os.path.splitext(uitvoer)
+        afgekeurd = f'{basis}_afgekeurd.csv'
+    aantal = aantal_afgekeurd = 0
+    start = time.perf_counter()
+    with BlokSchrijver(uitvoer) as goed_schrijver, BlokSchrijver(afgekeurd) as fout_schrijver:
+        for blok in lees_blokken(invoer, blokgrootte):
+            goed, fout = bereken_blok(blok, kolommen, keuze_sliblaag, keuze_verval, gevoeligheid)
+            if len(goed):
+                goed_schrijver.schrijf(goed)
+            if len(fout):
+                fout_schrijver.schrijf(fout)
+            aantal += len(blok)
+            aantal_afgekeurd += len(fout)
+            if meld is not None:
+                duur = time.perf_counter() - start
+                meld(f'{aantal} rijen, {aantal_afgekeurd} afgekeurd, {aantal/max(duur, 1e-9):,.0f} rijen/s')
+    duur = time.perf_counter() - start
+    return dict(rijen=aantal,
+                afgekeurd=aantal_afgekeurd,
+                seconden=duur,
+                rijen_per_seconde=aantal/max(duur, 1e-9),
+                afgekeurd_bestand=afgekeurd)
+
+
+def _kolom_paar(tekst):
+    veld, teken, naam = tekst.partition('=')
+    if not teken or not veld or not naam:
+        raise argparse.ArgumentTypeError(f"verwacht veld=kolomnaam, kreeg '{tekst}'")
+    return veld, naam
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Duiker tool: debiet en stroomsnelheid voor een heel register.')
+    parser.add_argument('invoer', help='CSV- of Parquet-bestand met een rij per duiker')
+    parser.add_argument('uitvoer', help='CSV- of Parquet-bestand voor de resultaten')
+    parser.add_argument('--afgekeurd', help='CSV-bestand voor afgekeurde rijen (standaard <uitvoer>_afgekeurd.csv)')
+    parser.add_argument('--blokgrootte', type=int, default=100_000, help='aantal rijen per blok')
+    parser.add_argument('--sliblaag', choices=('percentage', 'cm'), default='percentage',
+                        help="sliblaag als percentage T.O.V. duiker (kolom 'sliblaag_pct', 0-100) "
+                             "of in cm (kolom 'sliblaag_cm')")
+    parser.add_argument('--verval', choices=('cm', 'nap'), default='cm',
+                        help="verval in cm (kolom 'verval') of werkelijke hoogte in +mNAP "
+                             "(kolommen 'bovenwaterstand' en 'benedenwaterstand')")
+    parser.add_argument('--kolom', type=_kolom_paar, action='append', default=[], metavar='VELD=KOLOM',
+                        help='andere kolomnaam voor een veld, mag vaker worden opgegeven')
+    parser.add_argument('--gevoeligheid', choices=GEVOELIGHEID_UITVOER, action='append', default=[],
+                        help='elasticiteiten van deze uitkomst naar elk invoerveld toevoegen, mag vaker')
+    parser.add_argument('--stil', action='store_true', help='geen voortgang per blok tonen')
+    args = parser.parse_args(argv)
+
+    meld = None if args.stil else (lambda tekst: print(tekst, file=sys.stderr))
+    try:
+        telling = verwerk(args.invoer, args.uitvoer, args.afgekeurd, args.blokgrootte, dict(args.kolom),
+                          args.sliblaag, args.verval, meld, tuple(args.gevoeligheid))
+    except (OSError, KeyError, ValueError) as fout:
+        print(f'fout: {fout}', file=sys.stderr)
+        return 1
+    samenvatting = (f"{telling['rijen']} rijen in {telling['seconden']:.2f} s "
+                    f"({telling['rijen_per_seconde']:,.0f} rijen/s), {telling['afgekeurd']} afgekeurd")
+    if telling['afgekeurd']:
+        samenvatting += f" -> {telling['afgekeurd_bestand']}"
+    print(samenvatting, file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,428 @@
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import platform
+import runpy
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+
+import DuikerTool as dt
+from duiker_berging import VERVAL_LINEAIR, routeer, synthetisch_hydrogram
+from duiker_catalogus import selecteer, synthetische_catalogus, synthetische_locaties
+from duiker_gevoeligheid import GEVOELIGHEID_INVOER, gevoeligheden
+from duiker_kern import synthetisch_register
+from duiker_ruimte import synthetisch_register as ruimtelijk_register
+from duiker_scenario import SCENARIO_RESULTATEN, ScenarioRekenaar, standaard_scenarios
+
+## Duiker benchmark
+# =============================================================================
+# Meet de snelle paden van de tool, controleert dat ze dezelfde getallen
+# geven als de scalaire Duiker-properties en vergelijkt de tijden met de
+# eerdere runs in een JSON-lines-geschiedenis.
+#
+#   python duiker_benchmark.py                      # meten, vergelijken, opslaan
+#   python duiker_benchmark.py --max-grootte 1e5    # snelle run
+#   python duiker_benchmark.py --drempel 0.5 --alleen bulk
+#
+# Een pad is een regressie als het meer dan de drempel (standaard 25%)
+# trager is dan de mediaan van de laatste --basis runs op dezelfde machine.
+# Daarnaast moet `import duiker_kern` binnen IMPORT_BUDGET blijven. Bij een
+# regressie, een afwijkende gouden waarde of een overschreden budget is de
+# exitcode 1.
+
+STANDAARD_INVOER = dict(diameter=0.5, lengte=21.0, sliblaag_cm=5, sliblaag_procent=0.1,
+                        intreedweerstand=0.4, uittreedweerstand=1.0, ben_str_nat_opp=5.0,
+                        manning=75, verval=0.05, bovenwaterstand=0.05, benedenwaterstand=0,
+                        keuze_sliblaag='percentage T.O.V. duiker', keuze_verval='Verval')
+STANDAARD_DUIKER = {veld: STANDAARD_INVOER[veld] for veld in dt.DuikerArray.velden}
+
+# Gouden waarden voor STANDAARD_DUIKER (Duiker-properties, profieltabel met
+# pi en de echte natte omtrek)
+GOUDEN_WAARDEN = dict(sliblaag=0.010218826105873987,
+                      ruwheid=0.6247212008772843,
+                      opstuwing=0.05,
+                      debiet=0.11516984792640403,
+                      stroomsnelheid=0.6187578878914359)
+
+# Toegestane fout van de ronde profieltabel t.o.v. de exacte cirkelformules,
+# als fractie van het volle oppervlak en de volle omtrek
+GEOMETRIE_RTOL = 1e-6
+
+# Budget voor `import duiker_kern` in een nieuwe interpreter: tijd [s],
+# extra geheugen [MB] en modules die niet mee mogen komen
+IMPORT_BUDGET = dict(seconden=0.5, megabyte=64,
+                     verboden=('streamlit', 'plotly', 'PIL', 'pydantic', 'pandas', 'scipy'))
+
+# Drempel per pad; paden die hier niet staan gebruiken --drempel
+DREMPELS = {'app_rerun': 0.50,
+            'import_kern': 0.50,
+            'visualisatie_koud': 0.50}
+
+
+## Meten:
+# ===================================
+def meet(functie, herhalingen=5, minimaal=0.05):
+    # Beste tijd per aanroep [s] over een aantal herhalingen van elk
+    # ten minste `minimaal` seconden
+    aantal = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(aantal):
+            functie()
+        duur = time.perf_counter() - start
+        if duur >= minimaal or aantal >= 1_000_000:
+            break
+        aantal *= 10
+    tijden = [duur/aantal]
+    for _ in range(herhalingen - 1):
+        start = time.perf_counter()
+        for _ in range(aantal):
+            functie()
+        tijden.append((time.perf_counter() - start)/aantal)
+    return min(tijden)
+
+
+@contextlib.contextmanager
+def _stil():
+    # Streamlit waarschuwt buiten `streamlit run` bij elke aanroep
+    niveau = logging.root.manager.disable
+    logging.disable(logging.WARNING)
+    with warnings.catch_warnings(), contextlib.redirect_stderr(io.StringIO()):
+        warnings.simplefilter('ignore')
+        try:
+            yield
+        finally:
+            logging.disable(niveau)
+
+
+def _app_rerun():
+    with _stil():
+        runpy.run_path(dt.__file__, run_name='__main__')
+
+
+## Paden:
+# ===================================
+# Per groep een functie die de invoer opbouwt en de paden geeft als
+# naam -> (groep, functie, eenheden per aanroep); alleen de gekozen groepen
+# worden opgebouwd
+def _scalaire_paden(max_grootte):
+    def scalair():
+        d = dt.Duiker(**STANDAARD_DUIKER)
+        return d.debiet, d.stroomsnelheid, d.opstuwing, d.ruwheid
+
+    return {'scalair_duiker': ('scalair', scalair, 1),
+            'scalair_kern': ('scalair', lambda: dt.DuikerKern(**STANDAARD_DUIKER).bereken(), 1),
+            'scalair_bereken_duiker': ('scalair', lambda: dt.bereken_duiker(**STANDAARD_DUIKER), 1)}
+
+
+def _bulk_paden(max_grootte):
+    resultaat = {}
+    grootte = 1_000
+    while grootte <= max_grootte:
+        register = synthetisch_register(grootte)
+        resultaat[f'bulk_{grootte:.0e}'] = ('bulk', lambda r=register: r.stroomsnelheid, grootte)
+        grootte *= 10
+    register = synthetisch_register(min(100_000, int(max_grootte)))
+    resultaat['gevoeligheid_1e+05'] = ('bulk', lambda: gevoeligheden(register), len(register))
+    rekenaar = ScenarioRekenaar(register)
+    verval = {'bovenwaterstand': register.bovenwaterstand + 0.1}
+    resultaat['scenario_verval_1e+05'] = ('bulk', lambda: rekenaar.bereken(verval), len(register))
+    ruimte = ruimtelijk_register(min(1_000_000, int(max_grootte)))
+    resultaat['ruimte_rechthoek_1km'] = ('bulk', lambda: ruimte.rechthoek(20_000, 20_000, 21_000, 21_000).debiet,
+                                         len(ruimte.index.rechthoek(20_000, 20_000, 21_000, 21_000)))
+    resultaat['ruimte_dichtstbij_10'] = ('bulk', lambda: ruimte.dichtstbij(25_000, 25_000, 10).debiet, 10)
+    catalogus, locaties = synthetische_catalogus(), synthetische_locaties(min(100_000, int(max_grootte)))
+    resultaat['catalogus_1e+05x200'] = ('bulk', lambda: selecteer(catalogus, **locaties), len(locaties['debiet']))
+    vakken = synthetisch_register(min(10_000, int(max_grootte))).vervang(bovenwaterstand=0.0, benedenwaterstand=0.0)
+    instroom, oppervlak = synthetisch_hydrogram(len(vakken))
+    resultaat['berging_1e+04x48u'] = ('bulk', lambda: routeer(vakken, oppervlak, instroom, 600.0,
+                                                              oppervlak_helling=500.0), len(vakken))
+    return resultaat
+
+
+def _visualisatie_paden(max_grootte):
+    renderer = dt.DuikerRenderer()
+    volgnummer = iter(range(10**9))
+    return {'visualisatie_koud': ('visualisatie', lambda: dt.DuikerRenderer().render('PNG', **STANDAARD_INVOER), 1),
+            'visualisatie_nieuw_label': ('visualisatie', lambda: renderer.render(
+                'JPEG', **dict(STANDAARD_INVOER, lengte=float(next(volgnummer)))), 1),
+            'visualisatie_cache': ('visualisatie', lambda: renderer.render('JPEG', **STANDAARD_INVOER), 1),
+            'duiker_visualisatie': ('visualisatie', lambda: dt.duiker_visualisatie(**STANDAARD_INVOER), 1)}
+
+
+def _figuur_paden(max_grootte):
+    return {'plotly_figure': ('figuur', dt.Duiker(**STANDAARD_DUIKER).plotly_figure, 1)}
+
+
+def _app_paden(max_grootte):
+    return {'app_rerun': ('app', _app_rerun, 1)}
+
+
+GROEPEN = {'scalair': _scalaire_paden,
+           'bulk': _bulk_paden,
+           'visualisatie': _visualisatie_paden,
+           'figuur': _figuur_paden,
+           'app': _app_paden}
+
+
+def paden(max_grootte, groepen=None):
+    # Alle paden, of alleen die van de gekozen groepen
+    onbekend = set(groepen or ()) - set(GROEPEN)
+    if onbekend:
+        raise ValueError(f"onbekende groepen: {', '.join(sorted(onbekend))}")
+    resultaat = {}
+    for groep, opbouwen in GROEPEN.items():
+        if not groepen or groep in groepen:
+            resultaat.update(opbouwen(max_grootte))
+    return resultaat
+
+
+## Gouden waarden:
+# ===================================
+def controleer_gouden_waarden(grootte=10_000, rtol=1e-12):
+    # Geeft een lijst met afwijkingen; leeg betekent alles in orde
+    afwijkingen = []
+    duiker = dt.Duiker(**STANDAARD_DUIKER)
+    kern = dt.DuikerKern(**STANDAARD_DUIKER).bereken()
+    rij = dt.DuikerArray(**STANDAARD_DUIKER)
+    for naam, verwacht in GOUDEN_WAARDEN.items():
+        for bron, waarde in (('Duiker', getattr(duiker, naam)),
+                             ('DuikerKern', getattr(kern, naam)),
+                             ('DuikerArray', float(getattr(rij, naam)[0]))):
+            if not np.isclose(waarde, verwacht, rtol=rtol, atol=0):
+                afwijkingen.append(f'{bron}.{naam}: {waarde!r} in plaats van {verwacht!r}')
+
+    # Bulk en afvoerkromme tegen de scalaire properties
+    register = synthetisch_register(grootte, seed=1)
+    steekproef = np.random.default_rng(2).choice(grootte, size=min(grootte, 200), replace=False)
+    kromme = dt.Afvoerkromme(register)
+    for i in steekproef.tolist():
+        velden = {veld: float(getattr(register, veld)[i]) for veld in dt.DuikerArray.velden}
+        scalair = dt.Duiker(**velden)
+        for naam in GOUDEN_WAARDEN:
+            if not np.isclose(getattr(register, naam)[i], getattr(scalair, naam), rtol=rtol, atol=1e-15):
+                afwijkingen.append(f'DuikerArray.{naam}[{i}] wijkt af van Duiker')
+        if not np.isclose(kromme.debiet(register.opstuwing[i:i + 1], duiker=[i])[0], scalair.debiet, rtol=rtol):
+            afwijkingen.append(f'Afvoerkromme.debiet[{i}] wijkt af van Duiker')
+
+    # Andere profielen: scalair en gevectoriseerd moeten gelijk zijn
+    for profiel, hoogte in (('rechthoek', 0.8), ('eivorm', None), ('ellips', 0.3)):
+        scalair = dt.Duiker(**STANDAARD_DUIKER, profiel=profiel, hoogte=hoogte)
+        rij = dt.DuikerArray.from_duikers([scalair])
+        for naam in GOUDEN_WAARDEN:
+            if not np.isclose(getattr(rij, naam)[0], getattr(scalair, naam), rtol=rtol, atol=1e-15):
+                afwijkingen.append(f'DuikerArray.{naam} ({profiel}) wijkt af van Duiker')
+
+    # Afgeleiden tegen centrale differenties van DuikerArray (de geometrie
+    # telt niet mee: differenties van de tabel zijn daar zelf de ruis; bij
+    # een verval rond 0 is de wortel te steil voor een differentie)
+    gevoeligheid = gevoeligheden(register)
+    verval = register.opstuwing > 1e-3
+    for invoer in GEVOELIGHEID_INVOER:
+        if invoer in ('diameter', 'hoogte', 'sliblaag_procent'):
+            continue
+        kolom = getattr(register, invoer)
+        stap = 1e-6 * np.maximum(np.abs(kolom), 1.0)
+        hoger, lager = register.vervang(**{invoer: kolom + stap}), register.vervang(**{invoer: kolom - stap})
+        for uitvoer, afgeleiden in gevoeligheid.afgeleiden.items():
+            differentie = (getattr(hoger, uitvoer) - getattr(lager, uitvoer))/(2.0 * stap)
+            if not np.allclose(afgeleiden[invoer][verval], differentie[verval], rtol=1e-5, atol=1e-9):
+                afwijkingen.append(f'gevoeligheden: d{uitvoer}/d{invoer} wijkt af van de differentie')
+
+    # Incrementele scenario's tegen alles opnieuw rekenen
+    rekenaar = ScenarioRekenaar(register)
+    for i, scenario in enumerate(standaard_scenarios(register, 6)):
+        uitkomst, opnieuw = rekenaar.bereken(scenario), register.vervang(**scenario)
+        for naam in SCENARIO_RESULTATEN:
+            if not np.array_equal(getattr(uitkomst, naam), getattr(opnieuw, naam), equal_nan=True):
+                afwijkingen.append(f'ScenarioRekenaar.{naam} (scenario {i}) wijkt af van DuikerArray')
+
+    # Ruimtelijke index tegen alle duikers doorlopen
+    ruimte = ruimtelijk_register(grootte, breedte=1_000.0, seed=1)
+    for xmin, ymin, xmax, ymax in ((100.0, 200.0, 300.0, 250.0), (-50.0, -50.0, 20.0, 1_100.0)):
+        binnen = np.flatnonzero((ruimte.x >= xmin) & (ruimte.x <= xmax) & (ruimte.y >= ymin) & (ruimte.y <= ymax))
+        if not np.array_equal(ruimte.rechthoek(xmin, ymin, xmax, ymax).rijen, binnen):
+            afwijkingen.append(f'RuimtelijkRegister.rechthoek({xmin}, {ymin}, {xmax}, {ymax}) mist duikers')
+    afstand = np.hypot(ruimte.x - 500.0, ruimte.y - 500.0)
+    if not np.array_equal(ruimte.dichtstbij(500.0, 500.0, 25).rijen, np.argsort(afstand, kind='stable')[:25]):
+        afwijkingen.append('RuimtelijkRegister.dichtstbij wijkt af van alle afstanden sorteren')
+    uitsnede = ruimte.straal(500.0, 500.0, 100.0)
+    if not np.array_equal(uitsnede.debiet, ruimte.duikers.debiet[uitsnede.rijen], equal_nan=True):
+        afwijkingen.append('RuimtelijkRegister: debiet van de uitsnede wijkt af van DuikerArray')
+
+    # Catalogusselectie: binair zoeken moet dezelfde keuzes geven als alle
+    # buizen doorrekenen, en de keuze moet aan de norm voldoen
+    catalogus, locaties = synthetische_catalogus(), synthetische_locaties(2_000, seed=1)
+    gezocht, alles = selecteer(catalogus, **locaties), selecteer(catalogus, **locaties, methode='alles')
+    for naam in ('keuze', 'tweede'):
+        if not np.array_equal(getattr(gezocht, naam), getattr(alles, naam)):
+            afwijkingen.append(f'selecteer: {naam} bij zoeken wijkt af van alles doorrekenen')
+    if (gezocht.opstuwing > locaties['max_opstuwing'] * (1 + 1e-9)).any():
+        afwijkingen.append('selecteer: gekozen buis voldoet niet aan de norm')
+
+    # Berging: leeglopen zonder instroom tegen de exacte oplossing
+    # wortel(h - h_beneden) = wortel(h0 - h_beneden) - C/(2A) t, en bij
+    # constante instroom I naar het evenwicht h_beneden + (I/C)**2 (boven het
+    # lineaire stuk van de afvoerkromme, en waar de tijdconstante kort is)
+    vakken = register.deel(np.arange(200)).vervang(benedenwaterstand=0.0)
+    vakken = vakken.vervang(bovenwaterstand=np.random.default_rng(3).uniform(0.05, 0.5, len(vakken)))
+    coefficient = dt.Afvoerkromme(vakken).coefficient
+    routering = routeer(vakken, 2_000.0, np.zeros(2), 6 * 3600.0, uitvoerstap=600.0)
+    wortel = np.sqrt(vakken.bovenwaterstand)[:, None] - coefficient[:, None]/4_000.0 * routering.tijd
+    exact = np.maximum(wortel, 0.0)**2
+    binnen = exact > 10 * VERVAL_LINEAIR
+    if not np.allclose(routering.peil[binnen], exact[binnen], rtol=0, atol=2e-3):
+        afwijkingen.append('routeer: leeglopen wijkt af van de exacte oplossing')
+    routering = routeer(vakken, 200.0, np.full(2, 0.3), 48 * 3600.0)
+    evenwicht = (0.3/coefficient)**2
+    binnen = (evenwicht > 10 * VERVAL_LINEAIR) & (400.0 * np.sqrt(evenwicht)/coefficient < 3 * 3600.0)
+    if not binnen.any() or not np.allclose(routering.peil[binnen, -1], evenwicht[binnen], rtol=1e-4):
+        afwijkingen.append('routeer: evenwicht bij constante instroom wijkt af van (I/C)**2')
+
+    # Ronde profieltabel tegen de exacte cirkel (straal 1)
+    fractie = np.linspace(0.0, 0.999, 1000)
+    d = 1.0 - 2.0 * fractie
+    hoek = np.arccos(d)
+    exact_opp = math.pi - (hoek - d * np.sqrt(1.0 - d**2))
+    exact_omtrek = 2.0 * (math.pi - hoek) + 2.0 * np.sqrt(1.0 - d**2)
+    _, nat_opp, natte_omtrek = dt.DuikerArray(2.0, 1.0, fractie, 0.4, 1.0, 5.0, 75.0, 0.05, 0.0).doorsnede
+    for naam, waarde, exact in (('nat_opp_duiker', nat_opp, exact_opp), ('natte_omtrek', natte_omtrek, exact_omtrek)):
+        fout = float(np.max(np.abs(waarde - exact)/exact[0]))
+        if fout > GEOMETRIE_RTOL:
+            afwijkingen.append(f'profieltabel rond: {naam} wijkt {fout:.1e} af van de cirkel')
+    return afwijkingen
+
+
+## Importbudget:
+# ===================================
+_IMPORT_METING = '''
+import json, os, sys, time
+
+def rss():
+    # Huidig geheugen [MB]; ru_maxrss is na fork/exec de piek van de ouder
+    with open('/proc/self/statm') as bestand:
+        return int(bestand.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')/2**20
+
+voor = rss()
+start = time.perf_counter()
+import duiker_kern
+print(json.dumps(dict(seconden=time.perf_counter() - start, megabyte=rss() - voor, modules=sorted(sys.modules))))
+'''
+
+
+def meet_import(herhalingen=3):
+    # Beste importtijd en geheugen van de kern, elke keer in een nieuw proces
+    map_ = os.path.dirname(os.path.abspath(__file__))
+    metingen = [json.loads(subprocess.run([sys.executable, '-c', _IMPORT_METING], capture_output=True,
+                                          text=True, cwd=map_, check=True).stdout)
+                for _ in range(herhalingen)]
+    return dict(seconden=min(m['seconden'] for m in metingen),
+                megabyte=min(m['megabyte'] for m in metingen),
+                modules=metingen[0]['modules'])
+
+
+def controleer_importbudget(meting):
+    overschrijdingen = []
+    for grootheid in ('seconden', 'megabyte'):
+        if meting[grootheid] > IMPORT_BUDGET[grootheid]:
+            overschrijdingen.append(f'{grootheid}: {meting[grootheid]:.3f} boven {IMPORT_BUDGET[grootheid]}')
+    geladen = sorted({m.split('.')[0] for m in meting['modules']} & set(IMPORT_BUDGET['verboden']))
+    if geladen:
+        overschrijdingen.append(f"laadt {', '.join(geladen)}")
+    return overschrijdingen
+
+
+## Geschiedenis:
+# ===================================
+def _git_versie():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def lees_geschiedenis(pad):
+    if not os.path.exists(pad):
+        return []
+    with open(pad) as bestand:
+        return [json.loads(regel) for regel in bestand if regel.strip()]
+
+
+def vergelijk(tijden, geschiedenis, drempel, basis=5):
+    # Regressies ten opzichte van de mediaan van de laatste `basis` runs op
+    # dezelfde machine: naam -> (huidig, referentie, toename)
+    machine = platform.node()
+    eerder = [run for run in geschiedenis if run.get('machine') == machine][-basis:]
+    regressies = {}
+    for naam, huidig in tijden.items():
+        referenties = [run['tijden'][naam] for run in eerder if naam in run['tijden']]
+        if not referenties:
+            continue
+        referentie = statistics.median(referenties)
+        toename = huidig/referentie - 1
+        if toename > DREMPELS.get(naam, drempel):
+            regressies[naam] = (huidig, referentie, toename)
+    return regressies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Duiker tool: benchmarks met regressiedrempels.')
+    parser.add_argument('--geschiedenis', default='benchmark_geschiedenis.jsonl', help='JSON-lines-bestand met eerdere runs')
+    parser.add_argument('--drempel', type=float, default=0.25, help='toegestane vertraging (0.25 = 25%%)')
+    parser.add_argument('--basis', type=int, default=5, help='aantal eerdere runs voor de referentie')
+    parser.add_argument('--max-grootte', type=float, default=1e7, help='grootste synthetische register')
+    parser.add_argument('--alleen', action='append', default=[], choices=tuple(GROEPEN),
+                        help='alleen deze groep(en) meten')
+    parser.add_argument('--niet-opslaan', action='store_true', help='resultaat niet aan de geschiedenis toevoegen')
+    args = parser.parse_args(argv)
+
+    afwijkingen = controleer_gouden_waarden()
+    for afwijking in afwijkingen:
+        print(f'GOUDEN WAARDE: {afwijking}', file=sys.stderr)
+
+    importmeting = meet_import()
+    budget = controleer_importbudget(importmeting)
+    print(f"{'import_kern':28s} {importmeting['seconden'] * 1e3:12.4f} ms {importmeting['megabyte']:12.1f} MB")
+    for overschrijding in budget:
+        print(f'IMPORTBUDGET: {overschrijding}', file=sys.stderr)
+
+    tijden = {'import_kern': importmeting['seconden']}
+    for naam, (groep, functie, eenheden) in paden(int(args.max_grootte), args.alleen).items():
+        tijd = meet(functie, herhalingen=3 if groep in ('app', 'bulk') else 5)
+        tijden[naam] = tijd
+        print(f'{naam:28s} {tijd * 1e3:12.4f} ms/aanroep {eenheden/tijd:16,.0f} per s')
+
+    geschiedenis = lees_geschiedenis(args.geschiedenis)
+    regressies = vergelijk(tijden, geschiedenis, args.drempel, args.basis)
+    for naam, (huidig, referentie, toename) in regressies.items():
+        print(f'REGRESSIE: {naam} {huidig * 1e3:.4f} ms tegen {referentie * 1e3:.4f} ms (+{toename:.0%})',
+              file=sys.stderr)
+
+    if not args.niet_opslaan:
+        run = dict(tijd=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   versie=_git_versie(),
+                   machine=platform.node(),
+                   python=platform.python_version(),
+                   numpy=np.__version__,
+                   tijden=tijden,
+                   regressies=sorted(regressies),
+                   import_megabyte=importmeting['megabyte'],
+                   gouden_waarden_ok=not afwijkingen,
+                   importbudget_ok=not budget)
+        with open(args.geschiedenis, 'a') as bestand:
+            bestand.write(json.dumps(run) + '\n')
+    return 1 if regressies or afwijkingen or budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,352 @@
+import argparse
+import os
+import sys
+import time
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from duiker_batch import _foutmeldingen, _kolom, duikers_uit_blok
+from duiker_kern import Afvoerkromme, DuikerArray
+
+## Duiker berging
+# =============================================================================
+# Niet-stationaire berekening (level-pool routing): een bergingsvak boven de
+# duiker vult met een instroomhydrogram en loopt leeg door de duiker naar
+# een vaste benedenwaterstand. Per bergingsvak geldt
+#
+#     A(h) dh/dt = I(t) - Q(h),   Q(h) = C * (h - h_beneden)**0.5
+#
+# met C de coëfficiënt van de afvoerkromme. Ligt het peil onder de
+# benedenwaterstand, dan stroomt het water terug (intreed- en
+# uittreedweerstand verwisseld, zoals in duiker_tijdreeks). A(h) is het
+# bergend oppervlak, eventueel oplopend met het peil (talud).
+#
+#   routering = routeer(duikers, oppervlak=5000.0, instroom=hydrogram, tijdstap=600.0)
+#   routering.peil, routering.debiet        # (bergingsvakken, uitvoertijden)
+#   routering.max_opstuwing                 # per bergingsvak
+#   routering.geldig                        # False: ongeldige invoer, uitkomsten NaN
+#
+#   python duiker_berging.py vakken.csv instroom.csv pieken.csv --reeksen reeksen.parquet
+#
+# De integrator is Rosenbrock 2(3) (als ode23s) met een eigen, adaptieve
+# tijdstap per bergingsvak: alle vakken die nog niet klaar zijn doen
+# tegelijk (gevectoriseerd) een stap, elk met zijn eigen stapgrootte;
+# afgewezen stappen worden per vak overgedaan. Rond de benedenwaterstand is
+# de afvoerkromme zeer steil (dQ/dh ~ 1/wortel(verval)) en een expliciete
+# methode moet daar seconden-stappen zetten; Rosenbrock blijft stabiel met
+# stappen van een tijdstap van het hydrogram. Onder VERVAL_LINEAIR loopt de
+# afvoerkromme lineair naar 0 zodat dQ/dh eindig blijft. Een stap is hooguit
+# één tijdstap van het hydrogram, zodat geen piek wordt overgeslagen. Peilen
+# op de uitvoertijden komen uit kubische Hermite-interpolatie in de stap.
+
+VERVAL_LINEAIR = 1e-3   # [m]
+BERGING_RESULTATEN = ('max_peil', 'max_opstuwing', 'max_debiet', 'tijd_max', 'stappen', 'afgewezen')
+
+
+class Routering(NamedTuple):
+    tijd: np.ndarray            # uitvoertijden [s]
+    peil: np.ndarray            # (vakken, tijden) [+mNAP]
+    debiet: np.ndarray          # (vakken, tijden) [m3/s]
+    max_peil: np.ndarray        # hoogste peil in de stappen [+mNAP]
+    max_opstuwing: np.ndarray   # max_peil - benedenwaterstand [m]
+    max_debiet: np.ndarray      # debiet bij het hoogste peil [m3/s]
+    tijd_max: np.ndarray        # tijdstip van het hoogste peil [s]
+    stappen: np.ndarray         # aanvaarde stappen per vak
+    afgewezen: np.ndarray       # afgewezen stappen per vak
+    geldig: np.ndarray          # False: invoer of stap niet eindig, uitkomsten NaN
+    seconden: float
+
+
+## Model:
+# ===================================
+class BergingsModel:
+    # Afvoerkromme in beide richtingen, bergend oppervlak en hydrogram
+    def __init__(self, duikers: DuikerArray, oppervlak, instroom, tijdstap, oppervlak_helling=0.0,
+                 beginpeil=None):
+        terug = duikers.vervang(intreedweerstand=duikers.uittreedweerstand,
+                                uittreedweerstand=duikers.intreedweerstand)
+        self.c_voor = Afvoerkromme(duikers).coefficient
+        self.c_terug = Afvoerkromme(terug).coefficient
+        self.beneden = duikers.benedenwaterstand
+        self.beginpeil = duikers.bovenwaterstand if beginpeil is None else np.broadcast_to(
+            np.asarray(beginpeil, dtype=float), len(duikers))
+        self.oppervlak = np.broadcast_to(np.asarray(oppervlak, dtype=float), len(duikers))
+        self.oppervlak_helling = np.broadcast_to(np.asarray(oppervlak_helling, dtype=float), len(duikers))
+        instroom = np.asarray(instroom, dtype=float)
+        self.instroom = np.broadcast_to(np.atleast_2d(instroom), (len(duikers), instroom.shape[-1]))
+        self.tijdstap = float(tijdstap)
+        if self.instroom.shape[1] < 2 or not self.tijdstap > 0:
+            raise ValueError('het hydrogram heeft minstens twee waarden en een tijdstap groter dan 0 nodig')
+        # Vakken met ongeldige invoer rekenen niet mee (uitkomsten NaN)
+        with np.errstate(invalid='ignore'):
+            self.geldig = (np.isfinite(self.c_voor) & np.isfinite(self.c_terug) & np.isfinite(self.beneden)
+                           & np.isfinite(self.beginpeil) & (self.oppervlak > 0) & np.isfinite(self.oppervlak)
+                           & np.isfinite(self.oppervlak_helling) & np.isfinite(self.instroom).all(axis=1))
+
+    @property
+    def duur(self):
+        return self.tijdstap * (self.instroom.shape[1] - 1)
+
+    def debiet(self, vakken, peil):
+        # Q(h) en dQ/dh; lineair onder VERVAL_LINEAIR
+        verval = peil - self.beneden[vakken]
+        coefficient = np.where(verval >= 0, self.c_voor[vakken], self.c_terug[vakken])
+        absoluut = np.maximum(np.abs(verval), VERVAL_LINEAIR)
+        wortel = np.sqrt(absoluut)
+        debiet = np.sign(verval) * coefficient * np.where(np.abs(verval) < VERVAL_LINEAIR,
+                                                          np.abs(verval)/wortel, wortel)
+        helling = coefficient * np.where(np.abs(verval) < VERVAL_LINEAIR, 1.0/wortel, 0.5/wortel)
+        return debiet, helling
+
+    def instroom_op(self, vakken, tijd):
+        # Lineair tussen de waarden van het hydrogram; ook de helling dI/dt
+        positie = np.clip(tijd/self.tijdstap, 0.0, self.instroom.shape[1] - 1.0)
+        index = np.minimum(positie.astype(np.int64), self.instroom.shape[1] - 2)
+        links = self.instroom[vakken, index]
+        verschil = self.instroom[vakken, index + 1] - links
+        return links + verschil * (positie - index), verschil/self.tijdstap
+
+    def afgeleide(self, vakken, tijd, peil, jacobiaan=False):
+        # dh/dt; het oppervlak blijft minstens 1% van het oppervlak bij het
+        # beginpeil. Met jacobiaan ook d(dh/dt)/dh en d(dh/dt)/dt
+        oppervlak = self.oppervlak[vakken] + self.oppervlak_helling[vakken] * (peil - self.beginpeil[vakken])
+        ondergrens = 0.01 * self.oppervlak[vakken]
+        helling_oppervlak = np.where(oppervlak > ondergrens, self.oppervlak_helling[vakken], 0.0)
+        oppervlak = np.maximum(oppervlak, ondergrens)
+        instroom, instroom_helling = self.instroom_op(vakken, tijd)
+        debiet, debiet_helling = self.debiet(vakken, peil)
+        afgeleide = (instroom - debiet)/oppervlak
+        if not jacobiaan:
+            return afgeleide
+        return (afgeleide, -(debiet_helling + afgeleide * helling_oppervlak)/oppervlak,
+                instroom_helling/oppervlak)
+
+
+## Integrator:
+# ===================================
+def _hermite(theta, stap, peil, afgeleide, peil_nieuw, afgeleide_nieuw):
+    # Kubische Hermite-interpolatie op fractie theta van de stap
+    h00 = (1 + 2 * theta) * (1 - theta)**2
+    h10 = theta * (1 - theta)**2
+    h01 = theta**2 * (3 - 2 * theta)
+    h11 = theta**2 * (theta - 1)
+    return h00 * peil + h10 * stap * afgeleide + h01 * peil_nieuw + h11 * stap * afgeleide_nieuw
+
+
+def routeer(duikers: DuikerArray, oppervlak, instroom, tijdstap, uitvoerstap=None, oppervlak_helling=0.0,
+            beginpeil=None, atol=1e-4, rtol=1e-4, max_iteraties=1_000_000) -> Routering:
+    # oppervlak [m2] en oppervlak_helling [m2/m] per vak; instroom [m3/s]
+    # als (tijden,) voor alle vakken of (vakken, tijden), op tijdstap [s]
+    # vanaf 0. beginpeil: standaard de bovenwaterstand van de duikers.
+    # Toegestane fout per stap: atol [m] + rtol maal de peilstijging.
+    # Vakken met ongeldige invoer, of waarvan een stap geen eindige fout
+    # geeft, vallen af met NaN als uitkomst (routering.geldig).
+    start = time.perf_counter()
+    model = BergingsModel(duikers, oppervlak, instroom, tijdstap, oppervlak_helling, beginpeil)
+    aantal = len(duikers)
+    uitvoerstap = model.tijdstap if uitvoerstap is None else float(uitvoerstap)
+    uitvoertijd = np.arange(0.0, model.duur + 0.5 * uitvoerstap, uitvoerstap)
+    uitvoertijd[-1] = min(uitvoertijd[-1], model.duur)
+
+    alle = np.arange(aantal)
+    tijd = np.zeros(aantal)
+    peil = model.beginpeil.astype(float).copy()
+    stap = np.full(aantal, min(model.tijdstap, 60.0))
+    reeks = np.full((aantal, len(uitvoertijd)), np.nan)
+    reeks[:, 0] = peil
+    volgende = np.ones(aantal, dtype=np.int64)
+    max_peil, tijd_max = peil.copy(), np.zeros(aantal)
+    stappen, afgewezen = np.zeros(aantal, dtype=np.int64), np.zeros(aantal, dtype=np.int64)
+    d, e32 = 1.0/(2.0 + np.sqrt(2.0)), 6.0 + np.sqrt(2.0)
+
+    geldig = model.geldig.copy()
+    actief = alle[geldig & (tijd < model.duur)]
+    iteraties = 0
+    with np.errstate(all='ignore'):
+        while len(actief):
+            iteraties += 1
+            if iteraties > max_iteraties:
+                raise RuntimeError(f'routering niet klaar na {max_iteraties} iteraties')
+            t, h = tijd[actief], peil[actief]
+            # Niet over een knik in het hydrogram heen stappen
+            grens = np.minimum((np.floor(t/model.tijdstap + 1e-9) + 1.0) * model.tijdstap, model.duur)
+            dt = np.minimum(stap[actief], grens - t)
+            f0, jacobiaan, tijdsafgeleide = model.afgeleide(actief, t, h, jacobiaan=True)
+            w = 1.0 - dt * d * jacobiaan
+            k1 = (f0 + dt * d * tijdsafgeleide)/w
+            f1 = model.afgeleide(actief, t + 0.5 * dt, h + 0.5 * dt * k1)
+            k2 = (f1 - k1)/w + k1
+            h_nieuw = h + dt * k2
+            f2 = model.afgeleide(actief, t + dt, h_nieuw)
+            k3 = (f2 - e32 * (k2 - f1) - 2.0 * (k1 - f0) + dt * d * tijdsafgeleide)/w
+            fout = dt/6.0 * (k1 - 2.0 * k2 + k3)
+            norm = np.abs(fout)/(atol + rtol * np.abs(h_nieuw - model.beginpeil[actief]))
+            # Geen eindige fout: de stap wordt nooit aanvaard, dus het vak valt af
+            geldig[actief[~np.isfinite(norm)]] = False
+            goed = norm <= 1.0
+            # Volgende stapgrootte, ook na een afgewezen stap
+            factor = np.clip(0.9 * np.where(norm > 0, norm, 1e-12)**(-1.0/3.0), 0.2, 5.0)
+            stap[actief] = np.minimum(dt * np.where(goed, factor, np.minimum(factor, 0.9)), model.tijdstap)
+            afgewezen[actief[~goed]] += 1
+
+            vakken, t, dt, grens = actief[goed], t[goed], dt[goed], grens[goed]
+            h, f0, h_nieuw, f2 = h[goed], f0[goed], h_nieuw[goed], f2[goed]
+            # Uitvoertijden binnen deze stap
+            binnen = np.flatnonzero(uitvoertijd[np.minimum(volgende[vakken], len(uitvoertijd) - 1)] <= t + dt)
+            binnen = binnen[volgende[vakken[binnen]] < len(uitvoertijd)]
+            while len(binnen):
+                vak = vakken[binnen]
+                theta = (uitvoertijd[volgende[vak]] - t[binnen])/dt[binnen]
+                reeks[vak, volgende[vak]] = _hermite(theta, dt[binnen], h[binnen], f0[binnen],
+                                                     h_nieuw[binnen], f2[binnen])
+                volgende[vak] += 1
+                binnen = binnen[volgende[vak] < len(uitvoertijd)]
+                binnen = binnen[uitvoertijd[volgende[vakken[binnen]]] <= t[binnen] + dt[binnen]]
+
+            # Op een knik precies op de tijd van het hydrogram uitkomen
+            tijd[vakken] = np.where(dt == grens - t, grens, t + dt)
+            peil[vakken] = h_nieuw
+            stappen[vakken] += 1
+            hoger = h_nieuw > max_peil[vakken]
+            max_peil[vakken[hoger]] = h_nieuw[hoger]
+            tijd_max[vakken[hoger]] = tijd[vakken[hoger]]
+            actief = actief[geldig[actief] & (tijd[actief] < model.duur)]
+
+        reeks[~geldig] = np.nan
+        max_peil[~geldig] = np.nan
+        tijd_max[~geldig] = np.nan
+        debiet = model.debiet(alle[:, None], reeks)[0]
+        max_debiet = model.debiet(alle, max_peil)[0]
+    return Routering(tijd=uitvoertijd, peil=reeks, debiet=debiet,
+                     max_peil=max_peil, max_opstuwing=max_peil - model.beneden, max_debiet=max_debiet,
+                     tijd_max=tijd_max, stappen=stappen, afgewezen=afgewezen, geldig=geldig,
+                     seconden=time.perf_counter() - start)
+
+
+def foutmeldingen(duikers: DuikerArray, oppervlak, oppervlak_helling=0.0, instroom=None):
+    # Melding per vak ('' is in orde), als duiker_batch._foutmeldingen. Het
+    # beginpeil mag hier onder de benedenwaterstand liggen (terugstroming),
+    # dus het verval telt niet als fout.
+    boven = np.where(duikers.bovenwaterstand < duikers.benedenwaterstand,
+                     duikers.benedenwaterstand, duikers.bovenwaterstand)
+    zonder_verval = duikers.vervang(bovenwaterstand=boven)
+    with np.errstate(all='ignore'):
+        fouten = _foutmeldingen(zonder_verval, zonder_verval.debiet)
+        oppervlak = np.broadcast_to(np.asarray(oppervlak, dtype=float), len(duikers))
+        oppervlak_helling = np.broadcast_to(np.asarray(oppervlak_helling, dtype=float), len(duikers))
+        condities = [fouten != '',
+                     ~(np.isfinite(oppervlak) & (oppervlak > 0)),
+                     ~np.isfinite(oppervlak_helling)]
+        meldingen = [fouten,
+                     'bergend oppervlak moet groter dan 0 zijn',
+                     'ontbrekende of niet-numerieke oppervlak_helling']
+        if instroom is not None and np.ndim(instroom) == 2:
+            condities.append(~np.isfinite(instroom).all(axis=1))
+            meldingen.append('hydrogram van het vak bevat ontbrekende waarden')
+    return np.select(condities, meldingen, default='')
+
+
+## Benchmark:
+# ===================================
+def synthetisch_hydrogram(aantal, uren=48.0, tijdstap=600.0, seed=0):
+    # Per vak een afvoergolf met piek tussen 0,2 en 3 m3/s rond uur 12 op
+    # een basisafvoer van 0,02 m3/s, en een bergend oppervlak
+    rng = np.random.default_rng(seed)
+    uur = np.arange(0.0, uren + 1e-9, tijdstap/3600.0)
+    piek = rng.uniform(0.2, 3.0, aantal)[:, None]
+    instroom = 0.02 + piek * np.exp(-((uur[None, :] - 12.0)/4.0)**2)
+    return instroom, rng.uniform(1_000.0, 20_000.0, aantal)
+
+
+## Bestanden:
+# ===================================
+def lees_hydrogram(pad, namen=None):
+    # CSV met een kolom 'uur' op vaste afstand en een kolom 'instroom' [m3/s]
+    # voor alle vakken, of een kolom per vak met de naam van het vak
+    tabel = pd.read_csv(pad)
+    if 'uur' not in tabel.columns:
+        raise KeyError("kolom 'uur' ontbreekt in het hydrogram")
+    uren = pd.to_numeric(tabel['uur'], errors='coerce').to_numpy(dtype=float)
+    stappen = np.diff(uren)
+    if len(uren) < 2 or uren[0] != 0 or not np.allclose(stappen, stappen[0]) or stappen[0] <= 0:
+        raise ValueError("de kolom 'uur' moet bij 0 beginnen en op vaste afstand oplopen")
+    if 'instroom' in tabel.columns:
+        instroom = pd.to_numeric(tabel['instroom'], errors='coerce').to_numpy(dtype=float)
+        if not np.isfinite(instroom).all():
+            raise ValueError('het hydrogram bevat ontbrekende of niet-numerieke waarden')
+    elif namen is not None:
+        ontbrekend = [naam for naam in namen if naam not in tabel.columns]
+        if ontbrekend:
+            raise KeyError(f"kolom '{ontbrekend[0]}' ontbreekt in het hydrogram")
+        # Ontbrekende waarden in de kolom van een vak keuren dat vak af
+        instroom = tabel[list(namen)].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float).T
+    else:
+        raise KeyError("kolom 'instroom' ontbreekt in het hydrogram (of geef --naamkolom)")
+    return instroom, float(stappen[0]) * 3600.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Duiker tool: bergingsvakken die leeglopen door een duiker.')
+    parser.add_argument('vakken', help="CSV met per vak de kolommen van duiker_batch (verval als "
+                                       "bovenwaterstand = beginpeil en benedenwaterstand) plus 'oppervlak' [m2]")
+    parser.add_argument('hydrogram', help="CSV met 'uur' en 'instroom' [m3/s], of een kolom per vak")
+    parser.add_argument('uitvoer', help='CSV met per vak het hoogste peil, de opstuwing en het debiet')
+    parser.add_argument('--afgekeurd', help='CSV-bestand voor afgekeurde vakken (standaard <uitvoer>_afgekeurd.csv)')
+    parser.add_argument('--reeksen', help='CSV of Parquet met peil en debiet per vak en uitvoertijd')
+    parser.add_argument('--uitvoerstap', type=float, help='minuten tussen uitvoertijden (standaard het hydrogram)')
+    parser.add_argument('--naamkolom', help='kolom met de naam van het vak (ook de kolom in het hydrogram)')
+    parser.add_argument('--sliblaag', choices=('percentage', 'cm'), default='percentage')
+    parser.add_argument('--atol', type=float, default=1e-4, help='toegestane fout per stap [m]')
+    args = parser.parse_args(argv)
+    try:
+        vakken = pd.read_csv(args.vakken)
+        if args.naamkolom and args.naamkolom not in vakken.columns:
+            raise KeyError(f"kolom '{args.naamkolom}' voor de naam ontbreekt in de invoer")
+        namen = vakken[args.naamkolom].astype(str).tolist() if args.naamkolom else None
+        duikers = duikers_uit_blok(vakken, keuze_sliblaag=args.sliblaag, keuze_verval='nap')
+        oppervlak = _kolom(vakken, {}, 'oppervlak')
+        helling = (_kolom(vakken, {}, 'oppervlak_helling') if 'oppervlak_helling' in vakken.columns
+                   else np.zeros(len(vakken)))
+        instroom, tijdstap = lees_hydrogram(args.hydrogram, namen)
+        # Afgekeurde vakken apart wegschrijven, zoals in duiker_batch
+        fouten = foutmeldingen(duikers, oppervlak, helling, instroom)
+        goed = fouten == ''
+        afgekeurd = args.afgekeurd or f'{os.path.splitext(args.uitvoer)[0]}_afgekeurd.csv'
+        vakken.loc[~goed].assign(fout=fouten[~goed]).to_csv(afgekeurd, index=False)
+        if instroom.ndim == 2:
+            instroom = instroom[goed]
+        duikers, oppervlak, helling = duikers.deel(np.flatnonzero(goed)), oppervlak[goed], helling[goed]
+        namen = None if namen is None else [naam for naam, ok in zip(namen, goed) if ok]
+        routering = routeer(duikers, oppervlak, instroom, tijdstap,
+                            None if args.uitvoerstap is None else args.uitvoerstap * 60.0,
+                            helling, atol=args.atol)
+    except (KeyError, ValueError, OSError, RuntimeError) as fout:
+        print(f'fout: {fout}', file=sys.stderr)
+        return 1
+    samenvatting = pd.DataFrame({naam: getattr(routering, naam) for naam in BERGING_RESULTATEN})
+    samenvatting['tijd_max'] /= 3600.0
+    if namen is not None:
+        samenvatting.insert(0, 'naam', namen)
+    samenvatting.to_csv(args.uitvoer, index=False)
+    if args.reeksen:
+        aantal, tijden = routering.peil.shape
+        reeksen = pd.DataFrame({'vak': np.repeat(namen if namen is not None else np.arange(aantal), tijden),
+                                'uur': np.tile(routering.tijd/3600.0, aantal),
+                                'peil': routering.peil.ravel(),
+                                'debiet': routering.debiet.ravel()})
+        if args.reeksen.lower().endswith('.parquet'):
+            reeksen.to_parquet(args.reeksen, index=False)
+        else:
+            reeksen.to_csv(args.reeksen, index=False)
+    print(f'{len(duikers)} vakken over {routering.tijd[-1]/3600.0:.1f} uur in {routering.seconden:.2f} s, '
+          f'gemiddeld {routering.stappen.mean() if len(duikers) else 0:.0f} stappen '
+          f'({routering.afgewezen.mean() if len(duikers) else 0:.1f} afgewezen) per vak', file=sys.stderr)
+    if not goed.all():
+        print(f'{int((~goed).sum())} vakken afgekeurd -> {afgekeurd}', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
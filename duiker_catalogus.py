@@ -0,0 +1,374 @@
+import argparse
+import sys
+import time
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from duiker_batch import BlokSchrijver, _kolom, lees_blokken
+from duiker_geometrie import profielcodes
+from duiker_kern import DuikerArray, benodigde_opstuwing
+
+## Duiker catalogus
+# =============================================================================
+# Kiest voor elke locatie in een register de goedkoopste standaardbuis uit
+# een leverancierscatalogus waarbij de opstuwing bij het ontwerpdebiet onder
+# de norm blijft, plus de op één na goedkoopste als alternatief.
+#
+#   catalogus = lees_catalogus('catalogus.csv')
+#   selectie = selecteer(catalogus, debiet, max_opstuwing, lengte=lengte, ben_str_nat_opp=opp)
+#   catalogus.naam[selectie.keuze]          # -1: geen buis voldoet
+#
+#   python duiker_catalogus.py locaties.csv catalogus.csv keuze.csv --max-opstuwing 5
+#
+# De catalogus wordt bij het inlezen gesorteerd in reeksen: buizen met
+# dezelfde manning, hetzelfde profiel en dezelfde verhouding hoogte/breedte.
+# Binnen een reeks stijgt de capaciteit met de diameter tot een top (bij
+# een te grote buis gaat het uittreeverlies overheersen), dus voldoen de
+# buizen van de kleinste die voldoet tot de grootste die nog voldoet. Die
+# grenzen worden per reeks voor alle locaties tegelijk met binair zoeken
+# gevonden (een paar keer log2 van de reekslengte rekenstappen); de
+# goedkoopste en op één na goedkoopste buis per bereik komen uit een vooraf
+# opgebouwde sparse table (n log n per reeks). De kosten zijn
+# prijs_per_meter maal de lengte, dus de volgorde van de prijzen geldt voor
+# elke locatie.
+#
+# methode='alles' rekent elke buis voor elke locatie door (in blokken) en
+# neemt geen vorm van de capaciteit aan; dat is de controle op het zoeken.
+
+# Kolommen van de catalogus; materiaal, profiel en hoogte zijn optioneel
+CATALOGUSKOLOMMEN = ('naam', 'diameter', 'manning', 'prijs_per_meter')
+# Kolommen van de locaties; ontbreekt sliblaag_pct (0-100) of max_opstuwing
+# (in cm), dan geldt de waarde die aan selecteer_bestand is meegegeven
+LOCATIEKOLOMMEN = ('lengte', 'intreedweerstand', 'uittreedweerstand', 'ben_str_nat_opp', 'ontwerpdebiet')
+
+
+## Catalogus:
+# ===================================
+class Catalogus:
+    def __init__(self, naam, diameter, manning, prijs_per_meter, materiaal='', profiel='rond', hoogte=np.nan):
+        diameter, manning, prijs_per_meter, hoogte = np.broadcast_arrays(
+            *(np.asarray(waarde, dtype=float) for waarde in (diameter, manning, prijs_per_meter, hoogte)))
+        aantal = len(diameter)
+        if aantal == 0:
+            raise ValueError('de catalogus is leeg')
+        naam = np.broadcast_to(np.asarray(naam, dtype=object), aantal)
+        materiaal = np.broadcast_to(np.asarray(materiaal, dtype=object), aantal)
+        profiel = np.broadcast_to(profielcodes(profiel), aantal)
+        if not (np.isfinite(diameter) & (diameter > 0)).all():
+            raise ValueError('elke buis in de catalogus moet een diameter groter dan 0 hebben')
+        if not (np.isfinite(manning) & (manning > 0)).all():
+            raise ValueError('elke buis in de catalogus moet een manning groter dan 0 hebben')
+        if not (np.isfinite(prijs_per_meter) & (prijs_per_meter >= 0)).all():
+            raise ValueError('elke buis in de catalogus moet een prijs van 0 of meer hebben')
+
+        # Sorteren op reeks en daarbinnen op diameter
+        verhouding = np.round(np.where(np.isnan(hoogte), 0.0, hoogte/diameter), 9)
+        volgorde = np.lexsort((diameter, verhouding, profiel, manning))
+        self.naam = naam[volgorde]
+        self.materiaal = materiaal[volgorde]
+        self.diameter = diameter[volgorde]
+        self.manning = manning[volgorde]
+        self.prijs_per_meter = prijs_per_meter[volgorde]
+        self.profiel = profiel[volgorde]
+        self.hoogte = hoogte[volgorde]
+        sleutel = np.column_stack([self.manning, self.profiel, verhouding[volgorde]])
+        grenzen = np.flatnonzero((sleutel[1:] != sleutel[:-1]).any(axis=1)) + 1
+        self.reeksen = list(zip(np.r_[0, grenzen], np.r_[grenzen, aantal]))
+        self.bereiken = self._bereiken()
+
+    def _goedkoopste_twee(self, kandidaten):
+        # Per rij de goedkoopste twee verschillende buizen uit de kolommen
+        # van kandidaten (-1: geen); gelijke prijzen in catalogusvolgorde
+        kandidaten = kandidaten.copy()
+        for kolom in range(1, kandidaten.shape[1]):
+            dubbel = (kandidaten[:, :kolom] == kandidaten[:, kolom:kolom + 1]).any(axis=1)
+            kandidaten[dubbel, kolom] = -1
+        prijs = np.where(kandidaten >= 0, self.prijs_per_meter[kandidaten], np.inf)
+        volgorde = np.lexsort((np.where(kandidaten >= 0, kandidaten, len(self)), prijs), axis=1)[:, :2]
+        return np.take_along_axis(np.where(np.isfinite(prijs), kandidaten, -1), volgorde, axis=1)
+
+    def _bereiken(self):
+        # Per reeks een sparse table: niveau k heeft voor elke positie i de
+        # goedkoopste en op één na goedkoopste buis in [i, i + 2**k). Geheugen
+        # en opbouw zijn n log n per reeks in plaats van n**2
+        tabellen = []
+        for begin, eind in self.reeksen:
+            niveau = np.column_stack([np.arange(begin, eind), np.full(eind - begin, -1)])
+            niveaus = [niveau]
+            breedte = 1
+            while 2 * breedte <= eind - begin:
+                niveau = self._goedkoopste_twee(np.column_stack([niveau[:-breedte], niveau[breedte:]]))
+                niveaus.append(niveau)
+                breedte *= 2
+            tabellen.append(niveaus)
+        return tabellen
+
+    def goedkoopste(self, reeks, van, tot):
+        # (rijen, 2): de goedkoopste twee buizen met een positie van..tot
+        # (inclusief, posities in de catalogus) binnen reeks nummer reeks.
+        # Twee overlappende blokken van 2**k dekken het bereik
+        begin = self.reeksen[reeks][0]
+        van, tot = np.asarray(van) - begin, np.asarray(tot) - begin
+        k = np.floor(np.log2(np.maximum(tot - van + 1, 1))).astype(np.int64)
+        uitkomst = np.empty((len(van), 2), dtype=np.int64)
+        for niveau in np.unique(k).tolist():
+            rijen = np.flatnonzero(k == niveau)
+            tabel = self.bereiken[reeks][niveau]
+            uitkomst[rijen] = self._goedkoopste_twee(
+                np.column_stack([tabel[van[rijen]], tabel[tot[rijen] - (1 << niveau) + 1]]))
+        return uitkomst
+
+    def __len__(self):
+        return len(self.diameter)
+
+    def duikers(self, basis: DuikerArray, buizen):
+        # De locaties in basis met per rij de buis buizen[rij]
+        return basis.vervang(diameter=self.diameter[buizen], manning=self.manning[buizen],
+                             profiel=self.profiel[buizen], hoogte=self.hoogte[buizen])
+
+
+def lees_catalogus(pad):
+    tabel = pd.read_csv(pad)
+    ontbrekend = [kolom for kolom in CATALOGUSKOLOMMEN if kolom not in tabel.columns]
+    if ontbrekend:
+        raise KeyError(f"kolom '{ontbrekend[0]}' ontbreekt in de catalogus")
+    profiel = 'rond'
+    if 'profiel' in tabel.columns:
+        profiel = tabel['profiel'].fillna('rond').astype(str).str.strip().str.lower().to_numpy()
+    return Catalogus(naam=tabel['naam'].astype(str).to_numpy(),
+                     diameter=pd.to_numeric(tabel['diameter'], errors='coerce').to_numpy(dtype=float),
+                     manning=pd.to_numeric(tabel['manning'], errors='coerce').to_numpy(dtype=float),
+                     prijs_per_meter=pd.to_numeric(tabel['prijs_per_meter'], errors='coerce').to_numpy(dtype=float),
+                     materiaal=tabel['materiaal'].fillna('').astype(str).to_numpy() if 'materiaal' in tabel else '',
+                     profiel=profiel,
+                     hoogte=pd.to_numeric(tabel['hoogte'], errors='coerce').to_numpy(dtype=float)
+                     if 'hoogte' in tabel else np.nan)
+
+
+## Selectie:
+# ===================================
+class Selectie(NamedTuple):
+    # Indexen in de (gesorteerde) catalogus, -1 als er geen (tweede) buis
+    # voldoet; kosten en opstuwing zijn dan NaN
+    keuze: np.ndarray
+    tweede: np.ndarray
+    kosten: np.ndarray
+    kosten_tweede: np.ndarray
+    opstuwing: np.ndarray
+    opstuwing_tweede: np.ndarray
+
+
+def _locaties(lengte, ben_str_nat_opp, max_opstuwing, sliblaag_procent, intreedweerstand, uittreedweerstand):
+    # Locaties als duikers met de norm als verval; diameter en manning
+    # worden per buis vervangen
+    return DuikerArray(diameter=1.0, lengte=lengte, sliblaag_procent=sliblaag_procent,
+                       intreedweerstand=intreedweerstand, uittreedweerstand=uittreedweerstand,
+                       ben_str_nat_opp=ben_str_nat_opp, manning=1.0,
+                       bovenwaterstand=max_opstuwing, benedenwaterstand=0.0)
+
+
+def _eerste(catalogus: Catalogus, basis: DuikerArray, laag, hoog, toets):
+    # Binair zoeken per locatie naar de eerste positie in [laag, hoog) waar
+    # toets(duikers, rijen, positie) waar is; hoog als die er niet is. De
+    # toets moet binnen het bereik van onwaar naar waar gaan.
+    laag, hoog = laag.copy(), hoog.copy()
+    rijen = np.flatnonzero(laag < hoog)
+    while len(rijen):
+        midden = (laag[rijen] + hoog[rijen])//2
+        with np.errstate(all='ignore'):
+            waar = toets(basis.deel(rijen), rijen, midden)
+        hoog[rijen] = np.where(waar, midden, hoog[rijen])
+        laag[rijen] = np.where(waar, laag[rijen], midden + 1)
+        rijen = rijen[laag[rijen] < hoog[rijen]]
+    return laag
+
+
+def _zoek(catalogus: Catalogus, basis: DuikerArray, debiet):
+    # (locaties, 2 x reeksen) kandidaten: per reeks de goedkoopste twee
+    # buizen die voldoen. Binnen een reeks stijgt het debiet met de diameter
+    # tot een top en daalt daarna weer, als het natte oppervlak van de buis
+    # in de buurt komt van dat benedenstrooms (uittreeverlies); de buizen
+    # die voldoen liggen dus aaneen rond de top.
+    def capaciteit(duikers, buizen):
+        return catalogus.duikers(duikers, buizen).debiet
+
+    kandidaten = []
+    for reeks, (begin, eind) in enumerate(catalogus.reeksen):
+        laatste = np.full(len(basis), eind - 1)
+        # Top: de eerste positie waar de volgende buis niet meer afvoert;
+        # meestal de grootste buis, dat is met één stap bekend
+        top = laatste.copy()
+        if eind - begin > 1:
+            with np.errstate(all='ignore'):
+                dalend = ~(capaciteit(basis, laatste - 1) < capaciteit(basis, laatste))
+            top[dalend] = _eerste(catalogus, basis, np.full(len(basis), begin), laatste,
+                                  lambda duikers, rijen, positie:
+                                  ~(capaciteit(duikers, positie) < capaciteit(duikers, positie + 1)))[dalend]
+        van = _eerste(catalogus, basis, np.full(len(basis), begin), top + 1,
+                      lambda duikers, rijen, positie: capaciteit(duikers, positie) >= debiet[rijen])
+        geen = van > top
+        # Aan de dalende kant: de eerste buis die niet meer voldoet (is de
+        # top de grootste buis, dan voldoet die al)
+        tot = _eerste(catalogus, basis, np.where(geen | (top == eind - 1), eind, top), np.full(len(basis), eind),
+                      lambda duikers, rijen, positie: ~(capaciteit(duikers, positie) >= debiet[rijen])) - 1
+        paar = catalogus.goedkoopste(reeks, np.where(geen, begin, van), np.where(geen, begin, tot))
+        kandidaten.append(np.where(geen[:, None], -1, paar))
+    return np.column_stack(kandidaten)
+
+
+def _alles(catalogus: Catalogus, basis: DuikerArray, debiet, blok):
+    # (locaties, 2) kandidaten uit alle buizen, in blokken van locaties
+    aantal = len(catalogus)
+    kandidaten = np.empty((len(basis), 2), dtype=np.int64)
+    buizen = np.arange(aantal)
+    stap = max(1, blok//aantal)
+    for start in range(0, len(basis), stap):
+        rijen = np.arange(start, min(start + stap, len(basis)))
+        duikers = catalogus.duikers(basis.deel(np.repeat(rijen, aantal)), np.tile(buizen, len(rijen)))
+        with np.errstate(all='ignore'):
+            voldoet = (duikers.debiet >= np.repeat(debiet[rijen], aantal)).reshape(len(rijen), aantal)
+        prijs = np.where(voldoet, catalogus.prijs_per_meter, np.inf)
+        if aantal == 1:
+            prijs = np.column_stack([prijs, np.full(len(rijen), np.inf)])
+        volgorde = np.argsort(prijs, axis=1, kind='stable')[:, :2]
+        kandidaten[rijen] = np.where(np.isfinite(np.take_along_axis(prijs, volgorde, axis=1)), volgorde, -1)
+    return kandidaten
+
+
+def selecteer(catalogus: Catalogus, debiet, max_opstuwing, lengte, ben_str_nat_opp,
+              sliblaag_procent=0.0, intreedweerstand=0.4, uittreedweerstand=1.0,
+              methode='zoeken', blok=1_000_000):
+    # debiet [m3/s] en max_opstuwing [m] per locatie; sliblaag_procent als
+    # fractie van de hoogte. blok: rijen per rekenstap bij methode='alles'
+    basis = _locaties(lengte, ben_str_nat_opp, max_opstuwing, sliblaag_procent,
+                      intreedweerstand, uittreedweerstand)
+    debiet = np.broadcast_to(np.asarray(debiet, dtype=float), len(basis))
+    lengte = basis.lengte
+    if methode == 'zoeken':
+        kandidaten = _zoek(catalogus, basis, debiet)
+    elif methode == 'alles':
+        kandidaten = _alles(catalogus, basis, debiet, blok)
+    else:
+        raise ValueError(f'onbekende methode: {methode}')
+
+    # Goedkoopste twee van de kandidaten; gelijke prijzen in catalogusvolgorde
+    prijs = np.where(kandidaten >= 0, catalogus.prijs_per_meter[kandidaten], np.inf)
+    volgorde = np.lexsort((kandidaten, prijs), axis=1)[:, :2]
+    keuze, tweede = np.take_along_axis(np.where(np.isfinite(prijs), kandidaten, -1), volgorde, axis=1).T
+
+    def opstuwing(buizen):
+        gekozen = buizen >= 0
+        uitkomst = np.full(len(basis), np.nan)
+        if gekozen.any():
+            duikers = catalogus.duikers(basis.deel(gekozen), buizen[gekozen])
+            with np.errstate(all='ignore'):
+                uitkomst[gekozen] = benodigde_opstuwing(duikers, debiet[gekozen])
+        return uitkomst
+
+    def kosten(buizen):
+        return np.where(buizen >= 0, catalogus.prijs_per_meter[buizen] * lengte, np.nan)
+
+    return Selectie(keuze=keuze, tweede=tweede,
+                    kosten=kosten(keuze), kosten_tweede=kosten(tweede),
+                    opstuwing=opstuwing(keuze), opstuwing_tweede=opstuwing(tweede))
+
+
+## Bestanden:
+# ===================================
+def selecteer_blok(blok, catalogus: Catalogus, max_opstuwing=None, sliblaag_pct=0.0, methode='zoeken'):
+    # Voegt per locatie keuze_* en tweede_* toe; max_opstuwing [cm] en
+    # sliblaag_pct [%] gelden als de kolom ontbreekt
+    kolommen = {veld: _kolom(blok, {}, veld) for veld in LOCATIEKOLOMMEN}
+    if 'max_opstuwing' in blok.columns or max_opstuwing is None:
+        max_opstuwing = _kolom(blok, {}, 'max_opstuwing')
+    if 'sliblaag_pct' in blok.columns:
+        sliblaag_pct = _kolom(blok, {}, 'sliblaag_pct')
+    selectie = selecteer(catalogus, kolommen.pop('ontwerpdebiet'), np.asarray(max_opstuwing)/100,
+                         sliblaag_procent=np.asarray(sliblaag_pct)/100, methode=methode, **kolommen)
+    uitvoer = {}
+    for soort, buizen, kosten, opstuwing in (('keuze', selectie.keuze, selectie.kosten, selectie.opstuwing),
+                                            ('tweede', selectie.tweede, selectie.kosten_tweede,
+                                             selectie.opstuwing_tweede)):
+        gekozen = buizen >= 0
+        uitvoer[f'{soort}_naam'] = np.where(gekozen, catalogus.naam[buizen], '')
+        uitvoer[f'{soort}_materiaal'] = np.where(gekozen, catalogus.materiaal[buizen], '')
+        uitvoer[f'{soort}_diameter'] = np.where(gekozen, catalogus.diameter[buizen], np.nan)
+        uitvoer[f'{soort}_kosten'] = kosten
+        uitvoer[f'{soort}_opstuwing'] = opstuwing * 100
+    return blok.assign(**uitvoer)
+
+
+def selecteer_bestand(invoer, catalogus, uitvoer, max_opstuwing=None, sliblaag_pct=0.0,
+                      methode='zoeken', blokgrootte=100_000, meld=None):
+    aantal = zonder_keuze = 0
+    start = time.perf_counter()
+    with BlokSchrijver(uitvoer) as schrijver:
+        for blok in lees_blokken(invoer, blokgrootte):
+            resultaat = selecteer_blok(blok, catalogus, max_opstuwing, sliblaag_pct, methode)
+            schrijver.schrijf(resultaat)
+            aantal += len(blok)
+            zonder_keuze += int((resultaat['keuze_naam'] == '').sum())
+            if meld is not None:
+                duur = time.perf_counter() - start
+                meld(f'{aantal} locaties, {zonder_keuze} zonder passende buis, {aantal/max(duur, 1e-9):,.0f} locaties/s')
+    duur = time.perf_counter() - start
+    return dict(locaties=aantal,
+                zonder_keuze=zonder_keuze,
+                seconden=duur,
+                locaties_per_seconde=aantal/max(duur, 1e-9))
+
+
+## Benchmark:
+# ===================================
+def synthetische_catalogus(materialen=4, diameters=50, seed=0):
+    # Alleen voor benchmarks en controles: geen echte prijzen
+    rng = np.random.default_rng(seed)
+    diameter = np.geomspace(0.2, 2.5, diameters)
+    manning = np.linspace(60.0, 90.0, materialen)
+    prijs = (150.0 * diameter[None, :]**1.4 * rng.uniform(0.8, 1.3, (materialen, 1))
+             * rng.uniform(0.95, 1.05, (materialen, diameters)))
+    return Catalogus(naam=[f'm{m}-d{d:03d}' for m in range(materialen) for d in range(diameters)],
+                     diameter=np.tile(diameter, materialen), manning=np.repeat(manning, diameters),
+                     prijs_per_meter=prijs.ravel(), materiaal=np.repeat([f'm{m}' for m in range(materialen)], diameters))
+
+
+def synthetische_locaties(grootte, seed=0):
+    rng = np.random.default_rng(seed)
+    return dict(debiet=rng.uniform(0.05, 5.0, grootte),
+                max_opstuwing=rng.uniform(0.02, 0.10, grootte),
+                lengte=rng.uniform(5.0, 100.0, grootte),
+                ben_str_nat_opp=rng.uniform(2.0, 50.0, grootte),
+                sliblaag_procent=rng.uniform(0.0, 0.2, grootte))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Duiker tool: goedkoopste passende buis uit een catalogus per locatie.')
+    parser.add_argument('invoer', help='CSV- of Parquet-bestand met een rij per locatie')
+    parser.add_argument('catalogus', help='CSV-bestand met de kolommen naam, diameter, manning en prijs_per_meter')
+    parser.add_argument('uitvoer', help='CSV- of Parquet-bestand voor de keuzes')
+    parser.add_argument('--max-opstuwing', type=float, help='toegestane opstuwing [cm] als de kolom max_opstuwing ontbreekt')
+    parser.add_argument('--sliblaag', type=float, default=0.0,
+                        help='sliblaag [%% T.O.V. hoogte] als de kolom sliblaag_pct ontbreekt')
+    parser.add_argument('--methode', choices=('zoeken', 'alles'), default='zoeken',
+                        help="'alles' rekent elke buis voor elke locatie door (controle)")
+    parser.add_argument('--blokgrootte', type=int, default=100_000, help='aantal locaties per blok')
+    parser.add_argument('--stil', action='store_true', help='geen voortgang per blok tonen')
+    args = parser.parse_args(argv)
+    try:
+        catalogus = lees_catalogus(args.catalogus)
+        tellingen = selecteer_bestand(args.invoer, catalogus, args.uitvoer, args.max_opstuwing, args.sliblaag,
+                                      args.methode, args.blokgrootte,
+                                      meld=None if args.stil else (lambda tekst: print(tekst, file=sys.stderr)))
+    except (KeyError, ValueError, OSError) as fout:
+        print(f'fout: {fout}', file=sys.stderr)
+        return 1
+    print(f"{tellingen['locaties']} locaties, {len(catalogus)} buizen in {len(catalogus.reeksen)} reeksen, "
+          f"{tellingen['zonder_keuze']} zonder passende buis, {tellingen['seconden']:.1f} s "
+          f"({tellingen['locaties_per_seconde']:,.0f} locaties/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
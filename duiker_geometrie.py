@@ -0,0 +1,348 @@
+import math
+
+import numpy as np
+
+## Duiker geometrie
+# =============================================================================
+# Natte oppervlak en natte omtrek van een duiker met een sliblaag, voor vier
+# profielen (de breedte is het veld diameter van Duiker):
+#
+#   rond       breedte = hoogte = diameter
+#   rechthoek  breedte x hoogte (kokerduiker)
+#   eivorm     standaard eiprofiel 2:3, hoogte = 1.5 * breedte
+#   ellips     breedte x hoogte
+#
+# Per profiel wordt één keer een genormaliseerde tabel gemaakt: het natte
+# oppervlak en de natte omtrek als fractie van die van de volle doorsnede,
+# tegen de sliblaagfractie s (dikte van de sliblaag gedeeld door de
+# hoogte). Voor rechthoek en ellips hangt de tabel ook af van de verhouding
+# hoogte/breedte en is hij tweedimensionaal. De volle doorsnede zelf is
+# een formule (pi/4 * D**2, B * H, ...), zodat 3.14 nergens meer nodig is.
+#
+# Opzoeken is lineair (bilineair) interpoleren met per punt een vooraf
+# berekende helling. Het rooster is uniform in sqrt(s) voor s <= 0.5 en in
+# sqrt(1 - s) daarboven, want bij een dunne sliblaag en bij een bijna volle
+# duiker veranderen de koorde en de omtrek met een wortel. De index volgt
+# direct uit de waarde, zonder zoeken.
+#
+# De natte omtrek is de wand boven de sliblaag plus de breedte van het
+# sliboppervlak, want ook het slib remt het water af. Een sliblaagfractie
+# buiten 0-1 of een verhouding buiten VERHOUDING_BEREIK geeft NaN.
+#
+# Voor doorsnede_afgeleiden staan ook de afgeleiden naar s in de tabel,
+# exact uit de omtrek: het natte oppervlak neemt af met de breedte van het
+# sliboppervlak en de natte omtrek met de helling van de wand. Het opzoeken
+# van een afgeleide gaat dus net zo als van een waarde, ook bij s = 0 waar
+# de helling van de oppervlaktabel (lineair in sqrt(s)) zou ontploffen.
+
+PROFIELEN = ('rond', 'rechthoek', 'eivorm', 'ellips')
+ONBEKEND_PROFIEL = -1    # code voor een onbekende naam; de doorsnede wordt NaN
+VERHOUDING_BEREIK = (0.1, 10.0)
+
+_FRACTIES = 1025         # roosterpunten per helft (s <= 0.5 en s >= 0.5)
+_VERHOUDINGEN = 257      # roosterpunten in log(hoogte/breedte)
+_OMTREKPUNTEN = 100_001  # punten op de halve omtrek bij het opbouwen
+_OMTREKPUNTEN_2D = 8_193  # idem per verhouding
+
+_tabellen = {}
+
+
+## Omtrek (rechterhelft, van onder naar boven, breedte 1):
+# ===================================
+def _boog(midden_x, midden_y, straal, van, tot, punten):
+    hoek = np.linspace(van, tot, punten)
+    return midden_x + straal * np.cos(hoek), midden_y + straal * np.sin(hoek)
+
+
+def _omtrek(profiel, verhouding=1.0):
+    if profiel == 'rond':
+        return _boog(0.0, 0.5, 0.5, -math.pi/2, math.pi/2, _OMTREKPUNTEN)
+    if profiel == 'ellips':
+        x, y = _boog(0.0, 0.5, 0.5, -math.pi/2, math.pi/2, _OMTREKPUNTEN_2D)
+        return x, y * verhouding
+    if profiel == 'rechthoek':
+        return np.array([0.5, 0.5, 0.0]), np.array([0.0, verhouding, verhouding])
+    if profiel == 'eivorm':
+        # Bodem: straal 1/4; zijkanten: straal 3/2 met het middelpunt aan de
+        # overkant; kap: straal 1/2. De bogen raken elkaar in (0.2, 0.1) en (0.5, 1).
+        raakhoek = -math.asin(0.6)
+        delen = (_boog(0.0, 0.25, 0.25, -math.pi/2, raakhoek, _OMTREKPUNTEN//4),
+                 _boog(-1.0, 1.0, 1.5, raakhoek, 0.0, _OMTREKPUNTEN//2),
+                 _boog(0.0, 1.0, 0.5, 0.0, math.pi/2, _OMTREKPUNTEN//4))
+        return (np.concatenate([delen[0][0], delen[1][0][1:], delen[2][0][1:]]),
+                np.concatenate([delen[0][1], delen[1][1][1:], delen[2][1][1:]]))
+    raise ValueError(f"onbekend profiel '{profiel}', kies uit {', '.join(PROFIELEN)}")
+
+
+def _tabelrij(x, y, fracties):
+    # Natte oppervlak, natte omtrek (beide als fractie van de volle
+    # doorsnede) per sliblaagfractie, plus het volle oppervlak en de volle
+    # omtrek van deze omtrek en de afgeleiden van beide fracties naar s
+    lengte = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+    oppervlak = np.concatenate(([0.0], np.cumsum((x[1:] + x[:-1]) * np.diff(y))))
+    peil = fracties * y[-1]
+    i = np.clip(np.searchsorted(y, peil, side='right') - 1, 0, len(y) - 2)
+    dy = y[i + 1] - y[i]
+    f = np.where(dy > 0, (peil - y[i])/np.where(dy > 0, dy, 1.0), 0.0)
+    x_peil = x[i] + f * (x[i + 1] - x[i])
+    onder = oppervlak[i] + (x[i] + x_peil) * (peil - y[i])
+    nat_opp = np.maximum(oppervlak[-1] - onder, 0.0)
+    natte_omtrek = 2.0 * (lengte[-1] - (lengte[i] + f * (lengte[i + 1] - lengte[i]))) + 2.0 * x_peil
+    vol_opp, volle_omtrek = oppervlak[-1], natte_omtrek[0]
+    # Afgeleiden naar het peil: -breedte voor het oppervlak en 2 (dx - ds)/dy
+    # voor de omtrek, van het stuk wand onder het peil (zo blijft s = 1 bij
+    # een vlakke bovenkant eindig), geschreven als -2 dy/(dx + ds)
+    i = np.clip(np.searchsorted(y, peil, side='left') - 1, 0, len(y) - 2)
+    dx, dy = x[i + 1] - x[i], y[i + 1] - y[i]
+    noemer = dx + np.hypot(dx, dy)
+    omtrek_helling = -2.0 * dy/np.where(noemer > 0, noemer, 1.0)
+    return (nat_opp/vol_opp, natte_omtrek/volle_omtrek, vol_opp, volle_omtrek,
+            -2.0 * x_peil * y[-1]/vol_opp, omtrek_helling * y[-1]/volle_omtrek)
+
+
+def _fracties():
+    # Sliblaagfractie per roosterpunt: uniform in sqrt(2 s) tot s = 0.5 en
+    # daarna uniform in sqrt(2 (1 - s)), samen één oplopend rooster
+    u = np.linspace(0.0, 1.0, _FRACTIES)
+    return np.concatenate((0.5 * u**2, 1.0 - 0.5 * u[-2::-1]**2))
+
+
+def _met_hellingen(waarden):
+    # Per punt de waarde en de helling naar het volgende punt
+    return waarden, np.diff(waarden, append=waarden[:, -1:], axis=1)
+
+
+def profieltabel(profiel):
+    # (natte oppervlakfractie, natte omtrekfractie) als arrays van
+    # (verhoudingen, roosterpunten); profielen met een vaste vorm hebben
+    # één verhouding. oppervlak_s en omtrek_s zijn de afgeleiden naar s,
+    # omtrek_k die naar log(hoogte/breedte).
+    if profiel not in _tabellen:
+        if profiel in ('rechthoek', 'ellips'):
+            verhoudingen = np.geomspace(*VERHOUDING_BEREIK, _VERHOUDINGEN)
+        else:
+            verhoudingen = np.ones(1)
+        rijen = [_tabelrij(*_omtrek(profiel, k), _fracties()) for k in verhoudingen]
+        oppervlakken = np.array([rij[0] for rij in rijen])
+        omtrekken = np.array([rij[1] for rij in rijen])
+        oppervlak_s = np.array([rij[4] for rij in rijen])
+        omtrek_s = np.array([rij[5] for rij in rijen])
+        if profiel == 'ellips':
+            # De volle omtrek is een benadering; de tabel vangt de afwijking op
+            correctie = np.array([rij[3] for rij in rijen])[:, None]/volle_doorsnede('ellips', 1.0, verhoudingen)[1][:, None]
+            omtrekken *= correctie
+            omtrek_s *= correctie
+        _tabellen[profiel] = dict(oppervlak=_met_hellingen(oppervlakken),
+                                  omtrek=_met_hellingen(omtrekken),
+                                  oppervlak_s=_met_hellingen(oppervlak_s),
+                                  omtrek_s=_met_hellingen(omtrek_s),
+                                  vol_opp=rijen[0][2], volle_omtrek=rijen[0][3])
+        if len(verhoudingen) > 1:
+            _tabellen[profiel]['omtrek_k'] = _met_hellingen(
+                np.gradient(omtrekken, np.log(verhoudingen), axis=0, edge_order=2))
+    return _tabellen[profiel]
+
+
+def volle_doorsnede(profiel, breedte, hoogte, wortel=np.sqrt):
+    # Oppervlak [m2] en omtrek [m] van de volle doorsnede; hoogte volgens profielhoogte
+    if profiel == 'rond':
+        return math.pi/4 * breedte * breedte, math.pi * breedte
+    if profiel == 'rechthoek':
+        return breedte * hoogte, 2.0 * (breedte + hoogte)
+    if profiel == 'ellips':
+        # Omtrek volgens de tweede benadering van Ramanujan
+        h = ((breedte - hoogte)/(breedte + hoogte))**2
+        return (math.pi/4 * breedte * hoogte,
+                math.pi/2 * (breedte + hoogte) * (1.0 + 3.0 * h/(10.0 + wortel(4.0 - 3.0 * h))))
+    if profiel == 'eivorm':
+        tabel = profieltabel('eivorm')
+        return tabel['vol_opp'] * breedte * breedte, tabel['volle_omtrek'] * breedte
+    raise ValueError(f"onbekend profiel '{profiel}', kies uit {', '.join(PROFIELEN)}")
+
+
+def _volle_omtrek_hoogte(profiel, breedte, hoogte):
+    # Afgeleide van de volle omtrek naar de hoogte (rechthoek en ellips)
+    if profiel == 'rechthoek':
+        return 2.0
+    som = breedte + hoogte
+    h = ((breedte - hoogte)/som)**2
+    wortel = np.sqrt(4.0 - 3.0 * h)
+    factor = 1.0 + 3.0 * h/(10.0 + wortel)
+    factor_h = 3.0/(10.0 + wortel) + 9.0 * h/(2.0 * wortel * (10.0 + wortel)**2)
+    h_hoogte = -4.0 * breedte * (breedte - hoogte)/som**3
+    return math.pi/2 * (factor + som * factor_h * h_hoogte)
+
+
+def profielhoogte(profiel, breedte, hoogte=None):
+    # Hoogte [m]: vast voor rond en eivorm, anders opgegeven (standaard de breedte)
+    if profiel == 'rond':
+        return breedte
+    if profiel == 'eivorm':
+        return 1.5 * breedte
+    return breedte if hoogte is None or hoogte != hoogte else hoogte
+
+
+def profielhoogtes(profiel, breedte, hoogte):
+    # profielhoogte per duiker; profiel als codes, hoogte NaN is de standaard
+    profiel, breedte, hoogte = np.broadcast_arrays(profiel, np.asarray(breedte, dtype=float),
+                                                   np.asarray(hoogte, dtype=float))
+    standaard = np.where(profiel == PROFIELEN.index('eivorm'), 1.5 * breedte, breedte)
+    vast = (profiel == PROFIELEN.index('rond')) | (profiel == PROFIELEN.index('eivorm')) | np.isnan(hoogte)
+    return np.where(vast, standaard, hoogte)
+
+
+def profielcodes(profiel, streng=True):
+    # Profielnamen of -codes als int8-array (codes volgen PROFIELEN). Niet
+    # streng: onbekende namen krijgen ONBEKEND_PROFIEL in plaats van een fout
+    profiel = np.asarray(profiel)
+    if profiel.dtype.kind in 'iu':
+        return profiel.astype(np.int8)
+    codes = np.full(profiel.shape, ONBEKEND_PROFIEL, dtype=np.int8)
+    for code, naam in enumerate(PROFIELEN):
+        codes[profiel == naam] = code
+    if streng and (codes < 0).any():
+        onbekend = sorted(set(profiel[codes < 0].tolist()))
+        raise ValueError(f"onbekend profiel {', '.join(map(repr, onbekend))}, kies uit {', '.join(PROFIELEN)}")
+    return codes
+
+
+## Opzoeken:
+# ===================================
+_PUNTEN = 2 * _FRACTIES - 1
+
+
+def _doorsnede_profiel(naam, breedte, hoogte, fractie, afgeleiden=False):
+    tabel = profieltabel(naam)
+    # Plaats op het rooster: (n - 1) * (1 -/+ (1 - sqrt(1 - 2 |s - 0.5|)))
+    midden = fractie - 0.5
+    afstand = np.abs(midden)
+    geldig = afstand <= 0.5
+    if not geldig.all():
+        afstand = np.where(geldig, afstand, 0.0)
+    plaats = (np.copysign(1.0 - np.sqrt(1.0 - 2.0 * afstand), midden) + 1.0) * (_FRACTIES - 1)
+    kolom = np.minimum(plaats.astype(np.intp), _PUNTEN - 2)
+    f = plaats - kolom
+    if tabel['oppervlak'][0].shape[0] == 1:
+        def opzoeken(waarden, hellingen):
+            return waarden[0][kolom] + f * hellingen[0][kolom]
+    else:
+        laag, hoog = VERHOUDING_BEREIK
+        gekoppeld = np.isnan(hoogte)
+        hoogte = np.where(gekoppeld, breedte, hoogte)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            verhouding = hoogte/breedte
+        binnen = (verhouding >= laag) & (verhouding <= hoog)
+        geldig = geldig & binnen
+        plaats = np.log(np.where(binnen, verhouding, laag)/laag)/math.log(hoog/laag) * (_VERHOUDINGEN - 1)
+        rij = np.minimum(plaats.astype(np.intp), _VERHOUDINGEN - 2)
+        g = plaats - rij
+        onder = rij * _PUNTEN + kolom
+
+        def opzoeken(waarden, hellingen):
+            waarden, hellingen = waarden.ravel(), hellingen.ravel()
+            waarde_onder = waarden[onder] + f * hellingen[onder]
+            waarde_boven = waarden[onder + _PUNTEN] + f * hellingen[onder + _PUNTEN]
+            return waarde_onder + g * (waarde_boven - waarde_onder)
+    vol_opp, volle_omtrek = volle_doorsnede(naam, breedte, hoogte)
+    nat = opzoeken(*tabel['oppervlak'])
+    uitkomst = (vol_opp * (1.0 - nat), vol_opp * nat, volle_omtrek * opzoeken(*tabel['omtrek']))
+    if afgeleiden:
+        uitkomst += _afgeleiden(naam, tabel, opzoeken, breedte, hoogte, uitkomst[1], uitkomst[2],
+                                vol_opp, volle_omtrek, gekoppeld if 'omtrek_k' in tabel else None)
+    if not geldig.all():
+        uitkomst = tuple(np.where(geldig, waarde, np.nan) for waarde in uitkomst)
+    return uitkomst
+
+
+def _afgeleiden(naam, tabel, opzoeken, breedte, hoogte, nat_opp, natte_omtrek, vol_opp, volle_omtrek,
+                gekoppeld):
+    # Afgeleiden van nat oppervlak en natte omtrek naar breedte, hoogte en s.
+    # Beide zijn homogeen in (breedte, hoogte): van graad 2 en 1.
+    opp_s = vol_opp * opzoeken(*tabel['oppervlak_s'])
+    omtrek_s = volle_omtrek * opzoeken(*tabel['omtrek_s'])
+    if gekoppeld is None:
+        # Rond en eivorm: de hoogte volgt de breedte
+        nul = np.zeros_like(nat_opp)
+        return 2.0 * nat_opp/breedte, nul, opp_s, natte_omtrek/breedte, nul, omtrek_s
+    # Rechthoek en ellips: het oppervlak schaalt lineair met de hoogte, de
+    # omtrek ook via de verhouding (tabel omtrek_k)
+    opp_h = nat_opp/hoogte
+    omtrek_h = (_volle_omtrek_hoogte(naam, breedte, hoogte) * natte_omtrek/volle_omtrek
+                + volle_omtrek * opzoeken(*tabel['omtrek_k'])/hoogte)
+    opp_b = nat_opp/breedte
+    omtrek_b = (natte_omtrek - hoogte * omtrek_h)/breedte
+    # Zonder opgegeven hoogte telt de hoogte mee in de breedte
+    if gekoppeld.any():
+        opp_b = np.where(gekoppeld, opp_b + opp_h, opp_b)
+        omtrek_b = np.where(gekoppeld, omtrek_b + omtrek_h, omtrek_b)
+        opp_h = np.where(gekoppeld, 0.0, opp_h)
+        omtrek_h = np.where(gekoppeld, 0.0, omtrek_h)
+    return opp_b, opp_h, opp_s, omtrek_b, omtrek_h, omtrek_s
+
+
+def _per_profiel(profiel, breedte, hoogte, fractie, afgeleiden):
+    profiel, breedte, hoogte, fractie = np.broadcast_arrays(
+        profiel, np.asarray(breedte, dtype=float), np.asarray(hoogte, dtype=float),
+        np.asarray(fractie, dtype=float))
+    if profiel.size == 0 or profiel.strides == (0,) * profiel.ndim or (profiel == profiel.flat[0]).all():
+        code = int(profiel.flat[0]) if profiel.size else 0
+        if 0 <= code < len(PROFIELEN):
+            return _doorsnede_profiel(PROFIELEN[code], breedte, hoogte, fractie, afgeleiden)
+    # Onbekende codes blijven NaN
+    uitkomst = tuple(np.full(profiel.shape, np.nan) for _ in range(9 if afgeleiden else 3))
+    for code, naam in enumerate(PROFIELEN):
+        rijen = profiel == code
+        if rijen.any():
+            for doel, waarde in zip(uitkomst, _doorsnede_profiel(naam, breedte[rijen], hoogte[rijen],
+                                                                  fractie[rijen], afgeleiden)):
+                doel[rijen] = waarde
+    return uitkomst
+
+
+def doorsnede(profiel, breedte, hoogte, fractie):
+    # (sliblaag, nat oppervlak, natte omtrek) per duiker [m2, m2, m];
+    # profiel: codes uit profielcodes, hoogte NaN betekent de standaardhoogte
+    return _per_profiel(profiel, breedte, hoogte, fractie, False)
+
+
+def doorsnede_afgeleiden(profiel, breedte, hoogte, fractie):
+    # Als doorsnede, plus een dict met de afgeleiden van nat_opp_duiker en
+    # natte_omtrek naar diameter, hoogte en sliblaag_procent. Zonder
+    # opgegeven hoogte (of bij rond en eivorm) is de afgeleide naar de
+    # hoogte 0 en zit het effect in die naar de diameter.
+    sliblaag, nat_opp, natte_omtrek, *delen = _per_profiel(profiel, breedte, hoogte, fractie, True)
+    invoer = ('diameter', 'hoogte', 'sliblaag_procent')
+    return sliblaag, nat_opp, natte_omtrek, {'nat_opp_duiker': dict(zip(invoer, delen[:3])),
+                                             'natte_omtrek': dict(zip(invoer, delen[3:]))}
+
+
+def doorsnede_scalair(profiel, breedte, hoogte, fractie):
+    # Zelfde opzoeking voor één duiker met gewone floats (geen numpy-overhead)
+    midden = fractie - 0.5
+    afstand = abs(midden)
+    if not afstand <= 0.5:
+        return math.nan, math.nan, math.nan
+    tabel = profieltabel(profiel)
+    plaats = (math.copysign(1.0 - math.sqrt(1.0 - 2.0 * afstand), midden) + 1.0) * (_FRACTIES - 1)
+    kolom = min(int(plaats), _PUNTEN - 2)
+    f = plaats - kolom
+    hoogte = profielhoogte(profiel, breedte, hoogte)
+    if tabel['oppervlak'][0].shape[0] == 1:
+        def opzoeken(waarden, hellingen):
+            return waarden[0, kolom].item() + f * hellingen[0, kolom].item()
+    else:
+        laag, hoog = VERHOUDING_BEREIK
+        verhouding = hoogte/breedte
+        if not laag <= verhouding <= hoog:
+            return math.nan, math.nan, math.nan
+        plaats = math.log(verhouding/laag)/math.log(hoog/laag) * (_VERHOUDINGEN - 1)
+        rij = min(int(plaats), _VERHOUDINGEN - 2)
+        g = plaats - rij
+
+        def opzoeken(waarden, hellingen):
+            waarde_onder = waarden[rij, kolom].item() + f * hellingen[rij, kolom].item()
+            waarde_boven = waarden[rij + 1, kolom].item() + f * hellingen[rij + 1, kolom].item()
+            return waarde_onder + g * (waarde_boven - waarde_onder)
+    vol_opp, volle_omtrek = volle_doorsnede(profiel, breedte, hoogte, wortel=math.sqrt)
+    nat = opzoeken(*tabel['oppervlak'])
+    return vol_opp * (1.0 - nat), vol_opp * nat, volle_omtrek * opzoeken(*tabel['omtrek'])
@@ -0,0 +1,107 @@
+import numpy as np
+
+from duiker_geometrie import doorsnede_afgeleiden
+from duiker_kern import DuikerArray
+
+## Duiker gevoeligheid
+# =============================================================================
+# Afgeleiden van debiet, stroomsnelheid en ruwheid naar elke invoer, in één
+# gevectoriseerde doorgang samen met de waarden zelf (kettingregel door de
+# formules van DuikerArray, de geometrie uit doorsnede_afgeleiden). Er wordt
+# dus niet per veld verstoord en opnieuw gerekend, en er is geen ruis van
+# een stapgrootte, ook niet bij 0% of bijna 100% sliblaag.
+#
+#   gevoeligheid = gevoeligheden(duikers)
+#   gevoeligheid.afgeleiden['debiet']['manning']      # dQ/dmanning per duiker
+#   gevoeligheid.elasticiteiten()['debiet']['lengte']  # (dQ/Q)/(dL/L)
+#
+# Een elasticiteit is de procentuele verandering van de uitkomst bij 1%
+# meer invoer. Voor de waterstanden hangt die af van het nulpunt (NAP); daar
+# zegt de afgeleide meer. Bij een verval van 0 is de afgeleide naar de
+# waterstanden oneindig (wortel), bij negatief verval NaN.
+
+GEVOELIGHEID_INVOER = DuikerArray.velden + ('hoogte',)
+GEVOELIGHEID_UITVOER = ('debiet', 'stroomsnelheid', 'ruwheid')
+
+
+class Gevoeligheden:
+    # waarden: uitvoer -> array; afgeleiden: uitvoer -> invoer -> array
+    def __init__(self, duikers: DuikerArray, waarden, afgeleiden):
+        self.duikers = duikers
+        self.waarden = waarden
+        self.afgeleiden = afgeleiden
+
+    def elasticiteiten(self):
+        # (dy/y)/(dx/x); een invoer zonder invloed heeft elasticiteit 0
+        uitkomst = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for uitvoer, per_invoer in self.afgeleiden.items():
+                waarde = self.waarden[uitvoer]
+                uitkomst[uitvoer] = {invoer: np.where(afgeleide == 0, 0.0,
+                                                      afgeleide * getattr(self.duikers, invoer)/waarde)
+                                     for invoer, afgeleide in per_invoer.items()}
+        return uitkomst
+
+    def tabel(self, rij=0, elasticiteit=True):
+        # Eén duiker als rijen per invoer, met een kolom per uitvoer
+        bron = self.elasticiteiten() if elasticiteit else self.afgeleiden
+        return [dict(invoer=invoer, **{uitvoer: float(bron[uitvoer][invoer][rij]) for uitvoer in bron})
+                for invoer in GEVOELIGHEID_INVOER]
+
+    def kolommen(self, uitvoer=GEVOELIGHEID_UITVOER, elasticiteit=True):
+        # Kolommen voor bulkuitvoer: elasticiteit_<uitvoer>_<invoer>
+        bron = self.elasticiteiten() if elasticiteit else self.afgeleiden
+        soort = 'elasticiteit' if elasticiteit else 'afgeleide'
+        return {f'{soort}_{naam}_{invoer}': bron[naam][invoer]
+                for naam in uitvoer for invoer in GEVOELIGHEID_INVOER}
+
+
+def gevoeligheden(duikers: DuikerArray) -> Gevoeligheden:
+    sliblaag, nat_opp_duiker, natte_omtrek, geometrie = doorsnede_afgeleiden(
+        duikers.profiel, duikers.diameter, duikers.hoogte, duikers.sliblaag_procent)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # Waarden, met dezelfde uitdrukkingen als DuikerArray
+        straal = nat_opp_duiker/natte_omtrek
+        chezy = duikers.manning * straal**(1.0/6.0)
+        verhouding = 1.0-(nat_opp_duiker/duikers.ben_str_nat_opp)
+        E0 = duikers.uittreedweerstand * verhouding**2.0
+        Ef = (2 * 9.81 * duikers.lengte) / (chezy**2 * straal)
+        mu = (duikers.intreedweerstand + E0 + Ef)**-0.5
+        opstuwing = duikers.opstuwing
+        valhoogte = np.sqrt(2.0 * 9.81 * np.where(opstuwing >= 0, opstuwing, np.nan))
+        debiet = mu * nat_opp_duiker * valhoogte
+        stroomsnelheid = np.where(nat_opp_duiker > 0, debiet/nat_opp_duiker, 0.0)
+
+        # Afgeleiden van de totale weerstand S = Ei + E0 + Ef
+        Ef_straal = -4.0/3.0 * Ef/straal
+        S_opp = -2.0 * duikers.uittreedweerstand * verhouding/duikers.ben_str_nat_opp + Ef_straal/natte_omtrek
+        S_omtrek = -Ef_straal * straal/natte_omtrek
+        S = {'diameter': None, 'hoogte': None, 'sliblaag_procent': None,
+             'lengte': (2 * 9.81) / (chezy**2 * straal),
+             'intreedweerstand': np.ones_like(mu),
+             'uittreedweerstand': verhouding**2.0,
+             'ben_str_nat_opp': 2.0 * duikers.uittreedweerstand * verhouding * nat_opp_duiker/duikers.ben_str_nat_opp**2,
+             'manning': -2.0 * Ef/duikers.manning,
+             'bovenwaterstand': np.zeros_like(mu),
+             'benedenwaterstand': np.zeros_like(mu)}
+        for invoer in ('diameter', 'hoogte', 'sliblaag_procent'):
+            S[invoer] = S_opp * geometrie['nat_opp_duiker'][invoer] + S_omtrek * geometrie['natte_omtrek'][invoer]
+
+        # mu = S**-0.5, Q = mu A sqrt(2 g h), v = mu sqrt(2 g h)
+        afgeleiden = {uitvoer: {} for uitvoer in GEVOELIGHEID_UITVOER}
+        valhoogte_verval = 9.81/valhoogte
+        leeg = nat_opp_duiker <= 0
+        for invoer in GEVOELIGHEID_INVOER:
+            mu_x = -0.5 * mu**3 * S[invoer]
+            opp_x = geometrie['nat_opp_duiker'].get(invoer, 0.0)
+            debiet_x = valhoogte * (nat_opp_duiker * mu_x + mu * opp_x)
+            snelheid_x = valhoogte * mu_x
+            if invoer in ('bovenwaterstand', 'benedenwaterstand'):
+                teken = 1.0 if invoer == 'bovenwaterstand' else -1.0
+                debiet_x = teken * mu * nat_opp_duiker * valhoogte_verval
+                snelheid_x = teken * mu * valhoogte_verval
+            afgeleiden['ruwheid'][invoer] = mu_x
+            afgeleiden['debiet'][invoer] = debiet_x
+            afgeleiden['stroomsnelheid'][invoer] = np.where(leeg, 0.0, snelheid_x)
+    waarden = dict(debiet=debiet, stroomsnelheid=stroomsnelheid, ruwheid=mu)
+    return Gevoeligheden(duikers, waarden, afgeleiden)
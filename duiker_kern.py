@@ -0,0 +1,455 @@
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+from duiker_geometrie import PROFIELEN, doorsnede, doorsnede_scalair, profielcodes
+
+## Duiker tool: hydraulische kern
+# =============================================================================
+# De hydraulica van de Duiker tool zonder streamlit, plotly, PIL of pydantic:
+# de gevectoriseerde DuikerArray, de afvoerkromme, de inverse berekeningen en
+# de scalaire kern. Importeren heeft geen bijwerkingen en laadt alleen numpy,
+# zodat batch-, service- en poolwerkers in milliseconden starten. Het natte
+# oppervlak en de natte omtrek komen uit duiker_geometrie (rond, rechthoek,
+# eivorm of ellips); de hydraulische straal is nat oppervlak/natte omtrek.
+# DuikerTool.py haalt alles hieruit en voegt de GUI en figuren toe.
+
+## Duiker tool (gevectoriseerd over kolommen)
+# =============================================================================
+class DuikerArray:
+    # Zelfde velden als Duiker, maar elk veld is een kolom (numpy array) met
+    # één waarde per duiker. Scalars worden naar de lengte van de kolommen
+    # uitgerekt. Randgevallen geven geen fout maar worden gemaskeerd:
+    # negatief verval geeft NaN als debiet, een leeg nat oppervlak geeft 0 m/s.
+    # Het profiel staat als code (index in PROFIELEN) in profiel, een hoogte
+    # NaN betekent de standaardhoogte van het profiel (zie profielhoogte).
+    velden = ('diameter', 'lengte', 'sliblaag_procent', 'intreedweerstand',
+              'uittreedweerstand', 'ben_str_nat_opp', 'manning',
+              'bovenwaterstand', 'benedenwaterstand')
+    profielvelden = ('profiel', 'hoogte')
+
+    def __init__(self,
+                 diameter,
+                 lengte,
+                 sliblaag_procent,
+                 intreedweerstand,
+                 uittreedweerstand,
+                 ben_str_nat_opp,
+                 manning,
+                 bovenwaterstand,
+                 benedenwaterstand,
+                 profiel='rond',
+                 hoogte=np.nan):
+        kolommen = np.broadcast_arrays(*[np.atleast_1d(np.asarray(kolom, dtype=float))
+                                         for kolom in (diameter, lengte, sliblaag_procent,
+                                                       intreedweerstand, uittreedweerstand,
+                                                       ben_str_nat_opp, manning,
+                                                       bovenwaterstand, benedenwaterstand, hoogte)])
+        for naam, kolom in zip(self.velden + ('hoogte',), kolommen):
+            setattr(self, naam, kolom)
+        self.profiel = np.broadcast_to(profielcodes(profiel), kolommen[0].shape)
+
+    @classmethod
+    def from_duikers(cls, duikers):
+        duikers = list(duikers)
+        velden = {naam: [getattr(duiker, naam) for duiker in duikers] for naam in cls.velden}
+        velden['profiel'] = [getattr(duiker, 'profiel', 'rond') for duiker in duikers]
+        velden['hoogte'] = [np.nan if getattr(duiker, 'hoogte', None) is None else duiker.hoogte
+                            for duiker in duikers]
+        return cls(**velden)
+
+    @staticmethod
+    def profiel_uit_dict(duiker):
+        # profiel en hoogte uit een dict met de velden van Duiker (standaard rond)
+        hoogte = duiker.get('hoogte')
+        return dict(profiel=duiker.get('profiel', 'rond'), hoogte=np.nan if hoogte is None else hoogte)
+
+    def __len__(self):
+        return self.diameter.shape[0]
+
+    def deel(self, rijen):
+        # Kopie met alleen deze rijen (index- of maskerarray)
+        velden = {naam: getattr(self, naam)[rijen] for naam in self.velden + self.profielvelden}
+        return type(self)(**velden)
+
+    def vervang(self, **kolommen):
+        # Kopie met een of meer vervangen kolommen
+        velden = {naam: getattr(self, naam) for naam in self.velden + self.profielvelden}
+        velden.update(kolommen)
+        return type(self)(**velden)
+
+    ## Natte doorsnede:
+    # ===================================
+    @property
+    def doorsnede(self):
+        # (sliblaag, nat oppervlak, natte omtrek) uit de profieltabellen
+        return doorsnede(self.profiel, self.diameter, self.hoogte, self.sliblaag_procent)
+
+    ## Oppervlak onder de grond:
+    # ===================================
+    @property
+    def sliblaag(self):
+        return self.doorsnede[0]
+
+    ## Natte oppervlak duiker:
+    # ===================================
+    @property
+    def nat_opp_duiker(self):
+        return self.doorsnede[1]
+
+    ## Natte omtrek en hydraulische straal:
+    # ===================================
+    @property
+    def natte_omtrek(self):
+        return self.doorsnede[2]
+
+    @property
+    def hydraulische_straal(self):
+        _, nat_opp_duiker, natte_omtrek = self.doorsnede
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return nat_opp_duiker/natte_omtrek
+
+    ## Hydraulische ruwheid:
+    # ===================================
+    @property
+    def ruwheid(self):
+        _, nat_opp_duiker, natte_omtrek = self.doorsnede
+        return self._ruwheid(nat_opp_duiker, natte_omtrek)
+
+    def _ruwheid(self, nat_opp_duiker, natte_omtrek):
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            # Hydraulische straal
+            straal = nat_opp_duiker/natte_omtrek
+            # Chezy coefficient
+            chezy = self.manning * straal**(1.0/6.0)
+            # Intreedverlies Ei
+            Ei = self.intreedweerstand
+            # Uitreedverlies E0
+            E0 = self.uittreedweerstand * (1.0-(nat_opp_duiker/self.ben_str_nat_opp))**2.0
+            # Wrijvingsverlies Ef
+            Ef = (2 * 9.81 * self.lengte) / (chezy**2 * straal)
+            # Totaal weerstand
+            mu = (Ei + E0 + Ef)**-0.5
+        return mu
+
+    ## Opstuwing:
+    # ===================================
+    @property
+    def opstuwing(self):
+        return self.bovenwaterstand - self.benedenwaterstand
+
+    ## Debiet:
+    # ===================================
+    @property
+    def debiet(self):
+        return self._debiet(*self.doorsnede[1:])
+
+    def _debiet(self, nat_opp_duiker, natte_omtrek):
+        # Totaal weerstand
+        mu = self._ruwheid(nat_opp_duiker, natte_omtrek)
+        # Opstuwing, negatief verval wordt gemaskeerd
+        opstuwing = self.opstuwing
+        valhoogte = np.sqrt(2.0 * 9.81 * np.where(opstuwing >= 0, opstuwing, np.nan))
+        # Debiet
+        return mu * nat_opp_duiker * valhoogte
+
+    ## Stroomsnelheid:
+    # ===================================
+    @property
+    def stroomsnelheid(self):
+        # Natte oppervlak duiker
+        _, nat_opp_duiker, natte_omtrek = self.doorsnede
+        # Stroomsnelheid in duiker, 0 bij een volledig dichtgeslibde duiker
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(nat_opp_duiker > 0, self._debiet(nat_opp_duiker, natte_omtrek)/nat_opp_duiker, 0.0)
+
+    ## Geldige rijen:
+    # ===================================
+    @property
+    def geldig(self):
+        # Masker van de rijen met een eindig debiet
+        return np.isfinite(self.debiet)
+
+## Afvoerkromme (Q-h):
+# =============================================================================
+class Afvoerkromme:
+    # Afvoerkromme per duiker voor snelle opvragingen van het debiet bij een
+    # verval. Het verval zit alleen via de wortel in het debiet,
+    #     Q = mu * A * (2 g h)**0.5 = C * h**0.5,
+    # want ruwheid (mu) en natte oppervlak (A) hangen niet van de
+    # waterstanden af. De tabel is dus één coëfficiënt C per duiker en een
+    # opvraging is exact op afronding na (relatieve fout < 1e-15); er hoeft
+    # niet tussen tabelpunten geïnterpoleerd te worden. Negatief verval geeft
+    # NaN, net als DuikerArray.debiet.
+    def __init__(self, duikers: DuikerArray):
+        with np.errstate(all='ignore'):
+            self.coefficient = duikers.ruwheid * duikers.nat_opp_duiker * math.sqrt(2.0 * 9.81)
+
+    def __len__(self):
+        return self.coefficient.shape[0]
+
+    def _coefficient(self, duiker):
+        # Alle duikers, of per opvraging de index van de duiker
+        return self.coefficient if duiker is None else self.coefficient[np.asarray(duiker)]
+
+    def debiet(self, verval, duiker=None):
+        verval = np.asarray(verval, dtype=float)
+        with np.errstate(invalid='ignore'):
+            return self._coefficient(duiker) * np.sqrt(np.where(verval >= 0, verval, np.nan))
+
+    def verval(self, debiet, duiker=None):
+        # Omgekeerde opvraging: verval [m] dat bij het debiet hoort
+        with np.errstate(all='ignore'):
+            return (np.asarray(debiet, dtype=float)/self._coefficient(duiker))**2
+
+    def tabel(self, verval):
+        # Q-h-tabel: een rij per duiker, een kolom per verval
+        verval = np.asarray(verval, dtype=float)
+        with np.errstate(invalid='ignore'):
+            return np.outer(self.coefficient, np.sqrt(np.where(verval >= 0, verval, np.nan)))
+
+    def opslaan(self, pad):
+        np.save(pad, self.coefficient)
+
+    @classmethod
+    def laden(cls, pad):
+        kromme = cls.__new__(cls)
+        kromme.coefficient = np.load(pad)
+        return kromme
+
+
+## Inverse berekeningen:
+# =============================================================================
+def _veilige_newton(functie, laag, hoog, max_iter=50, tol=1e-10):
+    # Gevectoriseerde Newton-iteratie binnen een bracket [laag, hoog]. De
+    # afgeleide wordt met een voorwaartse differentie geschat; valt een
+    # Newton-stap buiten de bracket, dan wordt er gehalveerd. Rijen zonder
+    # tekenwissel tussen laag en hoog hebben geen oplossing en geven NaN.
+    laag, hoog = np.broadcast_arrays(np.asarray(laag, dtype=float), np.asarray(hoog, dtype=float))
+    laag, hoog = laag.copy(), hoog.copy()
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        f_laag = functie(laag)
+        f_hoog = functie(hoog)
+        oplosbaar = np.sign(f_laag) * np.sign(f_hoog) <= 0
+        x = (laag + hoog)/2
+        for _ in range(max_iter):
+            fx = functie(x)
+            # Bracket verkleinen: x vervangt de grens met hetzelfde teken
+            zelfde_als_laag = np.sign(fx) == np.sign(f_laag)
+            laag = np.where(zelfde_als_laag, x, laag)
+            f_laag = np.where(zelfde_als_laag, fx, f_laag)
+            hoog = np.where(zelfde_als_laag, hoog, x)
+            # Newton-stap met numerieke afgeleide
+            stap = 1e-7 * np.maximum(np.abs(x), 1e-3)
+            afgeleide = (functie(x + stap) - fx)/stap
+            x_newton = x - fx/afgeleide
+            ondergrens = np.minimum(laag, hoog)
+            bovengrens = np.maximum(laag, hoog)
+            binnen = np.isfinite(x_newton) & (x_newton > ondergrens) & (x_newton < bovengrens)
+            x_nieuw = np.where(binnen, x_newton, (laag + hoog)/2)
+            klaar = (np.abs(x_nieuw - x) <= tol * (1.0 + np.abs(x))) | (fx == 0)
+            x = np.where(fx == 0, x, x_nieuw)
+            if np.all(klaar | ~oplosbaar):
+                break
+    return np.where(oplosbaar, x, np.nan)
+
+
+def _ontwerp_verval(duikers: DuikerArray, opstuwing):
+    # Rekent met het opgegeven verval in plaats van de waterstanden
+    if opstuwing is None:
+        return duikers
+    return duikers.vervang(bovenwaterstand=opstuwing, benedenwaterstand=0.0)
+
+
+def benodigde_opstuwing(duikers: DuikerArray, debiet):
+    # Opstuwing die nodig is om het debiet [m3/s] door de duikers te voeren
+    # (gesloten vorm van Q = mu * A * (2 g h)**0.5)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        snelheid = np.asarray(debiet, dtype=float)/(duikers.ruwheid * duikers.nat_opp_duiker)
+    return snelheid**2/(2.0 * 9.81)
+
+
+def toelaatbare_lengte(duikers: DuikerArray, debiet, opstuwing=None):
+    # Grootste lengte [m] waarbij het debiet nog bij de opstuwing past. Ook in
+    # gesloten vorm: de lengte zit alleen lineair in het wrijvingsverlies Ef.
+    duikers = _ontwerp_verval(duikers, opstuwing)
+    _, nat_opp_duiker, natte_omtrek = duikers.doorsnede
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mu = np.asarray(debiet, dtype=float)/(nat_opp_duiker * np.sqrt(2.0 * 9.81 * duikers.opstuwing))
+        straal = nat_opp_duiker/natte_omtrek
+        chezy = duikers.manning * straal**(1.0/6.0)
+        E0 = duikers.uittreedweerstand * (1.0-(nat_opp_duiker/duikers.ben_str_nat_opp))**2.0
+        Ef = mu**-2.0 - duikers.intreedweerstand - E0
+        lengte = Ef * chezy**2 * straal/(2 * 9.81)
+    # Negatief: zelfs een duiker zonder lengte voert het debiet niet af
+    return np.where(lengte >= 0, lengte, np.nan)
+
+
+def _top(functie, laag, hoog, iteraties=60):
+    # Gevectoriseerd gulden-snedezoeken naar het maximum van een functie die
+    # op [laag, hoog] eerst stijgt en daarna daalt
+    verhouding = (np.sqrt(5.0) - 1.0)/2.0
+    laag, hoog = np.broadcast_arrays(np.asarray(laag, dtype=float), np.asarray(hoog, dtype=float))
+    laag, hoog = laag.copy(), hoog.copy()
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        links, rechts = hoog - verhouding * (hoog - laag), laag + verhouding * (hoog - laag)
+        f_links, f_rechts = functie(links), functie(rechts)
+        for _ in range(iteraties):
+            # Stijgend: het maximum ligt rechts van links; per rij is één
+            # van beide punten nieuw
+            stijgend = ~(f_links > f_rechts)
+            laag = np.where(stijgend, links, laag)
+            hoog = np.where(stijgend, hoog, rechts)
+            nieuw = np.where(stijgend, laag + verhouding * (hoog - laag), hoog - verhouding * (hoog - laag))
+            f_nieuw = functie(nieuw)
+            links, f_links, rechts, f_rechts = (np.where(stijgend, rechts, nieuw),
+                                                np.where(stijgend, f_rechts, f_nieuw),
+                                                np.where(stijgend, nieuw, links),
+                                                np.where(stijgend, f_nieuw, f_links))
+    return (laag + hoog)/2
+
+
+def benodigde_diameter(duikers: DuikerArray, debiet, opstuwing=None,
+                       diameter_min=0.10, diameter_max=10.0, max_iter=50):
+    # Kleinste diameter [m] waarbij het debiet bij de opstuwing wordt gehaald.
+    # Het debiet stijgt met de diameter zolang het natte oppervlak klein is
+    # ten opzichte van dat benedenstrooms en daalt daarna weer (uittreeverlies);
+    # daarom eerst de top zoeken en dan tussen diameter_min en de top. Geen
+    # oplossing tussen diameter_min en diameter_max geeft NaN.
+    duikers = _ontwerp_verval(duikers, opstuwing)
+    doel = np.asarray(debiet, dtype=float)
+    laag = np.full(len(duikers), diameter_min)
+    top = _top(lambda diameter: duikers.vervang(diameter=diameter).debiet, laag, diameter_max)
+    return _veilige_newton(lambda diameter: duikers.vervang(diameter=diameter).debiet - doel,
+                           laag, top, max_iter=max_iter)
+
+
+def toelaatbare_sliblaag(duikers: DuikerArray, debiet, opstuwing=None, max_iter=50):
+    # Grootste sliblaag (fractie van de hoogte, 0 tot 1) waarbij het debiet
+    # nog bij de opstuwing wordt gehaald. Haalt de schone duiker het debiet
+    # al niet, dan is de uitkomst NaN.
+    duikers = _ontwerp_verval(duikers, opstuwing)
+    doel = np.asarray(debiet, dtype=float)
+    return _veilige_newton(lambda procent: duikers.vervang(sliblaag_procent=procent).debiet - doel,
+                           np.zeros(len(duikers)), 1.0, max_iter=max_iter)
+
+## Duiker kern (één evaluatie, zonder validatie)
+# =============================================================================
+class DuikerResultaat(NamedTuple):
+    sliblaag: float
+    nat_opp_duiker: float
+    ruwheid: float
+    opstuwing: float
+    debiet: float
+    stroomsnelheid: float
+
+
+def bereken_duiker(diameter: float,
+                   lengte: float,
+                   sliblaag_procent: float,
+                   intreedweerstand: float,
+                   uittreedweerstand: float,
+                   ben_str_nat_opp: float,
+                   manning: float,
+                   bovenwaterstand: float,
+                   benedenwaterstand: float,
+                   profiel: str = 'rond',
+                   hoogte: float = None) -> DuikerResultaat:
+    # Zelfde formules als de properties van Duiker, maar elke tussenwaarde
+    # wordt precies één keer berekend.
+    # Oppervlak onder de grond, natte oppervlak en natte omtrek
+    sliblaag, nat_opp_duiker, natte_omtrek = doorsnede_scalair(profiel, diameter, hoogte, sliblaag_procent)
+    if nat_opp_duiker > 0:
+        # Hydraulische straal en Chezy coefficient
+        straal = nat_opp_duiker/natte_omtrek
+        chezy = manning * straal**(1.0/6.0)
+        # Intreedverlies Ei, uittreedverlies E0 en wrijvingsverlies Ef
+        Ei = intreedweerstand
+        E0 = uittreedweerstand * (1.0-(nat_opp_duiker/ben_str_nat_opp))**2.0
+        Ef = (2 * 9.81 * lengte) / (chezy**2 * straal)
+        # Totaal weerstand
+        mu = (Ei + E0 + Ef)**-0.5
+    else:
+        # Volledig dichtgeslibd: geen doorstroming, zoals in DuikerArray
+        mu = 0.0
+    # Opstuwing
+    opstuwing = bovenwaterstand - benedenwaterstand
+    # Debiet en stroomsnelheid
+    debiet = mu * nat_opp_duiker * (2.0 * 9.81 * opstuwing)**0.5
+    stroomsnelheid = debiet/nat_opp_duiker if nat_opp_duiker > 0 else 0.0
+    return DuikerResultaat(sliblaag, nat_opp_duiker, mu, opstuwing, debiet, stroomsnelheid)
+
+
+class DuikerKern:
+    # Onveranderlijke, lichte tegenhanger van Duiker voor gebruik in lussen.
+    # Er wordt niet gevalideerd; dat gebeurt alleen aan de rand (UI/API) in
+    # Duiker. Het resultaat wordt bij de eerste aanvraag één keer berekend.
+    __slots__ = DuikerArray.velden + DuikerArray.profielvelden + ('_resultaat',)
+
+    def __init__(self,
+                 diameter: float,
+                 lengte: float,
+                 sliblaag_procent: float,
+                 intreedweerstand: float,
+                 uittreedweerstand: float,
+                 ben_str_nat_opp: float,
+                 manning: float,
+                 bovenwaterstand: float,
+                 benedenwaterstand: float,
+                 profiel: str = 'rond',
+                 hoogte: float = None):
+        if profiel not in PROFIELEN:
+            raise ValueError(f"onbekend profiel '{profiel}', kies uit {', '.join(PROFIELEN)}")
+        zet = object.__setattr__
+        zet(self, 'diameter', diameter)
+        zet(self, 'lengte', lengte)
+        zet(self, 'sliblaag_procent', sliblaag_procent)
+        zet(self, 'intreedweerstand', intreedweerstand)
+        zet(self, 'uittreedweerstand', uittreedweerstand)
+        zet(self, 'ben_str_nat_opp', ben_str_nat_opp)
+        zet(self, 'manning', manning)
+        zet(self, 'bovenwaterstand', bovenwaterstand)
+        zet(self, 'benedenwaterstand', benedenwaterstand)
+        zet(self, 'profiel', profiel)
+        zet(self, 'hoogte', hoogte)
+        zet(self, '_resultaat', None)
+
+    def __setattr__(self, naam, waarde):
+        raise AttributeError(f'{type(self).__name__} is onveranderlijk')
+
+    def __delattr__(self, naam):
+        raise AttributeError(f'{type(self).__name__} is onveranderlijk')
+
+    def __repr__(self):
+        velden = ', '.join(f'{naam}={getattr(self, naam)!r}'
+                           for naam in DuikerArray.velden + DuikerArray.profielvelden)
+        return f'{type(self).__name__}({velden})'
+
+    def bereken(self) -> DuikerResultaat:
+        resultaat = self._resultaat
+        if resultaat is None:
+            resultaat = bereken_duiker(self.diameter, self.lengte, self.sliblaag_procent,
+                                       self.intreedweerstand, self.uittreedweerstand,
+                                       self.ben_str_nat_opp, self.manning,
+                                       self.bovenwaterstand, self.benedenwaterstand,
+                                       self.profiel, self.hoogte)
+            object.__setattr__(self, '_resultaat', resultaat)
+        return resultaat
+
+
+## Synthetisch register:
+# =============================================================================
+# Vaste, reproduceerbare invoer voor benchmarks en controles (duiker_benchmark,
+# duiker_parallel, duiker_scenario, duiker_ruimte en de tests)
+def synthetisch_register(grootte, seed=0):
+    rng = np.random.default_rng(seed)
+    return DuikerArray(diameter=rng.uniform(0.3, 2.0, grootte),
+                       lengte=rng.uniform(5.0, 100.0, grootte),
+                       sliblaag_procent=rng.uniform(0.0, 0.4, grootte),
+                       intreedweerstand=0.4,
+                       uittreedweerstand=1.0,
+                       ben_str_nat_opp=rng.uniform(5.0, 50.0, grootte),
+                       manning=rng.uniform(40.0, 80.0, grootte),
+                       bovenwaterstand=rng.uniform(0.0, 0.3, grootte),
+                       benedenwaterstand=0.0)
@@ -0,0 +1,210 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from duiker_kern import DuikerArray
+
+## Duiker Monte Carlo
+# =============================================================================
+# Onzekere invoer (manning, sliblaag, in- en uittreedweerstand, ...) wordt
+# als verdeling opgegeven; de overige velden blijven vast. Trekkingen gebeuren
+# in blokken en alleen een samenvatting (aantal, som, min/max en een
+# histogram met vaste randen) wordt bewaard, zodat 10**7 trekkingen per
+# duiker geen 10**7 getallen in het geheugen vragen.
+#
+#   verdelingen = {'manning': Normaal(75, 5, ondergrens=20),
+#                  'sliblaag_procent': Uniform(0.0, 0.2),
+#                  'intreedweerstand': Driehoek(0.3, 0.4, 0.6)}
+#   samenvatting = monte_carlo(duiker.dict(), verdelingen, aantal=10**7, seed=1)
+#   samenvatting.percentielen((5, 50, 95))
+#
+# Elke deelreeks heeft een eigen seed uit np.random.SeedSequence(seed), dus
+# de uitkomst hangt niet af van het aantal processen.
+
+
+## Verdelingen:
+# ===================================
+class Normaal(NamedTuple):
+    gemiddelde: float
+    standaardafwijking: float
+    ondergrens: float = -math.inf
+    bovengrens: float = math.inf
+
+    def trek(self, rng, aantal):
+        waarden = rng.normal(self.gemiddelde, self.standaardafwijking, aantal)
+        return np.clip(waarden, self.ondergrens, self.bovengrens)
+
+
+class LogNormaal(NamedTuple):
+    # Mediaan en spreiding van de natuurlijke logaritme
+    mediaan: float
+    sigma: float
+
+    def trek(self, rng, aantal):
+        return rng.lognormal(math.log(self.mediaan), self.sigma, aantal)
+
+
+class Uniform(NamedTuple):
+    minimum: float
+    maximum: float
+
+    def trek(self, rng, aantal):
+        return rng.uniform(self.minimum, self.maximum, aantal)
+
+
+class Driehoek(NamedTuple):
+    minimum: float
+    modus: float
+    maximum: float
+
+    def trek(self, rng, aantal):
+        return rng.triangular(self.minimum, self.modus, self.maximum, aantal)
+
+
+## Samenvatting:
+# ===================================
+class Samenvatting:
+    # Lopende samenvatting van een reeks trekkingen met vaste histogramranden.
+    # Waarden buiten de randen worden apart geteld (onder/boven); NaN-waarden
+    # tellen als ongeldig.
+    def __init__(self, randen):
+        self.randen = np.asarray(randen, dtype=float)
+        self.histogram = np.zeros(len(self.randen) - 1, dtype=np.int64)
+        self.onder = 0
+        self.boven = 0
+        self.aantal = 0
+        self.ongeldig = 0
+        self.som = 0.0
+        self.kwadratensom = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def voeg_toe(self, waarden):
+        geldig = np.isfinite(waarden)
+        self.ongeldig += int(waarden.size - np.count_nonzero(geldig))
+        waarden = waarden[geldig]
+        if waarden.size == 0:
+            return
+        self.aantal += int(waarden.size)
+        self.som += float(waarden.sum())
+        self.kwadratensom += float(np.dot(waarden, waarden))
+        self.minimum = min(self.minimum, float(waarden.min()))
+        self.maximum = max(self.maximum, float(waarden.max()))
+        self.onder += int(np.count_nonzero(waarden < self.randen[0]))
+        self.boven += int(np.count_nonzero(waarden > self.randen[-1]))
+        self.histogram += np.histogram(waarden, bins=self.randen)[0]
+
+    def samenvoegen(self, ander):
+        self.histogram += ander.histogram
+        self.onder += ander.onder
+        self.boven += ander.boven
+        self.aantal += ander.aantal
+        self.ongeldig += ander.ongeldig
+        self.som += ander.som
+        self.kwadratensom += ander.kwadratensom
+        self.minimum = min(self.minimum, ander.minimum)
+        self.maximum = max(self.maximum, ander.maximum)
+        return self
+
+    @property
+    def gemiddelde(self):
+        return self.som/self.aantal if self.aantal else math.nan
+
+    @property
+    def standaardafwijking(self):
+        if self.aantal < 2:
+            return math.nan
+        variantie = (self.kwadratensom - self.som**2/self.aantal)/(self.aantal - 1)
+        return math.sqrt(max(variantie, 0.0))
+
+    def percentielen(self, percentielen=(5, 50, 95)):
+        # Lineaire interpolatie binnen de histogramklassen; de fout is hooguit
+        # één klassebreedte. Onder- en overloop lopen tot het minimum en maximum.
+        if self.aantal == 0:
+            return {p: math.nan for p in percentielen}
+        randen = np.concatenate(([min(self.minimum, self.randen[0])], self.randen,
+                                 [max(self.maximum, self.randen[-1])]))
+        tellingen = np.concatenate(([self.onder], self.histogram, [self.boven]))
+        cumulatief = np.concatenate(([0], np.cumsum(tellingen)))
+        uitkomst = {}
+        for p in percentielen:
+            rang = p/100 * self.aantal
+            klasse = int(np.clip(np.searchsorted(cumulatief, rang, side='left') - 1, 0, len(tellingen) - 1))
+            in_klasse = tellingen[klasse]
+            fractie = (rang - cumulatief[klasse])/in_klasse if in_klasse else 0.0
+            waarde = randen[klasse] + fractie * (randen[klasse + 1] - randen[klasse])
+            uitkomst[p] = float(np.clip(waarde, self.minimum, self.maximum))
+        return uitkomst
+
+
+## Trekken en rekenen:
+# ===================================
+def _trek_blok(vaste_velden, verdelingen, rng, aantal, grootheid):
+    velden = dict(vaste_velden)
+    for veld, verdeling in verdelingen.items():
+        velden[veld] = verdeling.trek(rng, aantal)
+    duikers = DuikerArray(**velden)
+    with np.errstate(all='ignore'):
+        return np.broadcast_to(getattr(duikers, grootheid), (aantal,))
+
+
+def _deelreeks(vaste_velden, verdelingen, seed, aantal, blokgrootte, randen, grootheid):
+    # Eén deelreeks met een eigen seed; draait ook in een werkproces
+    rng = np.random.default_rng(seed)
+    samenvatting = Samenvatting(randen)
+    while aantal > 0:
+        blok = min(blokgrootte, aantal)
+        samenvatting.voeg_toe(_trek_blok(vaste_velden, verdelingen, rng, blok, grootheid))
+        aantal -= blok
+    return samenvatting
+
+
+def _histogramranden(vaste_velden, verdelingen, seed, grootheid, klassen, proefaantal=100_000):
+    # Randen uit een proeftrekking met een eigen seed, met wat marge
+    waarden = _trek_blok(vaste_velden, verdelingen, np.random.default_rng(seed), proefaantal, grootheid)
+    waarden = waarden[np.isfinite(waarden)]
+    if waarden.size == 0:
+        return np.linspace(0.0, 1.0, klassen + 1)
+    laag, hoog = float(waarden.min()), float(waarden.max())
+    marge = 0.25 * (hoog - laag) or 0.25 * abs(hoog) or 1.0
+    ondergrens = laag - marge
+    if laag >= 0:
+        ondergrens = max(ondergrens, 0.0)
+    return np.linspace(ondergrens, hoog + marge, klassen + 1)
+
+
+def iter_monte_carlo(duiker, verdelingen, aantal=1_000_000, seed=0, deelreeks=1_000_000,
+                     blokgrootte=100_000, processen=1, grootheid='debiet', klassen=4000):
+    # Geeft na elke afgeronde deelreeks de samenvatting tot dan toe
+    vaste_velden = {veld: duiker[veld] for veld in DuikerArray.velden if veld not in verdelingen}
+    vaste_velden.update(DuikerArray.profiel_uit_dict(duiker))
+    onbekend = set(verdelingen) - set(DuikerArray.velden)
+    if onbekend:
+        raise ValueError(f"onbekende velden in verdelingen: {', '.join(sorted(onbekend))}")
+    aantallen = [deelreeks] * (aantal // deelreeks) + ([aantal % deelreeks] if aantal % deelreeks else [])
+    proef_seed, *seeds = np.random.SeedSequence(seed).spawn(len(aantallen) + 1)
+    randen = _histogramranden(vaste_velden, verdelingen, proef_seed, grootheid, klassen)
+    totaal = Samenvatting(randen)
+    argumenten = [(vaste_velden, verdelingen, s, n, blokgrootte, randen, grootheid)
+                  for s, n in zip(seeds, aantallen)]
+    if processen == 1:
+        for argument in argumenten:
+            yield totaal.samenvoegen(_deelreeks(*argument))
+        return
+    with ProcessPoolExecutor(max_workers=processen or os.cpu_count()) as pool:
+        for deel in pool.map(_deelreeks, *zip(*argumenten)):
+            yield totaal.samenvoegen(deel)
+
+
+def monte_carlo(duiker, verdelingen, aantal=1_000_000, seed=0, deelreeks=1_000_000,
+                blokgrootte=100_000, processen=1, grootheid='debiet', klassen=4000):
+    # duiker: dict met de velden van Duiker (bijvoorbeeld Duiker.dict());
+    # processen=None gebruikt alle kernen
+    samenvatting = Samenvatting(np.linspace(0.0, 1.0, klassen + 1))
+    for samenvatting in iter_monte_carlo(duiker, verdelingen, aantal, seed, deelreeks,
+                                         blokgrootte, processen, grootheid, klassen):
+        pass
+    return samenvatting
@@ -0,0 +1,232 @@
+import argparse
+import sys
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from scipy.sparse import csgraph
+
+from duiker_kern import Afvoerkromme, DuikerArray
+
+## Duiker netwerk
+# =============================================================================
+# Waterstanden in een polder met duikers in serie en in takken. Knopen zijn
+# de peilvakken/watergangen (genummerd 0 .. aantal_knopen-1), duikers zijn
+# de verbindingen van knoop `van` naar knoop `naar`. Op sommige knopen ligt
+# het peil vast (randpeilen, bijvoorbeeld een gemaal of boezem); op de
+# overige knopen moet de waterbalans sluiten:
+#
+#     instroom + som(Q in) - som(Q uit) = 0
+#
+# met per duiker Q = C * teken(h_van - h_naar) * |h_van - h_naar|**0.5 en
+# C de coëfficiënt van de afvoerkromme. Alle onbekende peilen worden in één
+# keer opgelost met Newton-iteraties op een ijle Jacobiaan (scipy.sparse).
+# De Jacobiaan is analytisch. Rond nul verval wordt de wortel gladgemaakt:
+#
+#     Q = C * dh / (dh**2 + eps**2)**0.25
+#
+# zodat de afgeleide eindig blijft; voor |dh| >> eps is dit gelijk aan de
+# gewone relatie. Newton vanaf vlakke peilen convergeert slecht omdat de
+# wortel bij nul verval steil is; daarom gaan er eerst enkele
+# Picard-stappen aan vooraf (lineair stelsel met Q = K * dh en
+# K = C/|dh|**0.5 van de vorige stap). Bij terugstroming worden intreed- en
+# uittreedweerstand verwisseld. De waterstanden in de DuikerArray worden
+# niet gebruikt.
+#
+#   python duiker_netwerk.py duikers.csv knopen.csv debiet.csv --waterstanden peilen.csv
+#
+# geconvergeerd is False als de waterbalans na max_iter stappen, of omdat
+# de gedempte stap niets meer verbetert, nog niet binnen tol sluit; de
+# waterstanden zijn dan de beste benadering.
+
+
+class NetwerkResultaat(NamedTuple):
+    waterstanden: np.ndarray
+    debiet: np.ndarray
+    opstuwing: np.ndarray
+    iteraties: int
+    residu: float
+    geconvergeerd: bool
+
+
+class DuikerNetwerk:
+    def __init__(self, duikers: DuikerArray, van, naar, aantal_knopen=None, eps=1e-12):
+        self.van = np.asarray(van, dtype=np.int64)
+        self.naar = np.asarray(naar, dtype=np.int64)
+        if self.van.shape != (len(duikers),) or self.naar.shape != (len(duikers),):
+            raise ValueError('van en naar moeten een knoop per duiker bevatten')
+        if aantal_knopen is None:
+            aantal_knopen = int(max(self.van.max(initial=-1), self.naar.max(initial=-1))) + 1
+        self.aantal_knopen = aantal_knopen
+        self.eps = eps
+        terug = duikers.vervang(intreedweerstand=duikers.uittreedweerstand,
+                                uittreedweerstand=duikers.intreedweerstand)
+        self.c_voor = Afvoerkromme(duikers).coefficient
+        self.c_terug = Afvoerkromme(terug).coefficient
+        if not (np.all(np.isfinite(self.c_voor)) and np.all(np.isfinite(self.c_terug))):
+            raise ValueError('niet elke duiker heeft een eindige afvoercoëfficiënt')
+
+    ## Debiet per duiker:
+    # ===================================
+    def debiet(self, waterstanden):
+        verval = waterstanden[self.van] - waterstanden[self.naar]
+        c = np.where(verval >= 0, self.c_voor, self.c_terug)
+        return np.sign(verval) * c * np.sqrt(np.abs(verval))
+
+    def _glad_debiet(self, waterstanden):
+        # Gladde Q(dh) en dQ/dh voor de Newton-iteraties
+        verval = waterstanden[self.van] - waterstanden[self.naar]
+        c = np.where(verval >= 0, self.c_voor, self.c_terug)
+        noemer = verval**2 + self.eps**2
+        debiet = c * verval * noemer**-0.25
+        afgeleide = c * (0.5 * verval**2 + self.eps**2) * noemer**-1.25
+        return debiet, afgeleide
+
+    ## Oplossen:
+    # ===================================
+    def los_op(self, randknopen, randpeilen, instroom=None, begin=None, tol=1e-9, max_iter=50,
+               picard=8, start_verval=0.01):
+        # randknopen/randpeilen: knopen met een vast peil [+mNAP];
+        # instroom: externe toevoer per knoop [m3/s] (negatief = onttrekking);
+        # tol: toegestane rest van de waterbalans per knoop [m3/s]
+        n = self.aantal_knopen
+        randknopen = np.asarray(randknopen, dtype=np.int64)
+        vast = np.zeros(n, dtype=bool)
+        vast[randknopen] = True
+        vrij = np.flatnonzero(~vast)
+        positie = np.full(n, -1, dtype=np.int64)
+        positie[vrij] = np.arange(vrij.size)
+        self._controleer_verbonden(vast)
+
+        instroom = np.zeros(n) if instroom is None else np.broadcast_to(np.asarray(instroom, dtype=float), (n,))
+        if begin is None:
+            waterstanden = np.full(n, float(np.mean(randpeilen)))
+        else:
+            waterstanden = np.array(begin, dtype=float)
+        waterstanden[randknopen] = randpeilen
+
+        # Vaste structuur van de Jacobiaan: elke duiker raakt twee knopen
+        rijen = np.concatenate((self.van, self.van, self.naar, self.naar))
+        kolommen = np.concatenate((self.van, self.naar, self.van, self.naar))
+        in_stelsel = (positie[rijen] >= 0) & (positie[kolommen] >= 0)
+        rijen_vrij, kolommen_vrij = positie[rijen[in_stelsel]], positie[kolommen[in_stelsel]]
+
+        def rest_van(debiet):
+            rest = instroom - np.bincount(self.van, weights=debiet, minlength=n) \
+                + np.bincount(self.naar, weights=debiet, minlength=n)
+            return rest[vrij]
+
+        def balans(waterstanden):
+            debiet, afgeleide = self._glad_debiet(waterstanden)
+            return rest_van(debiet), afgeleide
+
+        def stap_voor(rest, afgeleide):
+            # d(rest_van)/dh_van = -a, d(rest_van)/dh_naar = +a,
+            # d(rest_naar)/dh_van = +a, d(rest_naar)/dh_naar = -a
+            waarden = np.concatenate((-afgeleide, afgeleide, afgeleide, -afgeleide))[in_stelsel]
+            jacobiaan = sp.csc_matrix((waarden, (rijen_vrij, kolommen_vrij)), shape=(vrij.size, vrij.size))
+            return spla.spsolve(jacobiaan, -rest)
+
+        # Picard-stappen voor een startpunt
+        verval = np.full(self.van.size, start_verval)
+        for _ in range(picard):
+            c = np.where(verval >= 0, self.c_voor, self.c_terug)
+            geleiding = c/np.sqrt(np.maximum(np.abs(verval), self.eps))
+            verval = waterstanden[self.van] - waterstanden[self.naar]
+            waterstanden[vrij] += stap_voor(rest_van(geleiding * verval), geleiding)
+            verval = waterstanden[self.van] - waterstanden[self.naar]
+
+        rest, afgeleide = balans(waterstanden)
+        norm = np.max(np.abs(rest), initial=0.0)
+        iteratie = 0
+        while norm > tol and iteratie < max_iter:
+            iteratie += 1
+            stap = stap_voor(rest, afgeleide)
+            # Gedempte stap: halveren tot de waterbalans verbetert. Lukt dat
+            # niet meer, dan is de afrondingsgrens bereikt en stoppen we.
+            factor = 1.0
+            while factor >= 1e-6:
+                proef = waterstanden.copy()
+                proef[vrij] += factor * stap
+                proef_rest, proef_afgeleide = balans(proef)
+                proef_norm = np.max(np.abs(proef_rest), initial=0.0)
+                if proef_norm < norm:
+                    break
+                factor /= 2
+            else:
+                break
+            waterstanden, rest, afgeleide, norm = proef, proef_rest, proef_afgeleide, proef_norm
+
+        debiet = self.debiet(waterstanden)
+        return NetwerkResultaat(waterstanden=waterstanden,
+                                debiet=debiet,
+                                opstuwing=waterstanden[self.van] - waterstanden[self.naar],
+                                iteraties=iteratie,
+                                residu=float(norm),
+                                geconvergeerd=bool(norm <= tol))
+
+    def _controleer_verbonden(self, vast):
+        # Elke knoop moet via duikers met een randpeil verbonden zijn, anders
+        # is het stelsel singulier
+        graaf = sp.coo_matrix((np.ones(self.van.size), (self.van, self.naar)),
+                              shape=(self.aantal_knopen, self.aantal_knopen))
+        _, label = csgraph.connected_components(graaf, directed=False)
+        verbonden = np.zeros(label.max() + 1, dtype=bool)
+        verbonden[label[vast]] = True
+        los = np.flatnonzero(~verbonden[label])
+        if los.size:
+            raise ValueError(f'{los.size} knopen zijn niet met een randpeil verbonden, '
+                             f'bijvoorbeeld knoop {los[0]}')
+
+
+## Opdrachtregel:
+# ===================================
+def main(argv=None):
+    from duiker_batch import duikers_uit_blok
+
+    parser = argparse.ArgumentParser(description='Duiker tool: waterstanden in een netwerk van duikers.')
+    parser.add_argument('duikers', help="CSV met per duiker de kolommen van duiker_batch (zonder verval) "
+                                        "plus 'van' en 'naar' (knoopnummers)")
+    parser.add_argument('knopen', help="CSV met 'knoop', 'randpeil' [+mNAP] (leeg: vrije knoop) "
+                                       "en optioneel 'instroom' [m3/s]")
+    parser.add_argument('uitvoer', help='CSV met debiet en opstuwing per duiker')
+    parser.add_argument('--waterstanden', help='CSV met de waterstand per knoop')
+    parser.add_argument('--sliblaag', choices=('percentage', 'cm'), default='percentage')
+    parser.add_argument('--tol', type=float, default=1e-9, help='toegestane rest van de waterbalans [m3/s]')
+    parser.add_argument('--max-iter', type=int, default=50)
+    args = parser.parse_args(argv)
+    try:
+        tabel = pd.read_csv(args.duikers)
+        knopen = pd.read_csv(args.knopen)
+        # Het verval doet niet mee; de waterstanden volgen uit het netwerk
+        duikers = duikers_uit_blok(tabel.assign(verval=0.0), keuze_sliblaag=args.sliblaag)
+        van, naar = tabel['van'].to_numpy(dtype=np.int64), tabel['naar'].to_numpy(dtype=np.int64)
+        knoop = knopen['knoop'].to_numpy(dtype=np.int64)
+        aantal_knopen = int(max(van.max(initial=-1), naar.max(initial=-1), knoop.max(initial=-1))) + 1
+        randpeil = pd.to_numeric(knopen['randpeil'], errors='coerce').to_numpy(dtype=float)
+        rand = np.isfinite(randpeil)
+        instroom = np.zeros(aantal_knopen)
+        if 'instroom' in knopen.columns:
+            np.add.at(instroom, knoop, knopen['instroom'].fillna(0.0).to_numpy(dtype=float))
+        netwerk = DuikerNetwerk(duikers, van, naar, aantal_knopen)
+        resultaat = netwerk.los_op(knoop[rand], randpeil[rand], instroom, tol=args.tol, max_iter=args.max_iter)
+    except (KeyError, ValueError, OSError) as fout:
+        print(f'fout: {fout}', file=sys.stderr)
+        return 1
+    tabel.assign(debiet=resultaat.debiet, opstuwing=resultaat.opstuwing).to_csv(args.uitvoer, index=False)
+    if args.waterstanden:
+        pd.DataFrame(dict(knoop=np.arange(aantal_knopen), waterstand=resultaat.waterstanden)).to_csv(
+            args.waterstanden, index=False)
+    print(f'{len(duikers)} duikers, {aantal_knopen} knopen: {resultaat.iteraties} iteraties, '
+          f'residu {resultaat.residu:.1e} m3/s', file=sys.stderr)
+    if not resultaat.geconvergeerd:
+        print(f'niet geconvergeerd: residu boven --tol {args.tol:g}; de uitvoer is een benadering',
+              file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from duiker_kern import DuikerArray, synthetisch_register
+
+## Duiker parallel
+# =============================================================================
+# Rekent grote registers (miljoenen duikers, eventueel maal tientallen
+# scenario's) op meerdere kernen door. De invoerkolommen staan één keer in
+# gedeeld geheugen (multiprocessing.shared_memory); elke werker krijgt alleen
+# de naam van dat geheugen en een reeks rijen (een shard), leest zijn rijen
+# zonder kopie en schrijft ruwheid, debiet en stroomsnelheid direct in een
+# vooraf gereserveerde gedeelde uitvoerbuffer. Er gaan dus geen duikers of
+# arrays door pickle, alleen namen en getallen.
+#
+#   with ParallelRekenaar(processen=8) as rekenaar:
+#       with rekenaar.bereken(duikers, scenarios=[{}, {'manning': 60.0}]) as resultaat:
+#           resultaat.debiet        # (scenario's, duikers)
+#
+#   python duiker_parallel.py --grootte 1e7 --processen 1 2 4 8   # schaalbenchmark
+#
+# Een scenario is een dict met velden van Duiker en een vaste waarde, die
+# voor alle duikers de kolom vervangt. De resultaten zijn gelijk aan die van
+# DuikerArray; de arrays in ParallelResultaat blijven geldig tot sluit().
+
+PARALLEL_RESULTATEN = ('ruwheid', 'debiet', 'stroomsnelheid')
+# Rijen in de gedeelde invoer; de profielcode staat er als float in
+INVOERVELDEN = DuikerArray.velden + DuikerArray.profielvelden
+
+
+## Gedeeld geheugen:
+# ===================================
+class GedeeldeArray:
+    # Een float64-array in gedeeld geheugen. De maker ruimt het geheugen op
+    # met sluit(); werkers koppelen met koppel(naam, vorm) en sluiten alleen.
+    def __init__(self, vorm, naam=None):
+        self.vorm = tuple(vorm)
+        grootte = max(int(np.prod(self.vorm)) * 8, 1)
+        self.eigenaar = naam is None
+        self._geheugen = shared_memory.SharedMemory(name=naam, create=self.eigenaar, size=grootte)
+        self.array = np.ndarray(self.vorm, dtype=np.float64, buffer=self._geheugen.buf)
+
+    @classmethod
+    def koppel(cls, naam, vorm):
+        return cls(vorm, naam=naam)
+
+    @property
+    def naam(self):
+        return self._geheugen.name
+
+    def sluit(self):
+        if self._geheugen is None:
+            return
+        # Eerst de view loslaten, anders weigert mmap het sluiten
+        self.array = None
+        self._geheugen.close()
+        if self.eigenaar:
+            self._geheugen.unlink()
+        self._geheugen = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.sluit()
+
+
+def _reken_shard(invoer_naam, uitvoer_naam, aantal, scenarios, begin, eind, blok):
+    # Draait in een werker: rijen begin..eind voor alle scenario's
+    invoer = GedeeldeArray.koppel(invoer_naam, (len(INVOERVELDEN), aantal))
+    uitvoer = GedeeldeArray.koppel(uitvoer_naam, (len(scenarios), len(PARALLEL_RESULTATEN), aantal))
+    try:
+        for rij in range(begin, eind, blok):
+            stuk = slice(rij, min(rij + blok, eind))
+            kolommen = {veld: invoer.array[i, stuk] for i, veld in enumerate(INVOERVELDEN)}
+            kolommen['profiel'] = kolommen['profiel'].astype(np.int8)
+            for s, scenario in enumerate(scenarios):
+                duikers = DuikerArray(**dict(kolommen, **scenario))
+                with np.errstate(all='ignore'):
+                    _, nat_opp_duiker, natte_omtrek = duikers.doorsnede
+                    ruwheid = duikers._ruwheid(nat_opp_duiker, natte_omtrek)
+                    debiet = duikers._debiet(nat_opp_duiker, natte_omtrek)
+                    uitvoer.array[s, 0, stuk] = ruwheid
+                    uitvoer.array[s, 1, stuk] = debiet
+                    uitvoer.array[s, 2, stuk] = np.where(nat_opp_duiker > 0, debiet/nat_opp_duiker, 0.0)
+    finally:
+        invoer.sluit()
+        uitvoer.sluit()
+    return eind - begin
+
+
+## Rekenen:
+# ===================================
+class ParallelResultaat:
+    # Views op de gedeelde uitvoerbuffer: (scenario's, duikers), of (duikers,)
+    # als er zonder scenario's gerekend is
+    def __init__(self, buffer: GedeeldeArray, scenarios, seconden):
+        self._buffer = buffer
+        self.scenarios = scenarios
+        self.seconden = seconden
+        for i, naam in enumerate(PARALLEL_RESULTATEN):
+            kolom = buffer.array[:, i, :]
+            setattr(self, naam, kolom if scenarios is not None else kolom[0])
+
+    @property
+    def rijen_per_seconde(self):
+        rijen = self._buffer.vorm[0] * self._buffer.vorm[2]
+        return rijen/max(self.seconden, 1e-9)
+
+    def sluit(self):
+        for naam in PARALLEL_RESULTATEN:
+            setattr(self, naam, None)
+        self._buffer.sluit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.sluit()
+
+
+class ParallelRekenaar:
+    # Houdt een pool van werkers aan, zodat het opstarten maar één keer
+    # betaald wordt. shards_per_proces > 1 verdeelt het werk beter als niet
+    # elke kern even snel is.
+    def __init__(self, processen=None, shards_per_proces=4, blok=65_536):
+        self.processen = processen or os.cpu_count()
+        self.shards_per_proces = shards_per_proces
+        self.blok = blok
+        self._pool = ProcessPoolExecutor(max_workers=self.processen)
+
+    def _shards(self, aantal):
+        # Grenzen op een veelvoud van blok, hooguit processen*shards_per_proces stuks
+        if aantal == 0:
+            return []
+        shards = max(1, min(self.processen * self.shards_per_proces, math.ceil(aantal/self.blok)))
+        stap = math.ceil(math.ceil(aantal/shards)/self.blok) * self.blok
+        return [(begin, min(begin + stap, aantal)) for begin in range(0, aantal, stap)]
+
+    def bereken(self, duikers: DuikerArray, scenarios=None):
+        lijst = [{}] if scenarios is None else [dict(scenario) for scenario in scenarios]
+        for scenario in lijst:
+            onbekend = set(scenario) - set(DuikerArray.velden)
+            if onbekend:
+                raise ValueError(f"onbekende velden in scenario: {', '.join(sorted(onbekend))}")
+            if any(np.ndim(waarde) for waarde in scenario.values()):
+                raise ValueError('een scenario vervangt een veld door één waarde; '
+                                 'gebruik DuikerArray.vervang voor hele kolommen')
+            scenario.update({veld: float(waarde) for veld, waarde in scenario.items()})
+
+        aantal = len(duikers)
+        start = time.perf_counter()
+        uitvoer = GedeeldeArray((len(lijst), len(PARALLEL_RESULTATEN), aantal))
+        try:
+            with GedeeldeArray((len(INVOERVELDEN), aantal)) as invoer:
+                for i, veld in enumerate(INVOERVELDEN):
+                    invoer.array[i] = getattr(duikers, veld)
+                taken = [self._pool.submit(_reken_shard, invoer.naam, uitvoer.naam, aantal, lijst,
+                                           begin, eind, self.blok)
+                         for begin, eind in self._shards(aantal)]
+                for taak in taken:
+                    taak.result()
+        except BaseException:
+            uitvoer.sluit()
+            raise
+        return ParallelResultaat(uitvoer, scenarios, time.perf_counter() - start)
+
+    def sluit(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.sluit()
+
+
+## Schaalbenchmark:
+# ===================================
+def schaalbenchmark(grootte=10_000_000, processen=(1, 2, 4), scenarios=1, herhalingen=3, meld=print):
+    # Beste doorvoer per aantal processen en de efficiëntie t.o.v. één proces
+    duikers = synthetisch_register(grootte)
+    lijst = [{'manning': 40.0 + 40.0 * s/max(scenarios - 1, 1)} for s in range(scenarios)]
+    uitkomsten = {}
+    for aantal in processen:
+        with ParallelRekenaar(processen=aantal) as rekenaar:
+            rekenaar.bereken(synthetisch_register(1000)).sluit()  # werkers opstarten
+            doorvoer = 0.0
+            for _ in range(herhalingen):
+                with rekenaar.bereken(duikers, lijst) as resultaat:
+                    doorvoer = max(doorvoer, resultaat.rijen_per_seconde)
+        uitkomsten[aantal] = doorvoer
+        basis = uitkomsten.get(processen[0], doorvoer) / processen[0]
+        meld(f'{aantal:3d} processen: {doorvoer:16,.0f} rijen/s, '
+             f'versnelling {doorvoer/basis:5.2f}, efficiëntie {doorvoer/basis/aantal:5.0%}')
+    return uitkomsten
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Duiker tool: schaalbenchmark van het parallelle rekenen.')
+    parser.add_argument('--grootte', type=float, default=1e7, help='aantal duikers')
+    parser.add_argument('--scenarios', type=int, default=1, help="aantal scenario's (verschillende manning)")
+    parser.add_argument('--processen', type=int, nargs='+', help='aantallen processen (standaard 1, 2, 4, ... tot alle kernen)')
+    parser.add_argument('--herhalingen', type=int, default=3)
+    args = parser.parse_args(argv)
+    processen = args.processen or [2**i for i in range(int(math.log2(os.cpu_count())) + 1)]
+    print(f'{os.cpu_count()} kernen, {int(args.grootte):,} duikers x {args.scenarios} scenario\'s', file=sys.stderr)
+    schaalbenchmark(int(args.grootte), processen, args.scenarios, args.herhalingen,
+                    meld=lambda tekst: print(tekst, file=sys.stderr))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
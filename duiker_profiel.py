@@ -0,0 +1,141 @@
+import numpy as np
+import plotly.graph_objects as go
+
+from duiker_kern import DuikerArray
+
+## Lengteprofiel van een watergang
+# =============================================================================
+# Eén figuur voor honderden tot duizenden duikers achter elkaar langs de
+# watergang. Per soort (duikerlichamen, waterstand, opstuwing) is er één
+# WebGL-trace (Scattergl); polygonen van losse duikers worden met NaN-gaten
+# in dezelfde trace gezet. Bij veel duikers in beeld wordt het profiel per
+# klasse langs de afstand vereenvoudigd (omhullende van de duikers en per
+# klasse eerste/minimum/maximum/laatste punt van de lijnen), zodat de
+# browser nooit meer dan enkele duizenden punten hoeft te tekenen.
+#
+#   fig = lengteprofiel_figuur(duikers, afstand, bereik=(2000.0, 3500.0))
+#
+# afstand is de ligging [m] van het midden van elke duiker langs de
+# watergang. De vereenvoudiging hoort bij het bereik waarmee de figuur is
+# gemaakt; zoomen in de browser rekent niets opnieuw uit. Wie wil inzoomen
+# tot op losse duikerlichamen maakt de figuur opnieuw met het zichtbare
+# bereik (bijvoorbeeld uit een relayout-gebeurtenis in Dash of een
+# FigureWidget). De Streamlit-app gebruikt deze figuur niet: st.plotly_chart
+# geeft geen zoomgebeurtenissen door.
+
+
+## Vereenvoudiging:
+# ===================================
+def _klassen(x, klassen, bereik):
+    randen = np.linspace(bereik[0], bereik[1], klassen + 1)
+    return np.clip(np.searchsorted(randen, x, side='right') - 1, 0, klassen - 1)
+
+
+def min_max_decimatie(x, y, klassen, bereik=None):
+    # Houdt per klasse het eerste, laagste, hoogste en laatste punt, in
+    # volgorde van x. Pieken en dalen blijven zo zichtbaar.
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.size <= 4 * klassen:
+        return x, y
+    volgorde = np.argsort(x, kind='stable')
+    x, y = x[volgorde], y[volgorde]
+    bereik = bereik or (x[0], x[-1])
+    klasse = _klassen(x, klassen, bereik)
+    grenzen = np.flatnonzero(np.diff(klasse)) + 1
+    begin = np.concatenate(([0], grenzen))
+    eind = np.concatenate((grenzen, [x.size])) - 1
+    # Index van minimum en maximum per klasse via gesorteerde (klasse, y)
+    op_waarde = np.lexsort((y, klasse))
+    laagste = op_waarde[begin]
+    hoogste = op_waarde[eind]
+    gekozen = np.unique(np.concatenate((begin, laagste, hoogste, eind)))
+    return x[gekozen], y[gekozen]
+
+
+## Geometrie:
+# ===================================
+def _vierhoeken(x_links, x_rechts, boven_links, boven_rechts, hoogte):
+    # Gesloten vierhoeken, gescheiden door NaN, als één lijst punten
+    n = len(x_links)
+    x = np.column_stack((x_links, x_links, x_rechts, x_rechts, x_links, np.full(n, np.nan)))
+    y = np.column_stack((boven_links - hoogte, boven_links, boven_rechts,
+                         boven_rechts - hoogte, boven_links - hoogte, np.full(n, np.nan)))
+    return x.ravel(), y.ravel()
+
+
+def _waterlijn(x_links, x_rechts, boven, beneden):
+    volgorde = np.argsort(x_links, kind='stable')
+    x = np.column_stack((x_links[volgorde], x_rechts[volgorde])).ravel()
+    y = np.column_stack((boven[volgorde], beneden[volgorde])).ravel()
+    return x, y
+
+
+## Figuur:
+# ===================================
+def lengteprofiel_figuur(duikers: DuikerArray, afstand, bereik=None, max_duikers=1000, klassen=500,
+                         breedte=1100, hoogte=450):
+    afstand = np.broadcast_to(np.asarray(afstand, dtype=float), (len(duikers),))
+    x_links = afstand - duikers.lengte/2.0
+    x_rechts = afstand + duikers.lengte/2.0
+    if bereik is None:
+        bereik = (float(x_links.min()), float(x_rechts.max())) if len(duikers) else (0.0, 1.0)
+    in_beeld = (x_rechts >= bereik[0]) & (x_links <= bereik[1])
+    index = np.flatnonzero(in_beeld)
+
+    boven = duikers.bovenwaterstand[index]
+    beneden = duikers.benedenwaterstand[index]
+    diameter = duikers.diameter[index]
+    midden = afstand[index]
+    links, rechts = x_links[index], x_rechts[index]
+    with np.errstate(all='ignore'):
+        opstuwing = duikers.opstuwing[index]
+        debiet = duikers.debiet[index]
+
+    fig = go.Figure(layout=go.Layout(autosize=True, width=breedte, height=hoogte,
+                                     margin=dict(l=20, r=20, t=40, b=20),
+                                     template='simple_white',
+                                     xaxis=dict(title='Afstand [m]', range=list(bereik)),
+                                     yaxis=dict(title='Hoogte [m]'),
+                                     yaxis2=dict(title='Opstuwing [m]', overlaying='y', side='right',
+                                                 showgrid=False)))
+    vereenvoudigd = index.size > max_duikers
+    if vereenvoudigd:
+        # Omhullende van alle duikers per klasse
+        klasse = _klassen(midden, klassen, bereik)
+        bezet = np.unique(klasse)
+        k_links = np.full(klassen, np.inf)
+        k_rechts = np.full(klassen, -np.inf)
+        k_boven = np.full(klassen, -np.inf)
+        k_onder = np.full(klassen, np.inf)
+        np.minimum.at(k_links, klasse, links)
+        np.maximum.at(k_rechts, klasse, rechts)
+        np.maximum.at(k_boven, klasse, np.maximum(boven, beneden))
+        np.minimum.at(k_onder, klasse, np.minimum(boven, beneden) - diameter)
+        duiker_x, duiker_y = _vierhoeken(k_links[bezet], k_rechts[bezet], k_boven[bezet], k_boven[bezet],
+                                         k_boven[bezet] - k_onder[bezet])
+        water_x, water_y = min_max_decimatie(*_waterlijn(links, rechts, boven, beneden), klassen, bereik)
+        opstuwing_x, opstuwing_y = min_max_decimatie(midden, opstuwing, klassen, bereik)
+        hover = dict(hovertemplate='%{x:.0f} m: %{y:.3f} m<extra>opstuwing</extra>')
+    else:
+        duiker_x, duiker_y = _vierhoeken(links, rechts, boven, beneden, diameter)
+        water_x, water_y = _waterlijn(links, rechts, boven, beneden)
+        opstuwing_x, opstuwing_y = midden, opstuwing
+        hover = dict(customdata=np.column_stack((index, debiet, diameter)),
+                     hovertemplate='duiker %{customdata[0]}<br>opstuwing: %{y:.3f} m<br>'
+                                   'debiet: %{customdata[1]:.3f} m³/s<br>'
+                                   'diameter: %{customdata[2]:.2f} m<extra></extra>')
+
+    fig.add_trace(go.Scattergl(x=water_x, y=water_y, name='waterstand', mode='lines',
+                               line=dict(color='lightblue', width=2), hoverinfo='skip'))
+    fig.add_trace(go.Scattergl(x=duiker_x, y=duiker_y, name='duikers', mode='lines', fill='toself',
+                               line=dict(color='brown', width=1), hoverinfo='skip'))
+    fig.add_trace(go.Scattergl(x=opstuwing_x, y=opstuwing_y, name='opstuwing', yaxis='y2',
+                               mode='lines+markers' if not vereenvoudigd else 'lines',
+                               marker=dict(size=4, color='darkred'), line=dict(color='darkred', width=1),
+                               **hover))
+    titel = f'{index.size} duikers in beeld'
+    if vereenvoudigd:
+        titel += f', vereenvoudigd tot {klassen} klassen (zoom in voor afzonderlijke duikers)'
+    fig.update_layout(title=dict(text=titel, font=dict(size=12)))
+    return fig
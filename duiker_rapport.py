@@ -0,0 +1,320 @@
+import argparse
+import math
+import os
+import re
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from duiker_batch import BlokSchrijver, _kolom_paar, bereken_blok, duikers_uit_blok, lees_blokken
+from duiker_geometrie import PROFIELEN
+from duiker_tekening import MAP, DuikerRenderer, duiker_labels
+
+## Duiker rapport
+# =============================================================================
+# Maakt voor elke duiker in een registerexport de schematische tekening met
+# de invoer en, in een band eronder, de resultaten. De tekeningen worden in
+# een pool van werkers gemaakt; elke werker laadt de achtergrond en het
+# lettertype één keer. De hoofdtaak leest het register blok voor blok
+# (zoals duiker_batch), verdeelt de pagina's in taken en schrijft de
+# uitkomsten op volgorde weg, met hooguit een paar taken per werker
+# onderweg, zodat het geheugen niet met het register meegroeit.
+#
+#   python duiker_rapport.py register.csv rapport.pdf --naam code --processen 4
+#
+# De uitvoer hangt af van de extensie: .pdf geeft één PDF met een pagina per
+# duiker (de JPEG gaat ongewijzigd de PDF in), .zip een zip met een
+# afbeelding per duiker en anders een map met losse afbeeldingen.
+
+ONDERRAND = 70        # pixels onder de tekening voor de resultaten
+PAGINABREEDTE = 842   # PDF-paginabreedte in punten (A4 liggend)
+EXTENSIES = {'PNG': 'png', 'JPEG': 'jpg', 'WEBP': 'webp'}
+
+# Keuzes van duiker_batch -> de teksten van invoer_sidebar
+KEUZE_SLIBLAAG = {'percentage': 'percentage T.O.V. duiker', 'cm': 'cm sliblaag'}
+KEUZE_VERVAL = {'cm': 'Verval', 'nap': 'Werkelijke hoogte in +mNAP'}
+
+
+## Pagina's:
+# ===================================
+def resultaat_labels(naam, debiet, stroomsnelheid, opstuwing, ruwheid, hoogte):
+    # Labels in de band onder de tekening; hoogte is de hoogte van de pagina
+    y = hoogte - ONDERRAND + 12
+    return {'naam': ((20, y), f'Duiker: {naam}'),
+            'debiet': ((20, y + 28), f'Debiet: {debiet:.3f} [m3/s] ({debiet * 3600:.1f} [m3/h])'),
+            'stroomsnelheid': ((430, y + 28), f'Stroomsnelheid: {stroomsnelheid:.2f} [m/s]'),
+            'opstuwing': ((760, y + 28), f'Opstuwing: {opstuwing:.2f} [m]'),
+            'ruwheid': ((1040, y + 28), f'Hydraulische ruwheid: {ruwheid:.3f}')}
+
+
+def pagina_labels(goed, kolommen=None, keuze_sliblaag='percentage', keuze_verval='cm', naamkolom=None,
+                  hoogte=None):
+    # (bestandsnaam, labels) per goedgekeurde rij uit bereken_blok; de index
+    # van goed is het rijnummer in het register
+    kolommen = kolommen or {}
+    hoogte = hoogte or pagina_grootte()[1]
+    duikers = duikers_uit_blok(goed, kolommen, keuze_sliblaag, keuze_verval)
+    sliblaag_cm = (pd.to_numeric(goed[kolommen.get('sliblaag_cm', 'sliblaag_cm')]).to_numpy(dtype=float)
+                   if keuze_sliblaag == 'cm' else np.zeros(len(goed)))
+    namen = goed[naamkolom].astype(str).tolist() if naamkolom else None
+    for i, rij in enumerate(goed.index.tolist()):
+        def waarde(kolom):
+            return round(float(kolom[i]), 6)
+        profielhoogte = duikers.hoogte[i]
+        invoer = dict(diameter=waarde(duikers.diameter),
+                      lengte=waarde(duikers.lengte),
+                      sliblaag_cm=waarde(sliblaag_cm),
+                      sliblaag_procent=waarde(duikers.sliblaag_procent),
+                      intreedweerstand=waarde(duikers.intreedweerstand),
+                      uittreedweerstand=waarde(duikers.uittreedweerstand),
+                      ben_str_nat_opp=waarde(duikers.ben_str_nat_opp),
+                      manning=waarde(duikers.manning),
+                      verval=waarde(duikers.opstuwing),
+                      bovenwaterstand=waarde(duikers.bovenwaterstand),
+                      benedenwaterstand=waarde(duikers.benedenwaterstand),
+                      keuze_sliblaag=KEUZE_SLIBLAAG[keuze_sliblaag],
+                      keuze_verval=KEUZE_VERVAL[keuze_verval],
+                      profiel=PROFIELEN[duikers.profiel[i]],
+                      hoogte=None if math.isnan(profielhoogte) else round(float(profielhoogte), 6))
+        naam = namen[i] if namen else str(rij)
+        labels = duiker_labels(**invoer)
+        labels.update(resultaat_labels(naam, goed['debiet'].iat[i], goed['stroomsnelheid'].iat[i],
+                                       goed['opstuwing'].iat[i], goed['ruwheid'].iat[i], hoogte))
+        if namen:
+            yield f'{rij:06d}_' + re.sub(r'[^\w.-]+', '_', naam), labels
+        else:
+            yield f'{rij:06d}', labels
+
+
+def pagina_grootte():
+    # (breedte, hoogte) van een pagina in pixels; PIL leest alleen de kop
+    from PIL import Image
+    with Image.open(os.path.join(MAP, 'DuikerSchematisch_V2.jpg')) as figuur:
+        breedte, hoogte = figuur.size
+    return breedte, hoogte + ONDERRAND
+
+
+## Werkers:
+# ===================================
+_werker_renderer = None
+
+
+def _start_werker():
+    # Eén renderer per werker: achtergrond en lettertype één keer laden
+    global _werker_renderer
+    _werker_renderer = DuikerRenderer(cache_grootte=0, onderrand=ONDERRAND)
+
+
+def _render_paginas(labels, formaat):
+    if _werker_renderer is None:
+        _start_werker()
+    return [_werker_renderer.codeer(pagina, formaat) for pagina in labels]
+
+
+## Uitvoer:
+# ===================================
+class MapUitvoer:
+    def __init__(self, pad, formaat):
+        os.makedirs(pad, exist_ok=True)
+        self.pad = pad
+        self.extensie = EXTENSIES[formaat]
+
+    def toevoegen(self, naam, afbeelding):
+        with open(os.path.join(self.pad, f'{naam}.{self.extensie}'), 'wb') as bestand:
+            bestand.write(afbeelding)
+
+    def sluit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.sluit()
+
+
+class ZipUitvoer(MapUitvoer):
+    # Afbeeldingen zijn al gecomprimeerd, dus zonder extra compressie
+    def __init__(self, pad, formaat):
+        self.extensie = EXTENSIES[formaat]
+        self._zip = zipfile.ZipFile(pad, 'w', compression=zipfile.ZIP_STORED)
+
+    def toevoegen(self, naam, afbeelding):
+        self._zip.writestr(f'{naam}.{self.extensie}', afbeelding)
+
+    def sluit(self):
+        self._zip.close()
+
+
+class PdfUitvoer(MapUitvoer):
+    # Schrijft de PDF pagina voor pagina weg: elke JPEG wordt als
+    # DCTDecode-afbeelding opgenomen, zonder opnieuw te coderen. Alleen de
+    # paginaboom en de xref-tabel worden bij sluit() geschreven.
+    def __init__(self, pad, formaat, grootte):
+        if formaat != 'JPEG':
+            raise ValueError('een PDF-rapport gebruikt JPEG')
+        self.grootte = grootte
+        self._bestand = open(pad, 'wb')
+        self._bestand.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._posities = {}
+        self._paginas = []
+        self._volgende = 3  # 1 is de catalogus, 2 de paginaboom
+
+    def _object(self, woordenboek, stroom=None, nummer=None):
+        if nummer is None:
+            nummer = self._volgende
+            self._volgende += 1
+        self._posities[nummer] = self._bestand.tell()
+        self._bestand.write(f'{nummer} 0 obj\n{woordenboek}\n'.encode('ascii'))
+        if stroom is not None:
+            self._bestand.write(b'stream\n' + stroom + b'\nendstream\n')
+        self._bestand.write(b'endobj\n')
+        return nummer
+
+    def toevoegen(self, naam, afbeelding):
+        breedte, hoogte = self.grootte
+        pagina_hoogte = PAGINABREEDTE * hoogte/breedte
+        figuur = self._object(f'<< /Type /XObject /Subtype /Image /Width {breedte} /Height {hoogte} '
+                              f'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode '
+                              f'/Length {len(afbeelding)} >>', afbeelding)
+        tekenen = f'q {PAGINABREEDTE} 0 0 {pagina_hoogte:.3f} 0 0 cm /Im0 Do Q'.encode('ascii')
+        inhoud = self._object(f'<< /Length {len(tekenen)} >>', tekenen)
+        self._paginas.append(self._object(
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGINABREEDTE} {pagina_hoogte:.3f}] '
+            f'/Resources << /XObject << /Im0 {figuur} 0 R >> >> /Contents {inhoud} 0 R >>'))
+
+    def sluit(self):
+        if self._bestand.closed:
+            return
+        kinderen = ' '.join(f'{pagina} 0 R' for pagina in self._paginas)
+        self._object(f'<< /Type /Pages /Kids [{kinderen}] /Count {len(self._paginas)} >>', nummer=2)
+        self._object('<< /Type /Catalog /Pages 2 0 R >>', nummer=1)
+        xref = self._bestand.tell()
+        regels = [f'xref\n0 {self._volgende}\n', '0000000000 65535 f \n']
+        regels += [f'{self._posities[nummer]:010d} 00000 n \n' for nummer in range(1, self._volgende)]
+        regels.append(f'trailer\n<< /Size {self._volgende} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n')
+        self._bestand.write(''.join(regels).encode('ascii'))
+        self._bestand.close()
+
+
+def open_uitvoer(pad, formaat='JPEG'):
+    formaat = formaat.upper()
+    if formaat not in EXTENSIES:
+        raise ValueError(f"onbekend formaat '{formaat}', kies uit {', '.join(EXTENSIES)}")
+    if pad.lower().endswith('.pdf'):
+        return PdfUitvoer(pad, formaat, pagina_grootte())
+    if pad.lower().endswith('.zip'):
+        return ZipUitvoer(pad, formaat)
+    return MapUitvoer(pad, formaat)
+
+
+## Rapport:
+# ===================================
+def maak_rapport(invoer, uitvoer, afgekeurd=None, processen=None, formaat='JPEG', blokgrootte=10_000,
+                 taakgrootte=32, kolommen=None, keuze_sliblaag='percentage', keuze_verval='cm',
+                 naamkolom=None, meld=None):
+    # Tekent het hele register en geeft de tellingen terug. processen=1
+    # tekent in dit proces, zonder pool.
+    if afgekeurd is None:
+        basis, _ = os.path.splitext(uitvoer.rstrip(os.sep))
+        afgekeurd = f'{basis}_afgekeurd.csv'
+    processen = processen or os.cpu_count()
+    hoogte = pagina_grootte()[1]
+    pool = ProcessPoolExecutor(max_workers=processen, initializer=_start_werker) if processen > 1 else None
+    onderweg = deque()
+    aantal = aantal_afgekeurd = paginas = 0
+    start = time.perf_counter()
+
+    def wegschrijven(doel, namen, taak):
+        nonlocal paginas
+        afbeeldingen = taak.result() if pool is not None else taak
+        for naam, afbeelding in zip(namen, afbeeldingen):
+            doel.toevoegen(naam, afbeelding)
+        paginas += len(namen)
+
+    try:
+        with open_uitvoer(uitvoer, formaat) as doel, BlokSchrijver(afgekeurd) as fout_schrijver:
+            for blok in lees_blokken(invoer, blokgrootte):
+                # Rijnummers in het register (vanaf 1) als index
+                blok.index = pd.RangeIndex(aantal + 1, aantal + 1 + len(blok))
+                goed, fout = bereken_blok(blok, kolommen, keuze_sliblaag, keuze_verval)
+                if len(fout):
+                    fout_schrijver.schrijf(fout)
+                if naamkolom and naamkolom not in blok.columns:
+                    raise KeyError(f"kolom '{naamkolom}' voor de naam ontbreekt in de invoer")
+                pagina_lijst = list(pagina_labels(goed, kolommen, keuze_sliblaag, keuze_verval, naamkolom, hoogte))
+                for begin in range(0, len(pagina_lijst), taakgrootte):
+                    taak = pagina_lijst[begin:begin + taakgrootte]
+                    namen = [naam for naam, _ in taak]
+                    labels = [pagina for _, pagina in taak]
+                    if pool is None:
+                        wegschrijven(doel, namen, _render_paginas(labels, formaat))
+                        continue
+                    onderweg.append((namen, pool.submit(_render_paginas, labels, formaat)))
+                    while len(onderweg) >= 4 * processen:
+                        wegschrijven(doel, *onderweg.popleft())
+                aantal += len(blok)
+                aantal_afgekeurd += len(fout)
+                if meld is not None:
+                    duur = time.perf_counter() - start
+                    meld(f'{aantal} rijen gelezen, {paginas} getekend, {aantal_afgekeurd} afgekeurd, '
+                         f'{paginas/max(duur, 1e-9):,.1f} afbeeldingen/s')
+            while onderweg:
+                wegschrijven(doel, *onderweg.popleft())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    duur = time.perf_counter() - start
+    return dict(rijen=aantal,
+                afbeeldingen=paginas,
+                afgekeurd=aantal_afgekeurd,
+                seconden=duur,
+                afbeeldingen_per_seconde=paginas/max(duur, 1e-9),
+                afgekeurd_bestand=afgekeurd)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Duiker tool: schematische tekening met resultaten voor elke duiker in een register.')
+    parser.add_argument('invoer', help='CSV- of Parquet-bestand met een rij per duiker')
+    parser.add_argument('uitvoer', help='.pdf (een pagina per duiker), .zip of een map voor losse afbeeldingen')
+    parser.add_argument('--afgekeurd', help='CSV-bestand voor afgekeurde rijen (standaard <uitvoer>_afgekeurd.csv)')
+    parser.add_argument('--naam', help='kolom met de naam of code van de duiker (standaard het rijnummer)')
+    parser.add_argument('--formaat', choices=tuple(EXTENSIES), default='JPEG',
+                        help='formaat van de afbeeldingen; een PDF gebruikt altijd JPEG')
+    parser.add_argument('--processen', type=int, help='aantal werkers (standaard alle kernen)')
+    parser.add_argument('--taakgrootte', type=int, default=32, help='afbeeldingen per taak voor een werker')
+    parser.add_argument('--blokgrootte', type=int, default=10_000, help='aantal rijen per blok')
+    parser.add_argument('--sliblaag', choices=('percentage', 'cm'), default='percentage',
+                        help="sliblaag als percentage T.O.V. duiker (kolom 'sliblaag_pct', 0-100) "
+                             "of in cm (kolom 'sliblaag_cm')")
+    parser.add_argument('--verval', choices=('cm', 'nap'), default='cm',
+                        help="verval in cm (kolom 'verval') of werkelijke hoogte in +mNAP "
+                             "(kolommen 'bovenwaterstand' en 'benedenwaterstand')")
+    parser.add_argument('--kolom', type=_kolom_paar, action='append', default=[], metavar='VELD=KOLOM',
+                        help='andere kolomnaam voor een veld, mag vaker worden opgegeven')
+    parser.add_argument('--stil', action='store_true', help='geen voortgang per blok tonen')
+    args = parser.parse_args(argv)
+
+    meld = None if args.stil else (lambda tekst: print(tekst, file=sys.stderr))
+    try:
+        telling = maak_rapport(args.invoer, args.uitvoer, args.afgekeurd, args.processen, args.formaat,
+                               args.blokgrootte, args.taakgrootte, dict(args.kolom), args.sliblaag,
+                               args.verval, args.naam, meld)
+    except (OSError, KeyError, ValueError) as fout:
+        print(f'fout: {fout}', file=sys.stderr)
+        return 1
+    samenvatting = (f"{telling['afbeeldingen']} afbeeldingen in {telling['seconden']:.2f} s "
+                    f"({telling['afbeeldingen_per_seconde']:,.1f} afbeeldingen/s), {telling['afgekeurd']} afgekeurd")
+    if telling['afgekeurd']:
+        samenvatting += f" -> {telling['afgekeurd_bestand']}"
+    print(samenvatting, file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,315 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from duiker_batch import _kolom, duikers_uit_blok, lees_blokken
+from duiker_kern import DuikerArray, synthetisch_register as duikers_synthetisch
+
+## Duiker ruimte
+# =============================================================================
+# Ruimtelijke index over duikers met een ligging (x, y, bijvoorbeeld in RD),
+# zodat een kaartbeeld alleen de duikers in beeld opvraagt en rekent.
+#
+#   register = lees_register('duikers.geojson')          # of .csv met x en y
+#   uitsnede = register.rechthoek(155_000, 463_000, 156_000, 464_000)
+#   uitsnede.debiet                      # alleen voor deze duikers gerekend
+#   register.straal(155_500, 463_500, 250).rijen          # op afstand gesorteerd
+#   register.dichtstbij(155_500, 463_500, 10).namen
+#
+#   python duiker_ruimte.py duikers.geojson --rechthoek 155000 463000 156000 464000
+#
+# De index is een vast raster: de duikers staan gesorteerd per cel en per cel
+# is bekend waar die in de sortering begint (zoals een CSR-matrix). Een
+# rechthoek leest per kolom van het raster één aaneengesloten stuk en filtert
+# daarna exact; een straal is een rechthoek met een afstandsfilter, de
+# dichtstbijzijnde k een straal die verdubbelt tot er k binnen liggen.
+# Debiet, stroomsnelheid en opstuwing worden pas bij de eerste opvraging van
+# een duiker gerekend en daarna per duiker bewaard. Duikers zonder ligging
+# (NaN) staan niet in de index.
+
+RUIMTE_RESULTATEN = ('debiet', 'stroomsnelheid', 'opstuwing')
+
+
+## Rasterindex:
+# ===================================
+def _reeksen(begin, eind):
+    # Alle posities begin[i]..eind[i] achter elkaar, zonder Python-lus
+    lengte = eind - begin
+    totaal = int(lengte.sum())
+    if totaal == 0:
+        return np.empty(0, dtype=np.int64)
+    verschuiving = begin - np.concatenate([[0], np.cumsum(lengte)[:-1]])
+    return np.arange(totaal) + np.repeat(verschuiving, lengte)
+
+
+class RasterIndex:
+    # per_cel: gemiddeld aantal duikers per cel als celgrootte niet is opgegeven
+    def __init__(self, x, y, celgrootte=None, per_cel=4):
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        self.aantal = len(x)
+        bekend = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        if len(bekend):
+            self.x0, self.y0 = x[bekend].min(), y[bekend].min()
+            breedte, hoogte = x[bekend].max() - self.x0, y[bekend].max() - self.y0
+        else:
+            self.x0 = self.y0 = breedte = hoogte = 0.0
+        if celgrootte is None:
+            oppervlak = max(breedte, 1e-9) * max(hoogte, 1e-9)
+            celgrootte = max((oppervlak * per_cel/max(len(bekend), 1))**0.5, max(breedte, hoogte)/1e6, 1e-9)
+        self.celgrootte = float(celgrootte)
+        self.nx = int(breedte//self.celgrootte) + 1
+        self.ny = int(hoogte//self.celgrootte) + 1
+
+        cel = self._cel(x[bekend], y[bekend])
+        sortering = np.argsort(cel, kind='stable')
+        self.rijen = bekend[sortering]
+        self.x, self.y = x[self.rijen], y[self.rijen]
+        self.begin = np.searchsorted(cel[sortering], np.arange(self.nx * self.ny + 1))
+
+    def _cel(self, x, y):
+        ix = np.clip(((x - self.x0)//self.celgrootte).astype(np.int64), 0, self.nx - 1)
+        iy = np.clip(((y - self.y0)//self.celgrootte).astype(np.int64), 0, self.ny - 1)
+        return ix * self.ny + iy
+
+    def __len__(self):
+        return len(self.rijen)
+
+    def _posities(self, xmin, ymin, xmax, ymax):
+        # Posities in de sortering van alle duikers in de rechthoek
+        ix0 = max(int((xmin - self.x0)//self.celgrootte), 0)
+        ix1 = min(int((xmax - self.x0)//self.celgrootte), self.nx - 1)
+        iy0 = max(int((ymin - self.y0)//self.celgrootte), 0)
+        iy1 = min(int((ymax - self.y0)//self.celgrootte), self.ny - 1)
+        if ix0 > ix1 or iy0 > iy1 or not len(self):
+            return np.empty(0, dtype=np.int64)
+        kolommen = np.arange(ix0, ix1 + 1) * self.ny
+        posities = _reeksen(self.begin[kolommen + iy0], self.begin[kolommen + iy1 + 1])
+        binnen = ((self.x[posities] >= xmin) & (self.x[posities] <= xmax)
+                  & (self.y[posities] >= ymin) & (self.y[posities] <= ymax))
+        return posities[binnen]
+
+    def rechthoek(self, xmin, ymin, xmax, ymax):
+        # Rijnummers (oplopend) van de duikers in de rechthoek, randen inbegrepen
+        return np.sort(self.rijen[self._posities(xmin, ymin, xmax, ymax)])
+
+    def straal(self, x, y, straal):
+        # (rijnummers, afstanden) binnen de straal, op afstand gesorteerd
+        posities = self._posities(x - straal, y - straal, x + straal, y + straal)
+        afstand = np.hypot(self.x[posities] - x, self.y[posities] - y)
+        binnen = afstand <= straal
+        volgorde = np.argsort(afstand[binnen], kind='stable')
+        return self.rijen[posities[binnen][volgorde]], afstand[binnen][volgorde]
+
+    def dichtstbij(self, x, y, k=1):
+        # (rijnummers, afstanden) van de k dichtstbijzijnde duikers. Alles
+        # buiten de straal ligt verder weg dan alles erbinnen, dus zodra er
+        # k binnen de straal liggen zijn dat de k dichtstbijzijnde.
+        k = min(int(k), len(self))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        buiten = np.hypot(max(self.x0 - x, 0.0, x - (self.x0 + self.nx * self.celgrootte)),
+                          max(self.y0 - y, 0.0, y - (self.y0 + self.ny * self.celgrootte)))
+        straal = buiten + self.celgrootte * max(1.0, (k/4)**0.5)
+        while True:
+            rijen, afstand = self.straal(x, y, straal)
+            if len(rijen) >= k:
+                return rijen[:k], afstand[:k]
+            straal *= 2.0
+
+
+## Register met ligging:
+# ===================================
+class Uitsnede:
+    # Een deel van het register; de resultaten worden bij de eerste
+    # opvraging gerekend (alleen voor deze rijen)
+    def __init__(self, register, rijen, afstand=None):
+        self.register = register
+        self.rijen = rijen
+        self.afstand = afstand
+
+    def __len__(self):
+        return len(self.rijen)
+
+    @property
+    def x(self):
+        return self.register.x[self.rijen]
+
+    @property
+    def y(self):
+        return self.register.y[self.rijen]
+
+    @property
+    def namen(self):
+        return None if self.register.namen is None else self.register.namen[self.rijen]
+
+    @property
+    def duikers(self):
+        return self.register.duikers.deel(self.rijen)
+
+    @property
+    def debiet(self):
+        return self.register.uitkomsten(self.rijen)['debiet']
+
+    @property
+    def stroomsnelheid(self):
+        return self.register.uitkomsten(self.rijen)['stroomsnelheid']
+
+    @property
+    def opstuwing(self):
+        return self.register.uitkomsten(self.rijen)['opstuwing']
+
+    def tabel(self):
+        tabel = pd.DataFrame({'x': self.x, 'y': self.y})
+        if self.namen is not None:
+            tabel.insert(0, 'naam', self.namen)
+        if self.afstand is not None:
+            tabel['afstand'] = self.afstand
+        return tabel.assign(**self.register.uitkomsten(self.rijen))
+
+
+class RuimtelijkRegister:
+    def __init__(self, duikers: DuikerArray, x, y, namen=None, celgrootte=None):
+        self.duikers = duikers
+        self.x, self.y = (np.broadcast_to(np.asarray(kolom, dtype=float), len(duikers)) for kolom in (x, y))
+        self.namen = None if namen is None else np.asarray(namen, dtype=object)
+        self.index = RasterIndex(self.x, self.y, celgrootte)
+        self._uitkomsten = {naam: np.full(len(duikers), np.nan) for naam in RUIMTE_RESULTATEN}
+        self._berekend = np.zeros(len(duikers), dtype=bool)
+
+    @classmethod
+    def from_duikers(cls, duikers, namen=None, celgrootte=None):
+        # Uit Duiker-objecten met x en y (None: zonder ligging)
+        duikers = list(duikers)
+        x, y = ([np.nan if getattr(duiker, naam, None) is None else getattr(duiker, naam) for duiker in duikers]
+                for naam in ('x', 'y'))
+        return cls(DuikerArray.from_duikers(duikers), x, y, namen, celgrootte)
+
+    def __len__(self):
+        return len(self.duikers)
+
+    @property
+    def berekend(self):
+        # Aantal duikers waarvan de resultaten al gerekend zijn
+        return int(self._berekend.sum())
+
+    def uitkomsten(self, rijen):
+        # Resultaten voor deze rijen; nog niet gerekende rijen eerst rekenen
+        nieuw = rijen[~self._berekend[rijen]]
+        if len(nieuw):
+            duikers = self.duikers.deel(nieuw)
+            with np.errstate(all='ignore'):
+                _, nat_opp_duiker, natte_omtrek = duikers.doorsnede
+                debiet = duikers._debiet(nat_opp_duiker, natte_omtrek)
+                self._uitkomsten['debiet'][nieuw] = debiet
+                self._uitkomsten['stroomsnelheid'][nieuw] = np.where(nat_opp_duiker > 0,
+                                                                     debiet/nat_opp_duiker, 0.0)
+                self._uitkomsten['opstuwing'][nieuw] = duikers.opstuwing
+            self._berekend[nieuw] = True
+        return {naam: kolom[rijen] for naam, kolom in self._uitkomsten.items()}
+
+    def rechthoek(self, xmin, ymin, xmax, ymax) -> Uitsnede:
+        return Uitsnede(self, self.index.rechthoek(xmin, ymin, xmax, ymax))
+
+    def straal(self, x, y, straal) -> Uitsnede:
+        return Uitsnede(self, *self.index.straal(x, y, straal))
+
+    def dichtstbij(self, x, y, k=1) -> Uitsnede:
+        return Uitsnede(self, *self.index.dichtstbij(x, y, k))
+
+
+## Inlezen:
+# ===================================
+def _punt(geometrie):
+    # Ligging van een GeoJSON-geometrie: het punt zelf, of het gemiddelde
+    # van de hoekpunten (bijvoorbeeld een duiker als lijn)
+    if not geometrie or not geometrie.get('coordinates'):
+        return np.nan, np.nan
+    punten = []
+
+    def verzamel(coordinaten):
+        if coordinaten and isinstance(coordinaten[0], (int, float)):
+            punten.append(coordinaten[:2])
+        else:
+            for deel in coordinaten:
+                verzamel(deel)
+
+    verzamel(geometrie['coordinates'])
+    return tuple(np.mean(np.asarray(punten, dtype=float), axis=0))
+
+
+def lees_geojson(pad):
+    # Tabel met de properties van elke feature plus x en y
+    with open(pad, encoding='utf-8') as bestand:
+        gegevens = json.load(bestand)
+    features = gegevens.get('features', []) if gegevens.get('type') == 'FeatureCollection' else [gegevens]
+    tabel = pd.DataFrame([feature.get('properties') or {} for feature in features])
+    liggingen = np.array([_punt(feature.get('geometry')) for feature in features], dtype=float).reshape(-1, 2)
+    return tabel.assign(x=liggingen[:, 0], y=liggingen[:, 1])
+
+
+def lees_register(pad, kolommen=None, keuze_sliblaag='percentage', keuze_verval='cm', naamkolom=None,
+                  celgrootte=None):
+    # GeoJSON (punten of lijnen) of een registerexport (CSV/Parquet) met de
+    # kolommen x en y; verder dezelfde kolommen als duiker_batch
+    kolommen = kolommen or {}
+    if pad.lower().endswith(('.geojson', '.json')):
+        tabel = lees_geojson(pad)
+    else:
+        tabel = pd.concat(list(lees_blokken(pad, 1_000_000)), ignore_index=True)
+    if naamkolom and naamkolom not in tabel.columns:
+        raise KeyError(f"kolom '{naamkolom}' voor de naam ontbreekt in de invoer")
+    duikers = duikers_uit_blok(tabel, kolommen, keuze_sliblaag, keuze_verval)
+    return RuimtelijkRegister(duikers, _kolom(tabel, kolommen, 'x'), _kolom(tabel, kolommen, 'y'),
+                              tabel[naamkolom].astype(str).to_numpy() if naamkolom else None, celgrootte)
+
+
+## Benchmark:
+# ===================================
+def synthetisch_register(grootte, breedte=50_000.0, seed=0):
+    # Duikers verspreid over een gebied van breedte x breedte meter
+    rng = np.random.default_rng(seed)
+    return RuimtelijkRegister(duikers_synthetisch(grootte, seed), rng.uniform(0.0, breedte, grootte),
+                              rng.uniform(0.0, breedte, grootte))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Duiker tool: duikers in een gebied opvragen en rekenen.')
+    parser.add_argument('invoer', help='GeoJSON, CSV of Parquet met een ligging (x, y) per duiker')
+    vraag = parser.add_mutually_exclusive_group(required=True)
+    vraag.add_argument('--rechthoek', type=float, nargs=4, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'))
+    vraag.add_argument('--straal', type=float, nargs=3, metavar=('X', 'Y', 'STRAAL'))
+    vraag.add_argument('--dichtstbij', type=float, nargs=3, metavar=('X', 'Y', 'K'))
+    parser.add_argument('--uitvoer', help='CSV-bestand voor de uitsnede (standaard naar het scherm)')
+    parser.add_argument('--naamkolom', help='kolom met de naam van de duiker')
+    parser.add_argument('--sliblaag', choices=('percentage', 'cm'), default='percentage')
+    parser.add_argument('--verval', choices=('cm', 'nap'), default='cm')
+    args = parser.parse_args(argv)
+    try:
+        start = time.perf_counter()
+        register = lees_register(args.invoer, keuze_sliblaag=args.sliblaag, keuze_verval=args.verval,
+                                 naamkolom=args.naamkolom)
+        ingelezen = time.perf_counter() - start
+        start = time.perf_counter()
+        if args.rechthoek:
+            uitsnede = register.rechthoek(*args.rechthoek)
+        elif args.straal:
+            uitsnede = register.straal(*args.straal)
+        else:
+            uitsnede = register.dichtstbij(*args.dichtstbij[:2], int(args.dichtstbij[2]))
+        tabel = uitsnede.tabel()
+        opgevraagd = time.perf_counter() - start
+    except (KeyError, ValueError, OSError) as fout:
+        print(f'fout: {fout}', file=sys.stderr)
+        return 1
+    tabel.to_csv(args.uitvoer or sys.stdout, index=False)
+    print(f'{len(uitsnede)} van {len(register)} duikers, ingelezen in {ingelezen:.2f} s, '
+          f'opgevraagd en gerekend in {opgevraagd * 1000:.1f} ms', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from duiker_geometrie import doorsnede, profielcodes
+from duiker_kern import DuikerArray, synthetisch_register
+
+## Duiker scenario
+# =============================================================================
+# Rekent wat-als-scenario's op een register incrementeel door. De afgeleide
+# grootheden vormen een afhankelijkheidsgraaf:
+#
+#   doorsnede  <- profiel, diameter, hoogte, sliblaag_procent
+#   ruwheid    <- doorsnede, lengte, intreedweerstand, uittreedweerstand, ben_str_nat_opp, manning
+#   opstuwing  <- bovenwaterstand, benedenwaterstand
+#   debiet     <- ruwheid, doorsnede, opstuwing
+#   stroomsnelheid <- debiet, doorsnede
+#
+# De uitkomsten van het basisregister worden per duiker bewaard. Een
+# scenario vervangt een of meer velden; per knoop worden alleen de duikers
+# opnieuw gerekend waarvan een veld waar de knoop (via andere knopen) van
+# afhangt anders is dan in de basis. Een scenario op alleen het verval
+# rekent dus geen doorsnede en ruwheid, een scenario op de sliblaag geen
+# opstuwing. De uitkomsten zijn gelijk aan die van DuikerArray.
+#
+#   rekenaar = ScenarioRekenaar(duikers)
+#   uitkomst = rekenaar.bereken({'bovenwaterstand': duikers.bovenwaterstand + 0.1})
+#   uitkomst.debiet
+#   rekenaar.telling            # knoop -> [berekend, overgeslagen] (duikers)
+#
+#   python duiker_scenario.py --grootte 1e6 --scenarios 20   # tegen alles opnieuw
+
+SCENARIO_RESULTATEN = ('sliblaag', 'nat_opp_duiker', 'natte_omtrek', 'ruwheid', 'opstuwing',
+                       'debiet', 'stroomsnelheid')
+SCENARIO_VELDEN = DuikerArray.velden + DuikerArray.profielvelden
+
+
+## Afhankelijkheidsgraaf:
+# ===================================
+def _doorsnede(duikers, knopen):
+    return doorsnede(duikers.profiel, duikers.diameter, duikers.hoogte, duikers.sliblaag_procent)
+
+
+def _ruwheid(duikers, knopen):
+    return duikers._ruwheid(*knopen['doorsnede'][1:])
+
+
+def _opstuwing(duikers, knopen):
+    return duikers.opstuwing
+
+
+def _debiet(duikers, knopen):
+    # Als DuikerArray._debiet, met de ruwheid uit de graaf
+    opstuwing = knopen['opstuwing']
+    valhoogte = np.sqrt(2.0 * 9.81 * np.where(opstuwing >= 0, opstuwing, np.nan))
+    return knopen['ruwheid'] * knopen['doorsnede'][1] * valhoogte
+
+
+def _stroomsnelheid(duikers, knopen):
+    nat_opp_duiker = knopen['doorsnede'][1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(nat_opp_duiker > 0, knopen['debiet']/nat_opp_duiker, 0.0)
+
+
+# knoop -> (velden, knopen, functie); in rekenvolgorde
+KNOPEN = {'doorsnede': (('profiel', 'diameter', 'hoogte', 'sliblaag_procent'), (), _doorsnede),
+          'ruwheid': (('lengte', 'intreedweerstand', 'uittreedweerstand', 'ben_str_nat_opp', 'manning'),
+                      ('doorsnede',), _ruwheid),
+          'opstuwing': (('bovenwaterstand', 'benedenwaterstand'), (), _opstuwing),
+          'debiet': ((), ('ruwheid', 'doorsnede', 'opstuwing'), _debiet),
+          'stroomsnelheid': ((), ('debiet', 'doorsnede'), _stroomsnelheid)}
+
+
+def _alle_velden():
+    # knoop -> alle velden waar de knoop direct of via andere knopen van afhangt
+    uitkomst = {}
+    for naam, (velden, knopen, _) in KNOPEN.items():
+        uitkomst[naam] = set(velden).union(*(uitkomst[knoop] for knoop in knopen))
+    return uitkomst
+
+
+AFHANKELIJK = _alle_velden()
+
+
+def _rijen(knoop, rijen):
+    # De doorsnede is een tupel van kolommen
+    if isinstance(knoop, tuple):
+        return tuple(kolom[rijen] for kolom in knoop)
+    return knoop[rijen]
+
+
+def _vul(basis, rijen, waarden):
+    # Kopie van de basis met nieuwe waarden op rijen
+    if isinstance(basis, tuple):
+        return tuple(_vul(kolom, rijen, waarde) for kolom, waarde in zip(basis, waarden))
+    uitkomst = basis.copy()
+    uitkomst[rijen] = waarden
+    return uitkomst
+
+
+## Rekenen:
+# ===================================
+class ScenarioUitkomst:
+    # Kolommen per duiker van één scenario; rijen die niet opnieuw gerekend
+    # zijn delen hun geheugen met de basis
+    def __init__(self, duikers: DuikerArray, knopen, gewijzigd):
+        self.duikers = duikers
+        self.gewijzigd = gewijzigd
+        self.sliblaag, self.nat_opp_duiker, self.natte_omtrek = knopen['doorsnede']
+        for naam in ('ruwheid', 'opstuwing', 'debiet', 'stroomsnelheid'):
+            setattr(self, naam, knopen[naam])
+
+
+class ScenarioRekenaar:
+    def __init__(self, duikers: DuikerArray):
+        self.duikers = duikers
+        self.telling = {naam: [0, 0] for naam in KNOPEN}
+        self.basis = {}
+        with np.errstate(all='ignore'):
+            for naam, (_, knopen, functie) in KNOPEN.items():
+                self.basis[naam] = functie(duikers, self.basis)
+                self.telling[naam][0] += len(duikers)
+
+    def _invoer(self, scenario):
+        onbekend = set(scenario) - set(SCENARIO_VELDEN)
+        if onbekend:
+            raise ValueError(f"onbekende velden in scenario: {', '.join(sorted(onbekend))}")
+        kolommen = dict(scenario)
+        if 'profiel' in kolommen:
+            kolommen['profiel'] = profielcodes(kolommen['profiel'])
+        duikers = self.duikers.vervang(**kolommen)
+        # Per vervangen veld de duikers waar de waarde anders is dan in de basis
+        gewijzigd = {}
+        for veld in kolommen:
+            nieuw, oud = getattr(duikers, veld), getattr(self.duikers, veld)
+            anders = nieuw != oud
+            if nieuw.dtype.kind == 'f':
+                anders &= ~(np.isnan(nieuw) & np.isnan(oud))
+            if anders.any():
+                gewijzigd[veld] = anders
+        return duikers, gewijzigd
+
+    def bereken(self, scenario=None) -> ScenarioUitkomst:
+        # scenario: veld -> waarde of kolom; None of {} geeft de basis
+        duikers, gewijzigd = self._invoer(scenario or {})
+        knopen = {}
+        with np.errstate(all='ignore'):
+            for naam, (_, _, functie) in KNOPEN.items():
+                maskers = [gewijzigd[veld] for veld in AFHANKELIJK[naam] if veld in gewijzigd]
+                if not maskers:
+                    knopen[naam] = self.basis[naam]
+                    self.telling[naam][1] += len(duikers)
+                    continue
+                rijen = np.flatnonzero(np.logical_or.reduce(maskers))
+                if len(rijen) == len(duikers):
+                    knopen[naam] = functie(duikers, knopen)
+                else:
+                    deel = {knoop: _rijen(waarde, rijen) for knoop, waarde in knopen.items()}
+                    knopen[naam] = _vul(self.basis[naam], rijen, functie(duikers.deel(rijen), deel))
+                self.telling[naam][0] += len(rijen)
+                self.telling[naam][1] += len(duikers) - len(rijen)
+        return ScenarioUitkomst(duikers, knopen, gewijzigd)
+
+    @property
+    def berekend(self):
+        return sum(berekend for berekend, _ in self.telling.values())
+
+    @property
+    def overgeslagen(self):
+        return sum(overgeslagen for _, overgeslagen in self.telling.values())
+
+    def verslag(self):
+        regels = [f'{naam:15s} {berekend:14,d} berekend {overgeslagen:14,d} overgeslagen'
+                  for naam, (berekend, overgeslagen) in self.telling.items()]
+        totaal = self.berekend + self.overgeslagen
+        regels.append(f'{"totaal":15s} {self.berekend:14,d} berekend {self.overgeslagen:14,d} overgeslagen '
+                      f'({self.overgeslagen/max(totaal, 1):.0%})')
+        return '\n'.join(regels)
+
+
+## Benchmark:
+# ===================================
+def standaard_scenarios(duikers: DuikerArray, aantal):
+    # Afwisselend alleen het verval, alleen de sliblaag en alleen de manning
+    # van een deel van de duikers
+    scenarios = []
+    for i in range(aantal):
+        stap = (i//3 + 1)/aantal
+        if i % 3 == 0:
+            scenarios.append({'bovenwaterstand': duikers.bovenwaterstand + 0.1 * stap})
+        elif i % 3 == 1:
+            scenarios.append({'sliblaag_procent': np.minimum(duikers.sliblaag_procent + 0.3 * stap, 1.0)})
+        else:
+            manning = duikers.manning.copy()
+            manning[::10] = 40.0 + 20.0 * stap
+            scenarios.append({'manning': manning})
+    return scenarios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Duiker tool: incrementeel rekenen van scenario's tegen alles opnieuw.")
+    parser.add_argument('--grootte', type=float, default=1e6, help='aantal duikers')
+    parser.add_argument('--scenarios', type=int, default=20, help="aantal scenario's")
+    args = parser.parse_args(argv)
+    duikers = synthetisch_register(int(args.grootte))
+    scenarios = standaard_scenarios(duikers, args.scenarios)
+
+    start = time.perf_counter()
+    with np.errstate(all='ignore'):
+        for scenario in scenarios:
+            opnieuw = duikers.vervang(**scenario)
+            opnieuw.debiet, opnieuw.stroomsnelheid
+    volledig = time.perf_counter() - start
+    start = time.perf_counter()
+    rekenaar = ScenarioRekenaar(duikers)
+    for scenario in scenarios:
+        rekenaar.bereken(scenario)
+    incrementeel = time.perf_counter() - start
+    print(rekenaar.verslag(), file=sys.stderr)
+    print(f"{len(duikers):,} duikers x {len(scenarios)} scenario's: alles opnieuw {volledig:.2f} s, "
+          f'incrementeel {incrementeel:.2f} s (inclusief de basis)', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,426 @@
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from collections import deque
+from urllib.parse import parse_qs
+
+import numpy as np
+
+from duiker_geometrie import PROFIELEN, profielcodes
+from duiker_kern import DuikerArray
+
+## Duiker service
+# =============================================================================
+# Kleine lokale HTTP/JSON-service voor andere tools (GIS-plug-ins, scripts),
+# alleen met de standaardbibliotheek (asyncio) en numpy.
+#
+#   python duiker_service.py start --poort 8765
+#   python duiker_service.py belast --verzoeken 20000 --gelijktijdig 200
+#
+# POST /duiker    één duiker: {"diameter": 0.5, "lengte": 21, ...}; optioneel
+#                 "profiel" (rond, rechthoek, eivorm, ellips) en "hoogte"
+# POST /duikers   meerdere duikers: {"duikers": [{...}, {...}]} of
+#                 kolommen: {"kolommen": {"diameter": [...], ...}}
+# GET  /metriek   tellingen, batchgroottes, latentie en doorvoer
+# GET  /gebied?rechthoek=xmin,ymin,xmax,ymax, /gebied?x=..&y=..&straal=..
+#                 of /gebied?x=..&y=..&k=..: alleen de duikers in beeld uit
+#                 het register van start --register (zie duiker_ruimte)
+#
+# Antwoorden bevatten debiet, stroomsnelheid, ruwheid en opstuwing, plus de
+# latentie van het verzoek en de grootte van de batch waarin het is
+# meegerekend. Verzoeken die binnen een kort venster (standaard 2 ms)
+# binnenkomen worden samengevoegd tot één gevectoriseerde berekening. Gaat
+# die mis, dan wordt elk verzoek apart gerekend; een ongeldig verzoek geeft
+# 400, een rekenfout 500.
+
+GROOTHEDEN = ('debiet', 'stroomsnelheid', 'ruwheid', 'opstuwing')
+
+
+class OngeldigVerzoek(ValueError):
+    pass
+
+
+## Micro-batching:
+# ===================================
+class MicroBatcher:
+    def __init__(self, venster=0.002, max_rijen=100_000):
+        self.venster = venster
+        self.max_rijen = max_rijen
+        self._wachtrij = []
+        self._rijen = 0
+        self._timer = None
+
+    async def bereken(self, kolommen):
+        # kolommen: veld -> float-array. Geeft (resultaten, batchinfo)
+        lus = asyncio.get_running_loop()
+        toekomst = lus.create_future()
+        self._wachtrij.append((kolommen, toekomst))
+        self._rijen += len(kolommen['diameter'])
+        if self._rijen >= self.max_rijen:
+            self._leeg(lus)
+        elif self._timer is None:
+            self._timer = lus.call_later(self.venster, self._leeg, lus)
+        return await toekomst
+
+    def _leeg(self, lus):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._wachtrij, self._rijen = self._wachtrij, [], 0
+        if batch:
+            lus.create_task(self._verwerk(lus, batch))
+
+    async def _verwerk(self, lus, batch):
+        try:
+            resultaten = await lus.run_in_executor(None, self._reken, [kolommen for kolommen, _ in batch])
+        except Exception as fout:
+            if len(batch) > 1:
+                # Eén verzoek dat misgaat mag de rest van de batch niet
+                # meenemen: reken dan elk verzoek apart
+                for deel in batch:
+                    await self._verwerk(lus, [deel])
+                return
+            for _, toekomst in batch:
+                if not toekomst.done():
+                    toekomst.set_exception(fout)
+            return
+        info = dict(batch_verzoeken=len(batch), batch_rijen=int(resultaten['debiet'].size))
+        begin = 0
+        for kolommen, toekomst in batch:
+            eind = begin + len(kolommen['diameter'])
+            if not toekomst.done():
+                toekomst.set_result(({naam: waarde[begin:eind] for naam, waarde in resultaten.items()}, info))
+            begin = eind
+
+    @staticmethod
+    def _reken(delen):
+        duikers = DuikerArray(**{veld: np.concatenate([deel[veld] for deel in delen])
+                                 for veld in DuikerArray.velden + DuikerArray.profielvelden})
+        with np.errstate(all='ignore'):
+            debiet = duikers.debiet
+            nat_opp_duiker = duikers.nat_opp_duiker
+            return dict(debiet=debiet,
+                        stroomsnelheid=np.where(nat_opp_duiker > 0, debiet/nat_opp_duiker, 0.0),
+                        ruwheid=duikers.ruwheid,
+                        opstuwing=duikers.opstuwing)
+
+
+## Metriek:
+# ===================================
+class Metriek:
+    def __init__(self, venster=10_000):
+        self.start = time.perf_counter()
+        self.verzoeken = 0
+        self.rijen = 0
+        self.fouten = 0
+        self._latenties = deque(maxlen=venster)
+        self._batchgroottes = deque(maxlen=venster)
+
+    def registreer(self, rijen, latentie, batch_verzoeken):
+        self.verzoeken += 1
+        self.rijen += rijen
+        self._latenties.append(latentie)
+        self._batchgroottes.append(batch_verzoeken)
+
+    def overzicht(self):
+        duur = time.perf_counter() - self.start
+        latenties = np.array(self._latenties) * 1000
+        percentielen = np.percentile(latenties, [50, 95, 99]) if latenties.size else [math.nan] * 3
+        return dict(verzoeken=self.verzoeken,
+                    rijen=self.rijen,
+                    fouten=self.fouten,
+                    verzoeken_per_seconde=self.verzoeken/duur,
+                    rijen_per_seconde=self.rijen/duur,
+                    gemiddelde_batch_verzoeken=float(np.mean(self._batchgroottes)) if self._batchgroottes else 0.0,
+                    latentie_ms=dict(zip(('p50', 'p95', 'p99'), map(_json_getal, percentielen))))
+
+
+## Verzoeken:
+# ===================================
+def _json_getal(waarde):
+    waarde = float(waarde)
+    return waarde if math.isfinite(waarde) else None
+
+
+def _profielkolommen(profiel, hoogte, aantal):
+    # Profielcodes en hoogtes (null of ontbrekend: standaardhoogte) per duiker
+    profiel = np.asarray(profiel)
+    if profiel.size and profiel.dtype.kind != 'U':
+        raise OngeldigVerzoek(f"profiel is een naam: {', '.join(PROFIELEN)}")
+    return (np.broadcast_to(profielcodes(profiel), aantal).copy(),
+            np.broadcast_to(np.asarray(hoogte, dtype=float), aantal).copy())
+
+
+def kolommen_uit_json(inhoud, meerdere):
+    # Zet een verzoek om naar float-kolommen per veld, plus profielcodes en
+    # hoogtes; fouten (ook een onbekend profiel) geven OngeldigVerzoek
+    try:
+        if not meerdere:
+            rijen = [inhoud]
+        elif isinstance(inhoud, dict) and 'kolommen' in inhoud:
+            if not isinstance(inhoud['kolommen'], dict):
+                raise OngeldigVerzoek("'kolommen' moet een object met een lijst per veld zijn")
+            kolommen = {veld: np.asarray(inhoud['kolommen'][veld], dtype=float).ravel()
+                        for veld in DuikerArray.velden}
+            lengtes = {len(kolom) for kolom in kolommen.values()}
+            if len(lengtes) != 1:
+                raise OngeldigVerzoek('alle kolommen moeten even lang zijn')
+            kolommen['profiel'], kolommen['hoogte'] = _profielkolommen(
+                inhoud['kolommen'].get('profiel', 'rond'), inhoud['kolommen'].get('hoogte'), lengtes.pop())
+            return kolommen
+        elif isinstance(inhoud, dict) and 'duikers' in inhoud:
+            rijen = inhoud['duikers']
+        else:
+            raise OngeldigVerzoek("verwacht 'duikers' of 'kolommen'")
+        if not isinstance(rijen, list) or not all(isinstance(rij, dict) for rij in rijen):
+            raise OngeldigVerzoek('elke duiker moet een object met velden zijn' if meerdere
+                                  else 'verwacht een object met de velden van een duiker')
+        kolommen = {veld: np.array([float(rij[veld]) for rij in rijen], dtype=float)
+                    for veld in DuikerArray.velden}
+        kolommen['profiel'], kolommen['hoogte'] = _profielkolommen(
+            [rij.get('profiel', 'rond') for rij in rijen], [rij.get('hoogte') for rij in rijen], len(rijen))
+        return kolommen
+    except OngeldigVerzoek:
+        raise
+    except KeyError as fout:
+        raise OngeldigVerzoek(f'veld ontbreekt: {fout.args[0]}') from None
+    except (TypeError, ValueError) as fout:
+        raise OngeldigVerzoek(f'ongeldige waarde: {fout}') from None
+
+
+def uitsnede_uit_zoekvraag(register, zoekvraag):
+    # Rechthoek, straal of dichtstbijzijnde k uit de zoekvraag van /gebied
+    try:
+        vraag = {naam: waarden[0] for naam, waarden in parse_qs(zoekvraag).items()}
+        if 'rechthoek' in vraag:
+            grenzen = [float(waarde) for waarde in vraag['rechthoek'].split(',')]
+            if len(grenzen) != 4:
+                raise OngeldigVerzoek('rechthoek is xmin,ymin,xmax,ymax')
+            return register.rechthoek(*grenzen)
+        x, y = float(vraag['x']), float(vraag['y'])
+        if 'straal' in vraag:
+            return register.straal(x, y, float(vraag['straal']))
+        if 'k' in vraag:
+            return register.dichtstbij(x, y, int(vraag['k']))
+        raise OngeldigVerzoek("verwacht 'rechthoek', 'straal' of 'k'")
+    except OngeldigVerzoek:
+        raise
+    except KeyError as fout:
+        raise OngeldigVerzoek(f'parameter ontbreekt: {fout.args[0]}') from None
+    except ValueError as fout:
+        raise OngeldigVerzoek(f'ongeldige waarde: {fout}') from None
+
+
+class DuikerService:
+    def __init__(self, venster=0.002, max_rijen=100_000, register=None):
+        self.batcher = MicroBatcher(venster, max_rijen)
+        self.metriek = Metriek()
+        # RuimtelijkRegister voor /gebied (optioneel)
+        self.register = register
+
+    def gebied(self, zoekvraag):
+        if self.register is None:
+            return 404, dict(fout='geen register geladen (start --register)')
+        start = time.perf_counter()
+        try:
+            uitsnede = uitsnede_uit_zoekvraag(self.register, zoekvraag)
+        except OngeldigVerzoek as fout:
+            self.metriek.fouten += 1
+            return 400, dict(fout=str(fout))
+        antwoord = {naam: [_json_getal(w) for w in kolom.tolist()]
+                    for naam, kolom in self.register.uitkomsten(uitsnede.rijen).items()}
+        antwoord.update(rij=uitsnede.rijen.tolist(), x=uitsnede.x.tolist(), y=uitsnede.y.tolist())
+        if uitsnede.namen is not None:
+            antwoord['naam'] = uitsnede.namen.tolist()
+        if uitsnede.afstand is not None:
+            antwoord['afstand'] = uitsnede.afstand.tolist()
+        latentie = time.perf_counter() - start
+        self.metriek.registreer(len(uitsnede), latentie, 1)
+        antwoord['metriek'] = dict(latentie_ms=latentie * 1000, berekend=self.register.berekend)
+        return 200, antwoord
+
+    async def behandel(self, methode, pad, inhoud, zoekvraag=''):
+        # Geeft (status, antwoord-dict)
+        if methode == 'GET' and pad == '/metriek':
+            return 200, self.metriek.overzicht()
+        if methode == 'GET' and pad == '/gezondheid':
+            return 200, dict(status='ok')
+        if methode == 'GET' and pad == '/gebied':
+            return self.gebied(zoekvraag)
+        if methode != 'POST' or pad not in ('/duiker', '/duikers'):
+            return 404, dict(fout=f'onbekend: {methode} {pad}')
+        start = time.perf_counter()
+        try:
+            kolommen = kolommen_uit_json(json.loads(inhoud or b'null'), meerdere=pad == '/duikers')
+        except (OngeldigVerzoek, json.JSONDecodeError) as fout:
+            self.metriek.fouten += 1
+            return 400, dict(fout=str(fout))
+        try:
+            resultaten, info = await self.batcher.bereken(kolommen)
+        except Exception as fout:
+            self.metriek.fouten += 1
+            return 500, dict(fout=f'rekenfout: {fout}')
+        latentie = time.perf_counter() - start
+        rijen = len(kolommen['diameter'])
+        self.metriek.registreer(rijen, latentie, info['batch_verzoeken'])
+        if pad == '/duiker':
+            antwoord = {naam: _json_getal(resultaten[naam][0]) for naam in GROOTHEDEN}
+        else:
+            antwoord = {naam: [_json_getal(w) for w in resultaten[naam].tolist()] for naam in GROOTHEDEN}
+        antwoord['metriek'] = dict(latentie_ms=latentie * 1000, **info)
+        return 200, antwoord
+
+
+## HTTP:
+# ===================================
+REDENEN = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+
+async def _lees_verzoek(lezer, max_inhoud):
+    regel = await lezer.readline()
+    if not regel:
+        return None
+    methode, pad, _ = regel.decode('latin-1').split(' ', 2)
+    koppen = {}
+    while True:
+        kop = await lezer.readline()
+        if kop in (b'\r\n', b'\n', b''):
+            break
+        naam, _, waarde = kop.decode('latin-1').partition(':')
+        koppen[naam.strip().lower()] = waarde.strip()
+    lengte = int(koppen.get('content-length', 0))
+    if lengte > max_inhoud:
+        return methode, pad, koppen, None
+    inhoud = await lezer.readexactly(lengte) if lengte else b''
+    return methode, pad, koppen, inhoud
+
+
+def _antwoord(status, gegevens, open_houden):
+    inhoud = json.dumps(gegevens).encode()
+    kop = (f'HTTP/1.1 {status} {REDENEN[status]}\r\n'
+           f'Content-Type: application/json\r\n'
+           f'Content-Length: {len(inhoud)}\r\n'
+           f'Connection: {"keep-alive" if open_houden else "close"}\r\n\r\n')
+    return kop.encode('latin-1') + inhoud
+
+
+async def start_service(service, host='127.0.0.1', poort=8765, max_inhoud=64 * 1024 * 1024):
+    async def verbinding(lezer, schrijver):
+        try:
+            while True:
+                verzoek = await _lees_verzoek(lezer, max_inhoud)
+                if verzoek is None:
+                    break
+                methode, pad, koppen, inhoud = verzoek
+                open_houden = koppen.get('connection', '').lower() != 'close'
+                if inhoud is None:
+                    schrijver.write(_antwoord(413, dict(fout='verzoek te groot'), False))
+                    break
+                pad, _, zoekvraag = pad.partition('?')
+                status, gegevens = await service.behandel(methode, pad, inhoud, zoekvraag)
+                schrijver.write(_antwoord(status, gegevens, open_houden))
+                await schrijver.drain()
+                if not open_houden:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            schrijver.close()
+
+    return await asyncio.start_server(verbinding, host, poort)
+
+
+## Belastingstest:
+# ===================================
+async def belast(host='127.0.0.1', poort=8765, verzoeken=10_000, gelijktijdig=100):
+    # Veel kleine /duiker-verzoeken over `gelijktijdig` open verbindingen
+    inhoud = json.dumps(dict(diameter=0.5, lengte=21.0, sliblaag_procent=0.1, intreedweerstand=0.4,
+                             uittreedweerstand=1.0, ben_str_nat_opp=5.0, manning=75.0,
+                             bovenwaterstand=0.05, benedenwaterstand=0.0)).encode()
+    verzoek = (f'POST /duiker HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+               f'Content-Length: {len(inhoud)}\r\n\r\n').encode('latin-1') + inhoud
+    latenties = []
+
+    async def klant(aantal):
+        lezer, schrijver = await asyncio.open_connection(host, poort)
+        for _ in range(aantal):
+            begin = time.perf_counter()
+            schrijver.write(verzoek)
+            await schrijver.drain()
+            await _lees_antwoord(lezer)
+            latenties.append(time.perf_counter() - begin)
+        schrijver.close()
+
+    start = time.perf_counter()
+    per_klant = [verzoeken // gelijktijdig + (i < verzoeken % gelijktijdig) for i in range(gelijktijdig)]
+    await asyncio.gather(*(klant(aantal) for aantal in per_klant if aantal))
+    duur = time.perf_counter() - start
+    latenties = np.array(latenties) * 1000
+    return dict(verzoeken=len(latenties), seconden=duur, verzoeken_per_seconde=len(latenties)/duur,
+                latentie_ms=dict(zip(('p50', 'p95', 'p99'), np.percentile(latenties, [50, 95, 99]).tolist())))
+
+
+async def _lees_antwoord(lezer):
+    statusregel = await lezer.readline()
+    koppen = {}
+    while True:
+        kop = await lezer.readline()
+        if kop in (b'\r\n', b'\n', b''):
+            break
+        naam, _, waarde = kop.decode('latin-1').partition(':')
+        koppen[naam.strip().lower()] = waarde.strip()
+    inhoud = await lezer.readexactly(int(koppen.get('content-length', 0)))
+    return statusregel, inhoud
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Duiker tool: lokale JSON-service.')
+    sub = parser.add_subparsers(dest='opdracht', required=True)
+    start = sub.add_parser('start', help='service starten')
+    start.add_argument('--host', default='127.0.0.1')
+    start.add_argument('--poort', type=int, default=8765)
+    start.add_argument('--venster-ms', type=float, default=2.0, help='wachttijd voor het samenvoegen van verzoeken')
+    start.add_argument('--max-rijen', type=int, default=100_000, help='batch direct rekenen vanaf dit aantal rijen')
+    start.add_argument('--register', help='GeoJSON/CSV met een ligging per duiker voor GET /gebied')
+    start.add_argument('--naamkolom', help='kolom met de naam van de duiker in het register')
+    test = sub.add_parser('belast', help='belastingstest tegen een draaiende service')
+    test.add_argument('--host', default='127.0.0.1')
+    test.add_argument('--poort', type=int, default=8765)
+    test.add_argument('--verzoeken', type=int, default=10_000)
+    test.add_argument('--gelijktijdig', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    if args.opdracht == 'belast':
+        print(json.dumps(asyncio.run(belast(args.host, args.poort, args.verzoeken, args.gelijktijdig)), indent=2))
+        return 0
+
+    register = None
+    if args.register:
+        from duiker_ruimte import lees_register
+        try:
+            register = lees_register(args.register, naamkolom=args.naamkolom)
+        except (KeyError, ValueError, OSError) as fout:
+            print(f'fout: {fout}', file=sys.stderr)
+            return 1
+        print(f'{len(register)} duikers in de ruimtelijke index', file=sys.stderr)
+
+    async def draai():
+        service = DuikerService(args.venster_ms/1000, args.max_rijen, register)
+        server = await start_service(service, args.host, args.poort)
+        print(f'Duiker service op http://{args.host}:{args.poort}', file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(draai())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,210 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+## Duiker tekening
+# =============================================================================
+# De schematische tekening (DuikerSchematisch_V2.jpg met labels) en de
+# begrensde cache, zonder streamlit. PIL wordt pas geladen als er getekend
+# wordt. DuikerTool.py gebruikt dit voor de GUI, duiker_rapport.py voor
+# rapporten met duizenden tekeningen in een pool van werkers.
+
+MAP = os.path.dirname(os.path.abspath(__file__))
+
+## Begrensde cache:
+# ===================================
+class LRUCache:
+    # Thread-veilige cache met een maximum aantal items en eventueel een
+    # maximum aantal bytes (grootte(waarde) per item); het minst recent
+    # gebruikte item valt eruit. Houdt treffers en missers bij.
+    def __init__(self, maximum=128, max_bytes=None, grootte=None):
+        self.maximum = maximum
+        self.max_bytes = max_bytes
+        self.grootte = grootte
+        self.bytes = 0
+        self.treffers = 0
+        self.missers = 0
+        self._items = OrderedDict()
+        self._groottes = {}
+        self._slot = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, sleutel):
+        return sleutel in self._items
+
+    def ophalen(self, sleutel, maak):
+        # Waarde uit de cache, of maak() aanroepen en de uitkomst bewaren.
+        # maak() draait buiten het slot, zodat andere sessies niet wachten.
+        with self._slot:
+            if sleutel in self._items:
+                self._items.move_to_end(sleutel)
+                self.treffers += 1
+                return self._items[sleutel]
+            self.missers += 1
+        waarde = maak()
+        grootte = self.grootte(waarde) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and grootte > self.max_bytes:
+            return waarde
+        with self._slot:
+            self.bytes += grootte - self._groottes.get(sleutel, 0)
+            self._items[sleutel] = waarde
+            self._groottes[sleutel] = grootte
+            self._items.move_to_end(sleutel)
+            while len(self._items) > self.maximum or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                oudste, _ = self._items.popitem(last=False)
+                self.bytes -= self._groottes.pop(oudste)
+        return waarde
+
+    def leeg(self):
+        with self._slot:
+            self._items.clear()
+            self._groottes.clear()
+            self.bytes = 0
+
+## Visualisatie:
+# ===================================
+def duiker_labels(diameter: float,
+                  lengte: float,
+                  sliblaag_cm: float,
+                  sliblaag_procent: float,
+                  intreedweerstand: float,
+                  uittreedweerstand: float,
+                  ben_str_nat_opp: float,
+                  manning: float,
+                  verval: float,
+                  bovenwaterstand: float,
+                  benedenwaterstand: float,
+                  keuze_sliblaag: str,
+                  keuze_verval: str,
+                  profiel: str = 'rond',
+                  hoogte: float = None, **kwargs):
+    # Teksten op de schematische tekening: naam -> (positie, tekst)
+    labels = {}
+    # Diameter, of de maten van een ander profiel
+    if profiel == 'rond':
+        labels['diameter'] = ((760, 280), f'Diameter: {diameter} [m]')
+    elif hoogte is None:
+        labels['diameter'] = ((760, 280), f'{profiel.capitalize()}: {diameter} [m]')
+    else:
+        labels['diameter'] = ((760, 280), f'{profiel.capitalize()}: {diameter} x {hoogte} [m]')
+    # Lengte duiker
+    labels['lengte'] = ((650, 360), f'Lengte: {lengte} [m]')
+    # Keuze "percentage ondergronds" of "cm sliblaag"
+    if keuze_sliblaag == 'percentage T.O.V. duiker':
+        # Percentage ondergronds
+        labels['sliblaag'] = ((1150, 345), f'Sliblaag: {sliblaag_procent * 100} [%]')
+    elif keuze_sliblaag == 'cm sliblaag':
+        # cm Sliblaag
+        labels['sliblaag'] = ((1150, 345), f'Sliblaag: {sliblaag_cm} [cm]')
+    # Intreedweerstand
+    labels['intreedweerstand'] = ((400, 17), f'Intreedweerstand: {intreedweerstand}')
+    # Uittreedweerstand
+    labels['uittreedweerstand'] = ((950, 17), f'Uittreedweerstand: {uittreedweerstand}')
+    # Manning
+    labels['manning'] = ((670, 17), f'Manning: {manning}')
+    # Keuze "Verval" of "Werkelijke hoogte in +mNAP"
+    if keuze_verval == 'Verval':
+        labels['bovenwaterstand'] = ((210, 200), 'Bovenwaterstand: N.V.T.')
+        labels['benedenwaterstand'] = ((1060, 300), 'Benedenwaterstand: N.V.T.')
+        labels['verval'] = ((1120, 180), f'Verval: {verval*100} [cm]')
+    elif keuze_verval == 'Werkelijke hoogte in +mNAP':
+        labels['bovenwaterstand'] = ((110, 200), f'Bovenwaterstand: {bovenwaterstand} [+mNAP]')
+        labels['benedenwaterstand'] = ((1060, 300), f'Benedenwaterstand: {benedenwaterstand} [+mNAP]')
+        labels['verval'] = ((1120, 180), 'Verval: N.V.T')
+    return labels
+
+
+class DuikerRenderer:
+    # Houdt de gedecodeerde achtergrond en het lettertype in het geheugen en
+    # tekent bij een nieuwe invoer alleen de labels die veranderd zijn: het
+    # oude label wordt met de achtergrond overschreven en opnieuw getekend.
+    # Gecodeerde figuren worden in een begrensde LRU bewaard, met de labels
+    # en het formaat als sleutel. Met onderrand > 0 komt er een lege band van
+    # zoveel pixels onder de tekening, bijvoorbeeld voor resultaten.
+    formaten = {'PNG': dict(format='PNG', compress_level=1),
+                'JPEG': dict(format='JPEG', quality=90),
+                'WEBP': dict(format='WEBP', quality=90, method=0)}
+
+    def __init__(self, achtergrond='DuikerSchematisch_V2.jpg', lettertype='AllerBd.TTF',
+                 lettergrootte=15, cache_grootte=64, onderrand=0):
+        # PIL wordt pas geladen als er getekend wordt
+        from PIL import Image, ImageDraw, ImageFont
+        with Image.open(os.path.join(MAP, achtergrond)) as figuur:
+            tekening = figuur.convert('RGB')
+        self.achtergrond = Image.new('RGB', (tekening.width, tekening.height + onderrand), (255, 255, 255))
+        self.achtergrond.paste(tekening, (0, 0))
+        lettertype = os.path.join(MAP, lettertype)
+        self.lettertype = ImageFont.truetype(font=lettertype, size=lettergrootte, index=0, encoding='', layout_engine=None)
+        self.cache = LRUCache(cache_grootte)
+        self._werkblad = self.achtergrond.copy()
+        self._tekenaar = ImageDraw.Draw(self._werkblad)
+        self._getekend = {}
+        self._slot = threading.Lock()
+
+    @property
+    def grootte(self):
+        # (breedte, hoogte) in pixels
+        return self.achtergrond.size
+
+    def _kader(self, positie, tekst):
+        return self._tekenaar.textbbox(positie, tekst, font=self.lettertype)
+
+    def _bijwerken(self, labels):
+        # Oude labels die verdwijnen of veranderen wissen met de achtergrond
+        gewist = []
+        for naam, label in self._getekend.items():
+            if labels.get(naam) != label:
+                kader = self._kader(*label)
+                self._werkblad.paste(self.achtergrond.crop(kader), kader[:2])
+                gewist.append(kader)
+        # Nieuwe en veranderde labels tekenen, plus labels die door het wissen geraakt zijn
+        for naam, label in labels.items():
+            kader = self._kader(*label)
+            geraakt = any(kader[0] < w[2] and w[0] < kader[2] and kader[1] < w[3] and w[1] < kader[3]
+                          for w in gewist)
+            if self._getekend.get(naam) != label or geraakt:
+                self._tekenaar.text(label[0], label[1], font=self.lettertype, fill=(0, 0, 0))
+        self._getekend = dict(labels)
+
+    def figuur(self, **invoer):
+        # Kopie van de tekening met de labels voor deze invoer
+        with self._slot:
+            self._bijwerken(duiker_labels(**invoer))
+            return self._werkblad.copy()
+
+    def render(self, formaat='PNG', **invoer):
+        # Gecodeerde tekening (bytes) in PNG, JPEG of WEBP
+        formaat = formaat.upper()
+        if formaat not in self.formaten:
+            raise ValueError(f"onbekend formaat '{formaat}', kies uit {', '.join(self.formaten)}")
+        labels = duiker_labels(**invoer)
+        sleutel = (formaat, tuple(sorted(labels.items())))
+        return self.cache.ophalen(sleutel, lambda: self.codeer(labels, formaat))
+
+    def codeer(self, labels, formaat='PNG'):
+        # Tekening met deze labels (naam -> (positie, tekst)) gecodeerd,
+        # buiten de cache om
+        formaat = formaat.upper()
+        with self._slot:
+            self._bijwerken(labels)
+            buff = io.BytesIO()
+            self._werkblad.save(buff, **self.formaten[formaat])
+            return buff.getvalue()
+
+
+_renderer = None
+
+
+def duiker_renderer():
+    # Eén gedeelde renderer per proces
+    global _renderer
+    if _renderer is None:
+        _renderer = DuikerRenderer()
+    return _renderer
+
+
+def duiker_visualisatie(formaat='PNG', **invoer):
+    return io.BytesIO(duiker_renderer().render(formaat, **invoer))
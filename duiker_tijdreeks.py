@@ -0,0 +1,212 @@
+import argparse
+import json
+import math
+import sys
+import time
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from duiker_kern import Afvoerkromme, DuikerArray
+
+## Duiker tijdreeks
+# =============================================================================
+# Debiet en stroomsnelheid door één duiker voor jaren aan loggerdata
+# (bovenwaterstand en benedenwaterstand per tijdstap). De reeks wordt in
+# blokken gelezen: uit een binair bestand via np.memmap of uit een CSV in
+# stukken. Per blok wordt vectorieel gerekend met de afvoerkromme
+# (Q = C * h**0.5). Dagvolumes en pieken worden onderweg bijgehouden.
+#
+#   python duiker_tijdreeks.py duiker.json niveaus.bin debiet.bin --dagvolumes dag.csv
+#
+# Binaire bestanden bevatten records van TIJDREEKS_DTYPE: tijd in seconden
+# sinds 1970-01-01 UTC, bovenwaterstand en benedenwaterstand in +mNAP. Een
+# CSV heeft de kolommen tijd (datum en tijd, of seconden sinds 1970-01-01
+# UTC), bovenwaterstand en benedenwaterstand.
+#
+# Is de benedenwaterstand hoger dan de bovenwaterstand, dan stroomt het
+# water terug: debiet en stroomsnelheid zijn dan negatief. Bij terugstroming
+# worden intreed- en uittreedweerstand verwisseld; het natte oppervlak
+# benedenstrooms blijft gelijk. Bij nul verval zijn debiet en snelheid 0.
+
+TIJDREEKS_DTYPE = np.dtype([('tijd', '<f8'), ('bovenwaterstand', '<f8'), ('benedenwaterstand', '<f8')])
+RESULTAAT_DTYPE = np.dtype([('tijd', '<f8'), ('debiet', '<f8'), ('stroomsnelheid', '<f8')])
+SECONDEN_PER_DAG = 86400.0
+
+
+## Lezen en schrijven:
+# ===================================
+def schrijf_binair(pad, tijd, bovenwaterstand, benedenwaterstand):
+    # Schrijft een reeks in het binaire formaat dat lees_blokken verwacht
+    records = np.empty(len(tijd), dtype=TIJDREEKS_DTYPE)
+    records['tijd'] = tijd
+    records['bovenwaterstand'] = bovenwaterstand
+    records['benedenwaterstand'] = benedenwaterstand
+    records.tofile(pad)
+
+
+def lees_blokken(pad, blokgrootte=1_000_000):
+    # Geeft blokken (tijd, bovenwaterstand, benedenwaterstand) als float64-arrays
+    if pad.lower().endswith('.csv'):
+        for blok in pd.read_csv(pad, chunksize=blokgrootte):
+            # Een numerieke tijd is in seconden sinds 1970, net als binair
+            if pd.api.types.is_numeric_dtype(blok['tijd']):
+                tijd = pd.to_datetime(blok['tijd'], unit='s', utc=True)
+            else:
+                tijd = pd.to_datetime(blok['tijd'], utc=True)
+            seconden = (tijd - pd.Timestamp('1970-01-01', tz='UTC')).dt.total_seconds().to_numpy()
+            yield (seconden,
+                   pd.to_numeric(blok['bovenwaterstand'], errors='coerce').to_numpy(dtype=float),
+                   pd.to_numeric(blok['benedenwaterstand'], errors='coerce').to_numpy(dtype=float))
+    else:
+        reeks = np.memmap(pad, dtype=TIJDREEKS_DTYPE, mode='r')
+        for begin in range(0, len(reeks), blokgrootte):
+            blok = reeks[begin:begin + blokgrootte]
+            yield (np.asarray(blok['tijd'], dtype=float),
+                   np.asarray(blok['bovenwaterstand'], dtype=float),
+                   np.asarray(blok['benedenwaterstand'], dtype=float))
+
+
+## Rekenen:
+# ===================================
+class TijdreeksDuiker:
+    # Coëfficiënten voor beide stroomrichtingen, één keer berekend
+    def __init__(self, duiker):
+        velden = {veld: duiker[veld] for veld in DuikerArray.velden}
+        voor = DuikerArray(**velden, **DuikerArray.profiel_uit_dict(duiker))
+        terug = voor.vervang(intreedweerstand=velden['uittreedweerstand'],
+                             uittreedweerstand=velden['intreedweerstand'])
+        self.c_voor = float(Afvoerkromme(voor).coefficient[0])
+        self.c_terug = float(Afvoerkromme(terug).coefficient[0])
+        self.nat_opp_duiker = float(voor.nat_opp_duiker[0])
+
+    def debiet(self, bovenwaterstand, benedenwaterstand):
+        verval = np.asarray(bovenwaterstand, dtype=float) - np.asarray(benedenwaterstand, dtype=float)
+        coefficient = np.where(verval >= 0, self.c_voor, self.c_terug)
+        return np.sign(verval) * coefficient * np.sqrt(np.abs(verval))
+
+    def stroomsnelheid(self, debiet):
+        return debiet/self.nat_opp_duiker if self.nat_opp_duiker > 0 else np.zeros_like(debiet)
+
+
+class Piek(NamedTuple):
+    tijd: float
+    debiet: float
+
+
+class TijdreeksResultaat(NamedTuple):
+    monsters: int
+    ontbrekend: int
+    seconden: float
+    monsters_per_seconde: float
+    dagen: np.ndarray
+    dagvolumes: np.ndarray
+    piek: Piek
+    piek_terug: Piek
+
+    def dagvolumes_tabel(self):
+        # Dagvolumes [m3] als tabel met een datum per dag (UTC)
+        return pd.DataFrame({'datum': pd.to_datetime(self.dagen * SECONDEN_PER_DAG, unit='s').date,
+                             'volume': self.dagvolumes})
+
+
+def bereken_tijdreeks(duiker, invoer, uitvoer=None, blokgrootte=1_000_000, max_stap=3600.0, meld=None):
+    # duiker: dict met de velden van Duiker. Het volume van een tijdstap is
+    # het debiet maal de tijd sinds de vorige meting; stappen langer dan
+    # max_stap [s] gelden als gat in de reeks en tellen niet mee.
+    rekenaar = TijdreeksDuiker(duiker)
+    dagvolumes = {}
+    piek = Piek(math.nan, -math.inf)
+    piek_terug = Piek(math.nan, math.inf)
+    monsters = ontbrekend = 0
+    vorige_tijd = math.nan
+    start = time.perf_counter()
+    bestand = open(uitvoer, 'wb') if uitvoer is not None else None
+    try:
+        for tijd, boven, beneden in lees_blokken(invoer, blokgrootte):
+            debiet = rekenaar.debiet(boven, beneden)
+            snelheid = rekenaar.stroomsnelheid(debiet)
+            if bestand is not None:
+                records = np.empty(len(tijd), dtype=RESULTAAT_DTYPE)
+                records['tijd'] = tijd
+                records['debiet'] = debiet
+                records['stroomsnelheid'] = snelheid
+                records.tofile(bestand)
+            # Volumes per dag
+            stap = np.diff(tijd, prepend=vorige_tijd)
+            stap = np.where((stap > 0) & (stap <= max_stap), stap, 0.0)
+            geldig = np.isfinite(debiet)
+            dag = np.floor(tijd/SECONDEN_PER_DAG).astype(np.int64)
+            dagen, positie = np.unique(dag[geldig], return_inverse=True)
+            volumes = np.bincount(positie, weights=(debiet * stap)[geldig], minlength=len(dagen))
+            for d, v in zip(dagen.tolist(), volumes.tolist()):
+                dagvolumes[d] = dagvolumes.get(d, 0.0) + v
+            # Pieken in beide richtingen
+            if geldig.any():
+                hoogste = np.nanargmax(debiet)
+                laagste = np.nanargmin(debiet)
+                if debiet[hoogste] > piek.debiet:
+                    piek = Piek(float(tijd[hoogste]), float(debiet[hoogste]))
+                if debiet[laagste] < piek_terug.debiet:
+                    piek_terug = Piek(float(tijd[laagste]), float(debiet[laagste]))
+            monsters += len(tijd)
+            ontbrekend += int(len(tijd) - np.count_nonzero(geldig))
+            vorige_tijd = tijd[-1] if len(tijd) else vorige_tijd
+            if meld is not None:
+                duur = time.perf_counter() - start
+                meld(f'{monsters} monsters, {monsters/max(duur, 1e-9):,.0f} monsters/s')
+    finally:
+        if bestand is not None:
+            bestand.close()
+    duur = time.perf_counter() - start
+    dagen = np.array(sorted(dagvolumes), dtype=np.int64)
+    if not math.isfinite(piek.debiet):
+        piek = Piek(math.nan, math.nan)
+    if piek_terug.debiet >= 0:
+        piek_terug = Piek(math.nan, 0.0)
+    return TijdreeksResultaat(monsters=monsters,
+                              ontbrekend=ontbrekend,
+                              seconden=duur,
+                              monsters_per_seconde=monsters/max(duur, 1e-9),
+                              dagen=dagen,
+                              dagvolumes=np.array([dagvolumes[d] for d in dagen.tolist()]),
+                              piek=piek,
+                              piek_terug=piek_terug)
+
+
+def _tijd_tekst(seconden):
+    if math.isnan(seconden):
+        return '-'
+    return pd.Timestamp(seconden, unit='s', tz='UTC').isoformat()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Duiker tool: debiet door een duiker voor een waterstandsreeks.')
+    parser.add_argument('duiker', help='JSON-bestand met de velden van Duiker')
+    parser.add_argument('invoer', help='binaire reeks (TIJDREEKS_DTYPE) of CSV met tijd, bovenwaterstand, benedenwaterstand')
+    parser.add_argument('uitvoer', nargs='?', help='binair bestand voor tijd, debiet en stroomsnelheid (RESULTAAT_DTYPE)')
+    parser.add_argument('--dagvolumes', help='CSV-bestand voor de volumes per dag')
+    parser.add_argument('--blokgrootte', type=int, default=1_000_000, help='aantal tijdstappen per blok')
+    parser.add_argument('--max-stap', type=float, default=3600.0, help='langere tijdstappen [s] gelden als gat')
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.duiker) as bestand:
+            duiker = json.load(bestand)
+        resultaat = bereken_tijdreeks(duiker, args.invoer, args.uitvoer, args.blokgrootte, args.max_stap)
+    except (OSError, KeyError, ValueError) as fout:
+        print(f'fout: {fout}', file=sys.stderr)
+        return 1
+    if args.dagvolumes:
+        resultaat.dagvolumes_tabel().to_csv(args.dagvolumes, index=False)
+    print(f'{resultaat.monsters} monsters in {resultaat.seconden:.2f} s '
+          f'({resultaat.monsters_per_seconde:,.0f} monsters/s), {resultaat.ontbrekend} ontbrekend', file=sys.stderr)
+    print(f'piekdebiet: {resultaat.piek.debiet:.3f} m3/s op {_tijd_tekst(resultaat.piek.tijd)}', file=sys.stderr)
+    print(f'piek terugstroming: {resultaat.piek_terug.debiet:.3f} m3/s op {_tijd_tekst(resultaat.piek_terug.tijd)}',
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
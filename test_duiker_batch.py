@@ -0,0 +1,64 @@
+## Tests duiker_batch
+# =============================================================================
+#   python -m pytest -q test_duiker_batch.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from duiker_batch import bereken_blok, verwerk
+
+
+def _register(aantal=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(dict(diameter=rng.uniform(0.3, 2.0, aantal),
+                             lengte=rng.uniform(5.0, 100.0, aantal),
+                             sliblaag_pct=rng.uniform(0.0, 40.0, aantal),
+                             intreedweerstand=0.4,
+                             uittreedweerstand=1.0,
+                             ben_str_nat_opp=rng.uniform(5.0, 50.0, aantal),
+                             manning=rng.uniform(40.0, 80.0, aantal),
+                             verval=rng.uniform(0.0, 30.0, aantal)))
+
+
+## Afgekeurde rijen:
+# ===================================
+def test_afgekeurde_rijen_krijgen_een_melding():
+    blok = _register(6).assign(profiel='rond')
+    blok.loc[1, 'diameter'] = np.nan
+    blok.loc[2, 'profiel'] = 'driehoek'
+    blok.loc[3, 'diameter'] = 0.0
+    blok.loc[4, 'sliblaag_pct'] = 120.0
+    blok.loc[5, 'verval'] = -3.0
+    goed, afgekeurd = bereken_blok(blok)
+    assert goed.index.tolist() == [0]
+    assert afgekeurd['fout'].tolist() == ['ontbrekende of niet-numerieke invoer',
+                                          'onbekend profiel',
+                                          'diameter moet groter dan 0 zijn',
+                                          'sliblaag buiten 0-100% van de hoogte',
+                                          'negatief verval']
+
+
+def test_volledig_dichtgeslibde_duiker_geeft_nul_debiet():
+    blok = _register(2).assign(sliblaag_pct=[100.0, 10.0])
+    goed, afgekeurd = bereken_blok(blok)
+    assert len(afgekeurd) == 0
+    assert goed['debiet'].iat[0] == 0.0 and goed['stroomsnelheid'].iat[0] == 0.0
+
+
+## Bestanden:
+# ===================================
+def test_verwerk_schrijft_afgekeurd_bestand(tmp_path):
+    register = _register(10)
+    register.loc[[3, 7], 'manning'] = 'onbekend'
+    register.to_csv(tmp_path / 'register.csv', index=False)
+    telling = verwerk(str(tmp_path / 'register.csv'), str(tmp_path / 'uit.csv'), blokgrootte=4)
+    assert telling['rijen'] == 10 and telling['afgekeurd'] == 2
+    assert telling['afgekeurd_bestand'] == str(tmp_path / 'uit_afgekeurd.csv')
+    assert len(pd.read_csv(tmp_path / 'uit.csv')) == 8
+    assert pd.read_csv(tmp_path / 'uit_afgekeurd.csv')['manning'].tolist() == ['onbekend', 'onbekend']
+
+
+def test_ontbrekende_kolom_geeft_keyerror():
+    with pytest.raises(KeyError, match='verval'):
+        bereken_blok(_register(3).drop(columns='verval'))
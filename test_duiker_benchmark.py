@@ -0,0 +1,43 @@
+## Tests duiker_benchmark
+# =============================================================================
+#   python -m pytest -q test_duiker_benchmark.py
+
+import json
+import platform
+
+import pytest
+
+from duiker_benchmark import GROEPEN, controleer_gouden_waarden, lees_geschiedenis, paden, vergelijk
+
+
+## Gouden waarden:
+# ===================================
+def test_gouden_waarden_kloppen():
+    assert controleer_gouden_waarden(grootte=1_000) == []
+
+
+## Paden:
+# ===================================
+def test_paden_per_groep():
+    scalair = paden(1e3, ['scalair'])
+    assert scalair and {groep for groep, _, _ in scalair.values()} == {'scalair'}
+    assert set(GROEPEN) >= {'scalair', 'bulk', 'visualisatie', 'figuur', 'app'}
+
+
+def test_onbekende_groep():
+    with pytest.raises(ValueError, match='onbekende groepen: gpu'):
+        paden(1e3, ['scalair', 'gpu'])
+
+
+## Regressies:
+# ===================================
+def test_vergelijk_met_mediaan_van_dezelfde_machine(tmp_path):
+    pad = tmp_path / 'geschiedenis.jsonl'
+    assert lees_geschiedenis(pad) == []
+    runs = [dict(machine=platform.node(), tijden=dict(a=1.0, b=1.0)) for _ in range(3)]
+    runs.append(dict(machine='andere-machine', tijden=dict(a=0.1, b=0.1)))
+    pad.write_text(''.join(json.dumps(run) + '\n' for run in runs))
+    regressies = vergelijk(dict(a=1.5, b=1.1, c=9.0), lees_geschiedenis(pad), drempel=0.25)
+    # Alleen a is meer dan 25% trager; c heeft nog geen referentie
+    assert list(regressies) == ['a']
+    assert regressies['a'] == pytest.approx((1.5, 1.0, 0.5))
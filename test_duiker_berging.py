@@ -0,0 +1,103 @@
+## Tests duiker_berging
+# =============================================================================
+#   python -m pytest -q test_duiker_berging.py
+
+import numpy as np
+import pandas as pd
+
+from duiker_berging import BergingsModel, foutmeldingen, main, routeer, synthetisch_hydrogram
+from duiker_kern import synthetisch_register
+
+
+def _vakken(aantal=6):
+    # Beginpeil boven de benedenwaterstand, een golf van 6 uur
+    duikers = synthetisch_register(aantal, seed=3).vervang(bovenwaterstand=0.05, benedenwaterstand=0.0)
+    instroom, oppervlak = synthetisch_hydrogram(aantal, uren=6.0, seed=3)
+    return duikers, oppervlak, instroom
+
+
+def _referentie(model, tijden, stap=2.0):
+    # Klassieke RK4 met een vaste, kleine stap als expliciete referentie
+    vakken = np.arange(len(model.beginpeil))
+    peil = model.beginpeil.astype(float).copy()
+    reeks = [peil.copy()]
+    tijd = 0.0
+    for doel in tijden[1:]:
+        while tijd < doel - 1e-9:
+            h = min(stap, doel - tijd)
+            k1 = model.afgeleide(vakken, tijd, peil)
+            k2 = model.afgeleide(vakken, tijd + h/2, peil + h/2 * k1)
+            k3 = model.afgeleide(vakken, tijd + h/2, peil + h/2 * k2)
+            k4 = model.afgeleide(vakken, tijd + h, peil + h * k3)
+            peil = peil + h/6 * (k1 + 2*k2 + 2*k3 + k4)
+            tijd += h
+        reeks.append(peil.copy())
+    return np.array(reeks).T
+
+
+## Routering:
+# ===================================
+def test_routeer_volgt_fijne_expliciete_referentie():
+    duikers, oppervlak, instroom = _vakken()
+    routering = routeer(duikers, oppervlak, instroom, 600.0, oppervlak_helling=500.0, atol=1e-5, rtol=1e-5)
+    referentie = _referentie(BergingsModel(duikers, oppervlak, instroom, 600.0, 500.0), routering.tijd)
+    assert routering.geldig.all()
+    np.testing.assert_allclose(routering.peil, referentie, atol=1e-3)
+    np.testing.assert_allclose(routering.max_peil, referentie.max(axis=1), atol=1e-3)
+
+
+def test_ongeldig_vak_valt_af_zonder_de_rest_te_raken():
+    duikers, oppervlak, instroom = _vakken()
+    diameter = duikers.diameter.copy()
+    diameter[2] = np.nan
+    routering = routeer(duikers.vervang(diameter=diameter), oppervlak, instroom, 600.0)
+    los = routeer(duikers, oppervlak, instroom, 600.0)
+    assert routering.geldig.tolist() == [True, True, False, True, True, True]
+    assert np.isnan(routering.peil[2]).all() and np.isnan(routering.max_peil[2])
+    goed = routering.geldig
+    np.testing.assert_allclose(routering.peil[goed], los.peil[goed])
+
+
+def test_terugstroming_laat_peil_stijgen_naar_benedenwaterstand():
+    # Geen instroom en een beginpeil onder de benedenwaterstand
+    duikers = synthetisch_register(3).vervang(bovenwaterstand=-0.2, benedenwaterstand=0.0)
+    routering = routeer(duikers, 2_000.0, np.zeros(13), 600.0)
+    # Binnen de toegestane fout per stap (atol) geen daling en geen overschot
+    assert (np.diff(routering.peil, axis=1) >= -1e-4).all()
+    assert (routering.peil <= 1e-4).all()
+
+
+## Foutmeldingen:
+# ===================================
+def test_foutmeldingen_per_vak():
+    duikers, oppervlak, instroom = _vakken(4)
+    oppervlak = oppervlak.copy()
+    oppervlak[1] = 0.0
+    instroom = instroom.copy()
+    instroom[3, 5] = np.nan
+    # Beginpeil onder de benedenwaterstand is geen fout
+    duikers = duikers.vervang(bovenwaterstand=np.array([-0.1, 0.05, 0.05, 0.05]))
+    fouten = foutmeldingen(duikers, oppervlak, 0.0, instroom)
+    assert fouten[0] == '' and fouten[2] == ''
+    assert fouten[1] == 'bergend oppervlak moet groter dan 0 zijn'
+    assert fouten[3] == 'hydrogram van het vak bevat ontbrekende waarden'
+
+
+def test_main_schrijft_afgekeurde_vakken(tmp_path):
+    vakken = pd.DataFrame(dict(naam=['a', 'b', 'c'], diameter=[0.5, None, 0.8], lengte=20.0,
+                               sliblaag_pct=10.0, intreedweerstand=0.4, uittreedweerstand=1.0,
+                               ben_str_nat_opp=10.0, manning=75.0, bovenwaterstand=0.05,
+                               benedenwaterstand=0.0, oppervlak=5_000.0))
+    vakken.to_csv(tmp_path / 'vakken.csv', index=False)
+    uur = np.arange(0.0, 6.01, 0.5)
+    pd.DataFrame(dict(uur=uur, instroom=0.02 + 0.5 * np.exp(-((uur - 2.0)/1.0)**2))).to_csv(
+        tmp_path / 'hydrogram.csv', index=False)
+    status = main([str(tmp_path / 'vakken.csv'), str(tmp_path / 'hydrogram.csv'), str(tmp_path / 'pieken.csv'),
+                   '--naamkolom', 'naam'])
+    assert status == 0
+    pieken = pd.read_csv(tmp_path / 'pieken.csv')
+    afgekeurd = pd.read_csv(tmp_path / 'pieken_afgekeurd.csv')
+    assert pieken['naam'].tolist() == ['a', 'c']
+    assert np.isfinite(pieken['max_peil']).all()
+    assert afgekeurd['naam'].tolist() == ['b']
+    assert afgekeurd['fout'].tolist() == ['ontbrekende of niet-numerieke invoer']
@@ -0,0 +1,51 @@
+## Tests duiker_catalogus
+# =============================================================================
+#   python -m pytest -q test_duiker_catalogus.py
+
+import numpy as np
+
+from duiker_catalogus import Catalogus, selecteer, synthetische_catalogus, synthetische_locaties
+
+
+## Zoeken tegen alles:
+# ===================================
+def test_zoeken_geeft_dezelfde_keuze_als_alles():
+    catalogus = synthetische_catalogus()
+    locaties = synthetische_locaties(2_000, seed=5)
+    zoeken = selecteer(catalogus, **locaties)
+    alles = selecteer(catalogus, **locaties, methode='alles', blok=50_000)
+    np.testing.assert_array_equal(zoeken.keuze, alles.keuze)
+    np.testing.assert_array_equal(zoeken.tweede, alles.tweede)
+    np.testing.assert_allclose(zoeken.kosten, alles.kosten)
+    np.testing.assert_allclose(zoeken.opstuwing, alles.opstuwing)
+    # Er zitten locaties met en zonder passende buis in
+    assert (zoeken.keuze >= 0).any() and (zoeken.keuze < 0).any()
+
+
+def test_keuze_voldoet_aan_de_norm_en_is_goedkoopst():
+    catalogus = synthetische_catalogus()
+    locaties = synthetische_locaties(500, seed=6)
+    selectie = selecteer(catalogus, **locaties)
+    gekozen = selectie.keuze >= 0
+    assert (selectie.opstuwing[gekozen] <= locaties['max_opstuwing'][gekozen] * (1 + 1e-9)).all()
+    assert (selectie.kosten_tweede[selectie.tweede >= 0] >= selectie.kosten[selectie.tweede >= 0]).all()
+    assert np.isnan(selectie.kosten[~gekozen]).all()
+
+
+## Sparse table:
+# ===================================
+def test_goedkoopste_per_bereik_tegen_brute_kracht():
+    rng = np.random.default_rng(7)
+    # Twee reeksen; gelijke prijzen: de eerste in catalogusvolgorde gaat voor
+    catalogus = Catalogus(naam=[f'b{i}' for i in range(37)], diameter=np.linspace(0.2, 2.0, 37),
+                          manning=np.where(np.arange(37) < 20, 70.0, 80.0),
+                          prijs_per_meter=rng.integers(1, 6, 37).astype(float))
+    assert len(catalogus.reeksen) == 2
+    for reeks, (begin, eind) in enumerate(catalogus.reeksen):
+        van, tot = np.triu_indices(eind - begin)
+        van, tot = van + begin, tot + begin
+        uitkomst = catalogus.goedkoopste(reeks, van, tot)
+        for (a, b), (eerste, tweede) in zip(zip(van, tot), uitkomst):
+            kandidaten = sorted(range(a, b + 1), key=lambda buis: (catalogus.prijs_per_meter[buis], buis))
+            assert eerste == kandidaten[0]
+            assert tweede == (kandidaten[1] if len(kandidaten) > 1 else -1)
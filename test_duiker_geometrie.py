@@ -0,0 +1,70 @@
+## Tests duiker_geometrie
+# =============================================================================
+#   python -m pytest -q test_duiker_geometrie.py
+
+import math
+
+import numpy as np
+import pytest
+
+from duiker_geometrie import ONBEKEND_PROFIEL, PROFIELEN, doorsnede, doorsnede_scalair, profielcodes
+
+# Fout van de tabel t.o.v. de gesloten vorm, als fractie van de volle
+# doorsnede; tabellen met een as voor hoogte/breedte interpoleren ook
+# daarin en zijn iets minder nauwkeurig
+RTOL = 1e-6
+RTOL_VERHOUDING = 1e-5
+FRACTIES = np.concatenate(([0.0, 1e-6, 0.5, 1.0 - 1e-6, 1.0], np.random.default_rng(0).uniform(0, 1, 200)))
+
+
+## Gesloten vorm:
+# ===================================
+def test_rond_gelijk_aan_cirkelsegment():
+    diameter = 0.8
+    r = diameter/2
+    dikte = FRACTIES * diameter
+    # Halve hoek van het segment onder de koorde
+    hoek = np.arccos(np.clip((r - dikte)/r, -1.0, 1.0))
+    koorde = 2 * np.sqrt(np.maximum(r**2 - (r - dikte)**2, 0.0))
+    segment = r**2 * hoek - (r - dikte) * koorde/2
+    nat_opp = math.pi * r**2 - segment
+    natte_omtrek = r * (2 * math.pi - 2 * hoek) + koorde
+    sliblaag, opp, omtrek = doorsnede(profielcodes('rond'), diameter, np.nan, FRACTIES)
+    np.testing.assert_allclose(sliblaag, segment, atol=RTOL * math.pi * r**2)
+    np.testing.assert_allclose(opp, nat_opp, atol=RTOL * math.pi * r**2)
+    np.testing.assert_allclose(omtrek, natte_omtrek, atol=RTOL * math.pi * diameter)
+
+
+@pytest.mark.parametrize('breedte, hoogte', [(1.2, 0.8), (0.5, 2.0), (1.0, np.nan)])
+def test_rechthoek_gelijk_aan_gesloten_vorm(breedte, hoogte):
+    h = breedte if np.isnan(hoogte) else hoogte
+    rtol = RTOL if h == breedte else RTOL_VERHOUDING
+    dikte = FRACTIES * h
+    sliblaag, opp, omtrek = doorsnede(profielcodes('rechthoek'), breedte, hoogte, FRACTIES)
+    np.testing.assert_allclose(sliblaag, breedte * dikte, atol=rtol * breedte * h)
+    np.testing.assert_allclose(opp, breedte * (h - dikte), atol=rtol * breedte * h)
+    # Wand en bovenkant boven het slib, plus het sliboppervlak
+    np.testing.assert_allclose(omtrek, 2 * breedte + 2 * (h - dikte), atol=rtol * 2 * (breedte + h))
+
+
+def test_scalair_gelijk_aan_gevectoriseerd():
+    for code, naam in enumerate(PROFIELEN):
+        hoogte = 0.9 if naam in ('rechthoek', 'ellips') else None
+        verwacht = doorsnede(np.int8(code), 0.6, np.nan if hoogte is None else hoogte, FRACTIES[:20])
+        for i, fractie in enumerate(FRACTIES[:20]):
+            uitkomst = doorsnede_scalair(naam, 0.6, hoogte, float(fractie))
+            assert uitkomst == pytest.approx([waarde[i] for waarde in verwacht], rel=1e-12, abs=1e-15)
+
+
+## Ongeldige invoer:
+# ===================================
+def test_buiten_het_bereik_geeft_nan():
+    codes = np.array([0, 1, ONBEKEND_PROFIEL, 0], dtype=np.int8)
+    sliblaag, opp, omtrek = doorsnede(codes, 1.0, np.array([np.nan, 50.0, np.nan, np.nan]),
+                                      np.array([0.1, 0.1, 0.1, 1.5]))
+    # Verhouding 50 valt buiten VERHOUDING_BEREIK, code -1 is onbekend, s > 1
+    assert np.isnan(opp[1:]).all() and np.isnan(omtrek[1:]).all()
+    assert np.isfinite(opp[0])
+    assert profielcodes(['rond', 'kubus'], streng=False).tolist() == [0, ONBEKEND_PROFIEL]
+    with pytest.raises(ValueError, match='onbekend profiel'):
+        profielcodes(['kubus'])
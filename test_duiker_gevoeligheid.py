@@ -0,0 +1,82 @@
+## Tests duiker_gevoeligheid
+# =============================================================================
+#   python -m pytest -q test_duiker_gevoeligheid.py
+
+import math
+
+import numpy as np
+import pytest
+
+from duiker_gevoeligheid import GEVOELIGHEID_UITVOER, gevoeligheden
+from duiker_kern import DuikerArray, synthetisch_register
+
+# Velden die niet via de profieltabel lopen; daar is de centrale differentie
+# op DuikerArray zelf de referentie
+NIET_GEOMETRISCH = ('lengte', 'intreedweerstand', 'uittreedweerstand', 'ben_str_nat_opp', 'manning',
+                    'bovenwaterstand', 'benedenwaterstand')
+
+
+def _register(profiel, aantal=120, seed=7):
+    duikers = synthetisch_register(aantal, seed=seed)
+    hoogte = duikers.diameter * np.random.default_rng(seed).uniform(0.5, 1.5, aantal)
+    return DuikerArray(**{veld: getattr(duikers, veld) for veld in DuikerArray.velden}, profiel=profiel,
+                       hoogte=hoogte if profiel in ('rechthoek', 'ellips') else np.nan)
+
+
+def _differentie(functie, x, stap):
+    return (functie(x + stap) - functie(x - stap))/(2 * stap)
+
+
+## Tegen eindige differenties:
+# ===================================
+@pytest.mark.parametrize('profiel', ['rond', 'rechthoek', 'eivorm', 'ellips'])
+def test_afgeleiden_gelijk_aan_differenties(profiel):
+    duikers = _register(profiel)
+    gevoeligheid = gevoeligheden(duikers)
+    for invoer in NIET_GEOMETRISCH:
+        x = getattr(duikers, invoer)
+        stap = 1e-6 * np.maximum(np.abs(x), 0.1)
+        for uitvoer in GEVOELIGHEID_UITVOER:
+            verwacht = _differentie(lambda waarde: getattr(duikers.vervang(**{invoer: waarde}), uitvoer), x, stap)
+            np.testing.assert_allclose(gevoeligheid.afgeleiden[uitvoer][invoer], verwacht, rtol=1e-5,
+                                       atol=1e-7 * np.abs(gevoeligheid.waarden[uitvoer]).max(),
+                                       err_msg=f'{uitvoer} naar {invoer}')
+
+
+def test_geometrie_gelijk_aan_differenties_van_de_cirkel():
+    # De profieltabel interpoleert; de afgeleiden naar diameter en sliblaag
+    # zijn exact en worden daarom met de cirkelformules vergeleken
+    duikers = _register('rond')
+
+    def debiet(diameter, fractie):
+        r, dikte = diameter/2, fractie * diameter
+        hoek = np.arccos((r - dikte)/r)
+        koorde = 2 * np.sqrt(r**2 - (r - dikte)**2)
+        opp = math.pi * r**2 - (r**2 * hoek - (r - dikte) * koorde/2)
+        straal = opp/(r * (2 * math.pi - 2 * hoek) + koorde)
+        chezy = duikers.manning * straal**(1.0/6.0)
+        weerstand = (duikers.intreedweerstand + duikers.uittreedweerstand * (1 - opp/duikers.ben_str_nat_opp)**2
+                     + 2 * 9.81 * duikers.lengte/(chezy**2 * straal))
+        return weerstand**-0.5 * opp * np.sqrt(2 * 9.81 * duikers.opstuwing)
+
+    afgeleiden = gevoeligheden(duikers).afgeleiden['debiet']
+    diameter, fractie = duikers.diameter, duikers.sliblaag_procent
+    np.testing.assert_allclose(afgeleiden['diameter'],
+                               _differentie(lambda d: debiet(d, fractie), diameter, 1e-6 * diameter), rtol=2e-5)
+    np.testing.assert_allclose(afgeleiden['sliblaag_procent'],
+                               _differentie(lambda s: debiet(diameter, s), fractie, 1e-6), rtol=2e-5)
+
+
+## Randgevallen:
+# ===================================
+def test_zonder_sliblaag_eindig_en_elasticiteiten():
+    duikers = _register('rond', aantal=5).vervang(sliblaag_procent=0.0)
+    gevoeligheid = gevoeligheden(duikers)
+    assert np.isfinite(gevoeligheid.afgeleiden['debiet']['sliblaag_procent']).all()
+    np.testing.assert_allclose(gevoeligheid.waarden['debiet'], duikers.debiet, rtol=1e-12)
+    elasticiteit = gevoeligheid.elasticiteiten()['debiet']
+    # Q is evenredig met sqrt(h): elasticiteit 0,5 naar de bovenwaterstand bij benedenwaterstand 0
+    np.testing.assert_allclose(elasticiteit['bovenwaterstand'], 0.5, rtol=1e-12)
+    # Zonder hoogte (rond) heeft de hoogte geen invloed
+    assert (elasticiteit['hoogte'] == 0).all()
+    assert [rij['invoer'] for rij in gevoeligheid.tabel(0)][:2] == ['diameter', 'lengte']
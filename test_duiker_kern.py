@@ -0,0 +1,73 @@
+## Tests duiker_kern
+# =============================================================================
+#   python -m pytest -q test_duiker_kern.py
+
+import json
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from duiker_kern import (Afvoerkromme, benodigde_diameter, benodigde_opstuwing, synthetisch_register,
+                         toelaatbare_lengte, toelaatbare_sliblaag)
+
+
+## Inverse berekeningen:
+# ===================================
+# Het debiet van een bekende duiker terug invullen moet de invoer teruggeven
+def test_inverse_berekeningen_geven_de_invoer_terug():
+    duikers = synthetisch_register(300, seed=2)
+    debiet = duikers.debiet
+    np.testing.assert_allclose(benodigde_opstuwing(duikers, debiet), duikers.opstuwing, atol=1e-12)
+    np.testing.assert_allclose(toelaatbare_lengte(duikers, debiet), duikers.lengte, rtol=1e-9)
+    np.testing.assert_allclose(toelaatbare_sliblaag(duikers, debiet), duikers.sliblaag_procent, atol=1e-8)
+    np.testing.assert_allclose(benodigde_diameter(duikers, debiet), duikers.diameter, atol=1e-8)
+
+
+def test_inverse_met_ontwerpverval():
+    # Met opstuwing= tellen de waterstanden van de duikers niet mee
+    duikers = synthetisch_register(50, seed=3)
+    zonder_verval = duikers.vervang(bovenwaterstand=0.0, benedenwaterstand=0.0)
+    debiet, opstuwing = duikers.debiet, duikers.opstuwing
+    np.testing.assert_allclose(toelaatbare_lengte(zonder_verval, debiet, opstuwing), duikers.lengte, rtol=1e-9)
+    np.testing.assert_allclose(benodigde_diameter(zonder_verval, debiet, opstuwing), duikers.diameter, atol=1e-8)
+
+
+def test_inverse_zonder_oplossing_geeft_nan():
+    duikers = synthetisch_register(3, seed=4)
+    # Tien keer het debiet haalt ook een duiker zonder lengte of slib niet
+    te_veel = 10 * duikers.debiet
+    assert np.isnan(toelaatbare_lengte(duikers, te_veel)).all()
+    assert np.isnan(toelaatbare_sliblaag(duikers, te_veel)).all()
+    assert np.isnan(benodigde_diameter(duikers, np.full(3, 1e3))).all()
+
+
+## Afvoerkromme:
+# ===================================
+def test_afvoerkromme_gelijk_aan_debiet(tmp_path):
+    duikers = synthetisch_register(200, seed=5)
+    kromme = Afvoerkromme(duikers)
+    np.testing.assert_allclose(kromme.debiet(duikers.opstuwing), duikers.debiet, rtol=1e-12)
+    verval = np.array([0.0, 0.01, 0.1, 0.5])
+    tabel = kromme.tabel(verval)
+    for kolom, h in enumerate(verval):
+        verwacht = duikers.vervang(bovenwaterstand=h, benedenwaterstand=0.0).debiet
+        np.testing.assert_allclose(tabel[:, kolom], verwacht, rtol=1e-12)
+    np.testing.assert_allclose(kromme.verval(duikers.debiet), duikers.opstuwing, rtol=1e-12, atol=1e-15)
+    # Per opvraging een duiker, en negatief verval geeft NaN
+    assert kromme.debiet([0.1, 0.1], duiker=[3, 7]) == pytest.approx(tabel[[3, 7], 2], rel=1e-12)
+    assert np.isnan(kromme.debiet(-0.1, duiker=0))
+    kromme.opslaan(tmp_path / 'kromme.npy')
+    np.testing.assert_array_equal(Afvoerkromme.laden(tmp_path / 'kromme.npy').coefficient, kromme.coefficient)
+
+
+## Importeren:
+# ===================================
+def test_import_laadt_geen_gui():
+    # Werkers en scripts importeren de kern zonder Streamlit, Plotly of PIL
+    code = 'import sys, json, duiker_kern; print(json.dumps(sorted(sys.modules)))'
+    modules = json.loads(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                        check=True).stdout)
+    geladen = {naam.split('.')[0] for naam in modules}
+    assert not geladen & {'streamlit', 'plotly', 'PIL', 'pydantic', 'pandas', 'scipy'}
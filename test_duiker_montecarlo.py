@@ -0,0 +1,68 @@
+## Tests duiker_montecarlo
+# =============================================================================
+#   python -m pytest -q test_duiker_montecarlo.py
+
+import numpy as np
+import pytest
+
+from duiker_montecarlo import Driehoek, Normaal, Samenvatting, Uniform, monte_carlo
+
+DUIKER = dict(diameter=0.5, lengte=21.0, sliblaag_procent=0.1, intreedweerstand=0.4, uittreedweerstand=1.0,
+              ben_str_nat_opp=10.0, manning=75.0, bovenwaterstand=0.1, benedenwaterstand=0.0)
+VERDELINGEN = {'manning': Normaal(75.0, 5.0, ondergrens=20.0),
+               'sliblaag_procent': Uniform(0.0, 0.2),
+               'intreedweerstand': Driehoek(0.3, 0.4, 0.6)}
+
+
+## Samenvatting:
+# ===================================
+def test_samenvatting_tegen_numpy():
+    waarden = np.random.default_rng(1).normal(1.0, 0.2, 200_000)
+    randen = np.linspace(0.5, 1.5, 1001)
+    samenvatting = Samenvatting(randen)
+    for blok in np.array_split(np.append(waarden, np.nan), 7):
+        samenvatting.voeg_toe(blok)
+    assert samenvatting.aantal == len(waarden) and samenvatting.ongeldig == 1
+    assert samenvatting.gemiddelde == pytest.approx(waarden.mean(), rel=1e-12)
+    assert samenvatting.standaardafwijking == pytest.approx(waarden.std(ddof=1), rel=1e-9)
+    percentielen = samenvatting.percentielen((1, 50, 99))
+    for p, waarde in percentielen.items():
+        # Hooguit één klassebreedte ernaast
+        assert abs(waarde - np.percentile(waarden, p)) <= randen[1] - randen[0]
+
+
+def test_samenvoegen_gelijk_aan_alles_in_een():
+    waarden = np.random.default_rng(2).uniform(0.0, 3.0, 10_000)
+    randen = np.linspace(0.0, 2.0, 51)
+    een = Samenvatting(randen)
+    een.voeg_toe(waarden)
+    delen = Samenvatting(randen)
+    for blok in np.array_split(waarden, 3):
+        deel = Samenvatting(randen)
+        deel.voeg_toe(blok)
+        delen.samenvoegen(deel)
+    np.testing.assert_array_equal(delen.histogram, een.histogram)
+    assert (delen.boven, delen.maximum) == (een.boven, een.maximum)
+
+
+## Monte Carlo:
+# ===================================
+def test_uitkomst_hangt_niet_af_van_het_aantal_processen():
+    argumenten = dict(aantal=50_000, seed=3, deelreeks=20_000, blokgrootte=7_000)
+    een = monte_carlo(DUIKER, VERDELINGEN, processen=1, **argumenten)
+    twee = monte_carlo(DUIKER, VERDELINGEN, processen=2, **argumenten)
+    assert een.aantal == 50_000
+    np.testing.assert_array_equal(een.histogram, twee.histogram)
+    assert een.som == twee.som
+
+
+def test_zonder_spreiding_gelijk_aan_vaste_duiker():
+    samenvatting = monte_carlo(DUIKER, {'manning': Uniform(75.0, 75.0)}, aantal=1_000)
+    vast = monte_carlo(DUIKER, {}, aantal=10)
+    assert samenvatting.minimum == pytest.approx(samenvatting.maximum, rel=1e-12)
+    assert samenvatting.gemiddelde == pytest.approx(vast.gemiddelde, rel=1e-12)
+
+
+def test_onbekend_veld_geeft_fout():
+    with pytest.raises(ValueError, match='onbekende velden'):
+        monte_carlo(DUIKER, {'breedte': Uniform(1.0, 2.0)}, aantal=10)
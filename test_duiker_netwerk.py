@@ -0,0 +1,92 @@
+## Tests duiker_netwerk
+# =============================================================================
+#   python -m pytest -q test_duiker_netwerk.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from duiker_kern import DuikerArray, synthetisch_register
+from duiker_netwerk import DuikerNetwerk, main
+
+
+## Oplossen:
+# ===================================
+def test_serie_sluit_de_waterbalans():
+    # 0 -> 1 -> 2 met vaste peilen op 0 en 2: beide duikers voeren hetzelfde af
+    duikers = synthetisch_register(2, seed=1)
+    netwerk = DuikerNetwerk(duikers, van=[0, 1], naar=[1, 2])
+    resultaat = netwerk.los_op([0, 2], [0.3, 0.0])
+    assert resultaat.residu <= 1e-9 and resultaat.geconvergeerd
+    assert resultaat.debiet[0] == pytest.approx(resultaat.debiet[1], abs=1e-9)
+    assert 0.0 < resultaat.waterstanden[1] < 0.3
+    np.testing.assert_allclose(resultaat.opstuwing.sum(), 0.3)
+
+
+def test_twee_gelijke_takken_voeren_elk_de_helft_af():
+    duikers = synthetisch_register(1, seed=2)
+    twee = DuikerArray(**{veld: np.repeat(getattr(duikers, veld), 2) for veld in DuikerArray.velden})
+    enkel = DuikerNetwerk(duikers, van=[0], naar=[1]).los_op([0, 1], [0.2, 0.0])
+    parallel = DuikerNetwerk(twee, van=[0, 0], naar=[1, 1]).los_op([0, 1], [0.2, 0.0])
+    np.testing.assert_allclose(parallel.debiet, enkel.debiet[0])
+
+
+def test_instroom_op_vrije_knoop_komt_eruit():
+    # Een vrije knoop met 0,5 m3/s instroom tussen twee randpeilen
+    duikers = synthetisch_register(2, seed=3)
+    netwerk = DuikerNetwerk(duikers, van=[1, 1], naar=[0, 2])
+    resultaat = netwerk.los_op([0, 2], [0.0, 0.0], instroom=[0.0, 0.5, 0.0])
+    assert resultaat.debiet.sum() == pytest.approx(0.5, abs=1e-9)
+    assert resultaat.waterstanden[1] > 0.0
+
+
+def test_terugstroming_is_negatief():
+    duikers = synthetisch_register(1, seed=4)
+    resultaat = DuikerNetwerk(duikers, van=[0], naar=[1]).los_op([0, 1], [0.0, 0.2])
+    assert resultaat.debiet[0] < 0
+
+
+def test_te_weinig_iteraties_is_niet_geconvergeerd():
+    duikers = synthetisch_register(2, seed=1)
+    resultaat = DuikerNetwerk(duikers, van=[0, 1], naar=[1, 2]).los_op([0, 2], [0.3, 0.0], max_iter=0)
+    assert resultaat.iteraties == 0
+    assert resultaat.residu > 1e-9 and not resultaat.geconvergeerd
+
+
+## Opdrachtregel:
+# ===================================
+def _bestanden(tmp_path):
+    duikers = pd.DataFrame(dict(van=[0, 1], naar=[1, 2], diameter=[0.5, 0.8], lengte=20.0, sliblaag_pct=10.0,
+                                intreedweerstand=0.4, uittreedweerstand=1.0, ben_str_nat_opp=10.0, manning=75.0))
+    duikers.to_csv(tmp_path / 'duikers.csv', index=False)
+    pd.DataFrame(dict(knoop=[0, 1, 2], randpeil=[0.3, None, 0.0])).to_csv(tmp_path / 'knopen.csv', index=False)
+    return [str(tmp_path / 'duikers.csv'), str(tmp_path / 'knopen.csv'), str(tmp_path / 'debiet.csv'),
+            '--waterstanden', str(tmp_path / 'peilen.csv')]
+
+
+def test_main_schrijft_debiet_en_meldt_convergentie(tmp_path, capsys):
+    assert main(_bestanden(tmp_path)) == 0
+    debiet = pd.read_csv(tmp_path / 'debiet.csv')['debiet']
+    assert debiet[0] == pytest.approx(debiet[1], abs=1e-9) and debiet[0] > 0
+    assert pd.read_csv(tmp_path / 'peilen.csv')['waterstand'].tolist()[::2] == [0.3, 0.0]
+    assert 'iteraties' in capsys.readouterr().err
+
+
+def test_main_niet_geconvergeerd_geeft_exitcode_2(tmp_path, capsys):
+    assert main(_bestanden(tmp_path) + ['--max-iter', '0']) == 2
+    assert 'niet geconvergeerd' in capsys.readouterr().err
+
+
+## Fouten:
+# ===================================
+def test_losse_knoop_geeft_fout():
+    duikers = synthetisch_register(2, seed=5)
+    netwerk = DuikerNetwerk(duikers, van=[0, 2], naar=[1, 3])
+    with pytest.raises(ValueError, match='niet met een randpeil verbonden'):
+        netwerk.los_op([0], [0.0])
+
+
+def test_ongeldige_duiker_geeft_fout():
+    duikers = synthetisch_register(1)
+    with pytest.raises(ValueError, match='eindige afvoercoëfficiënt'):
+        DuikerNetwerk(duikers.vervang(diameter=np.array([np.nan])), van=[0], naar=[1])
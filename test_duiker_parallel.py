@@ -0,0 +1,62 @@
+## Tests duiker_parallel
+# =============================================================================
+#   python -m pytest -q test_duiker_parallel.py
+
+import numpy as np
+import pytest
+
+from duiker_kern import synthetisch_register
+from duiker_parallel import PARALLEL_RESULTATEN, ParallelRekenaar
+
+
+@pytest.fixture(scope='module')
+def rekenaar():
+    # Kleine blokken, zodat een klein register over meerdere shards gaat
+    with ParallelRekenaar(processen=2, blok=1_000) as rekenaar:
+        yield rekenaar
+
+
+def _profielen(aantal):
+    duikers = synthetisch_register(aantal, seed=4)
+    profiel = np.arange(aantal) % 4
+    return duikers.vervang(profiel=profiel, hoogte=np.where(profiel == 1, duikers.diameter * 0.8, np.nan))
+
+
+## Rekenen:
+# ===================================
+def test_gelijk_aan_duikerarray(rekenaar):
+    duikers = _profielen(10_001)
+    with rekenaar.bereken(duikers) as resultaat:
+        for naam in PARALLEL_RESULTATEN:
+            np.testing.assert_allclose(getattr(resultaat, naam), getattr(duikers, naam), rtol=1e-12)
+
+
+def test_scenarios_vervangen_een_veld(rekenaar):
+    duikers = _profielen(3_000)
+    scenarios = [{}, {'manning': 60.0}, {'bovenwaterstand': 0.5, 'benedenwaterstand': 0.1}]
+    with rekenaar.bereken(duikers, scenarios=scenarios) as resultaat:
+        assert resultaat.debiet.shape == (3, len(duikers))
+        for rij, scenario in enumerate(scenarios):
+            verwacht = duikers.vervang(**{veld: np.full(len(duikers), waarde) for veld, waarde in scenario.items()})
+            np.testing.assert_allclose(resultaat.debiet[rij], verwacht.debiet, rtol=1e-12)
+
+
+def test_leeg_register(rekenaar):
+    leeg = synthetisch_register(0)
+    with rekenaar.bereken(leeg) as resultaat:
+        assert resultaat.debiet.shape == (0,)
+
+
+def test_shards_dekken_het_register(rekenaar):
+    for aantal in (0, 1, 999, 1_000, 1_001, 123_456):
+        grenzen = [0] + [eind for _, eind in rekenaar._shards(aantal)]
+        assert [begin for begin, _ in rekenaar._shards(aantal)] == grenzen[:-1]
+        assert grenzen[-1] == aantal
+
+
+def test_ongeldig_scenario_geeft_fout(rekenaar):
+    duikers = synthetisch_register(10)
+    with pytest.raises(ValueError, match='onbekende velden'):
+        rekenaar.bereken(duikers, scenarios=[{'breedte': 1.0}])
+    with pytest.raises(ValueError, match='één waarde'):
+        rekenaar.bereken(duikers, scenarios=[{'manning': np.ones(10)}])
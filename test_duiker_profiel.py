@@ -0,0 +1,67 @@
+## Tests duiker_profiel
+# =============================================================================
+#   python -m pytest -q test_duiker_profiel.py
+
+import numpy as np
+
+from duiker_kern import DuikerArray
+from duiker_profiel import lengteprofiel_figuur, min_max_decimatie
+
+
+def _watergang(aantal, seed=0):
+    # Duikers om de 50 m langs de watergang
+    rng = np.random.default_rng(seed)
+    duikers = DuikerArray(diameter=rng.uniform(0.3, 2.0, aantal),
+                          lengte=rng.uniform(5.0, 40.0, aantal),
+                          sliblaag_procent=rng.uniform(0.0, 0.4, aantal),
+                          intreedweerstand=0.4,
+                          uittreedweerstand=1.0,
+                          ben_str_nat_opp=rng.uniform(5.0, 50.0, aantal),
+                          manning=rng.uniform(40.0, 80.0, aantal),
+                          bovenwaterstand=rng.uniform(0.0, 0.3, aantal),
+                          benedenwaterstand=0.0)
+    return duikers, 50.0 * np.arange(aantal)
+
+
+## Vereenvoudiging:
+# ===================================
+def test_min_max_decimatie_houdt_uitersten():
+    rng = np.random.default_rng(1)
+    x = rng.permutation(10_000).astype(float)
+    y = rng.normal(size=x.size)
+    klein_x, klein_y = min_max_decimatie(x, y, 100)
+    assert klein_x.size <= 400 and (np.diff(klein_x) > 0).all()
+    assert klein_y.max() == y.max() and klein_y.min() == y.min()
+    # Elk overgebleven punt is een punt van de invoer
+    np.testing.assert_array_equal(klein_y, y[np.argsort(x)][klein_x.astype(int)])
+
+
+def test_min_max_decimatie_laat_weinig_punten_staan():
+    x, y = np.arange(10.0), np.arange(10.0)[::-1]
+    klein_x, klein_y = min_max_decimatie(x, y, 100)
+    np.testing.assert_array_equal(klein_x, x)
+    np.testing.assert_array_equal(klein_y, y)
+
+
+## Figuur:
+# ===================================
+def test_weinig_duikers_elk_afzonderlijk():
+    duikers, afstand = _watergang(20)
+    fig = lengteprofiel_figuur(duikers, afstand)
+    assert [trace.type for trace in fig.data] == ['scattergl'] * 3
+    water, lichamen, opstuwing = fig.data
+    # Vijf punten plus een NaN-gat per duikerlichaam
+    assert len(lichamen.x) == 6 * 20
+    np.testing.assert_allclose(opstuwing.y, duikers.opstuwing)
+    np.testing.assert_allclose(np.asarray(opstuwing.customdata)[:, 1], duikers.debiet)
+
+
+def test_veel_duikers_vereenvoudigd_binnen_bereik():
+    duikers, afstand = _watergang(20_000, seed=2)
+    bereik = (100_000.0, 600_000.0)
+    fig = lengteprofiel_figuur(duikers, afstand, bereik=bereik, max_duikers=1000, klassen=200)
+    assert 'vereenvoudigd tot 200 klassen' in fig.layout.title.text
+    assert all(len(trace.x) <= 6 * 200 for trace in fig.data)
+    _, _, opstuwing = fig.data
+    in_beeld = (afstand >= bereik[0]) & (afstand <= bereik[1])
+    assert max(opstuwing.y) == duikers.opstuwing[in_beeld].max()
@@ -0,0 +1,52 @@
+## Tests duiker_rapport
+# =============================================================================
+#   python -m pytest -q test_duiker_rapport.py
+
+import os
+import zipfile
+
+import pandas as pd
+import pytest
+
+from duiker_rapport import maak_rapport
+
+
+def _register(pad):
+    register = pd.DataFrame(dict(code=['A 1', 'B/2', 'C3', 'D4'], diameter=[0.5, 0.8, 1.0, 0.6], lengte=21.0,
+                                 sliblaag_pct=10.0, intreedweerstand=0.4, uittreedweerstand=1.0,
+                                 ben_str_nat_opp=10.0, manning=75.0, verval=[5.0, 10.0, 3.0, 8.0],
+                                 profiel=['rond', 'driehoek', 'rechthoek', 'eivorm'], hoogte=[None, None, 0.8, None]))
+    register.to_csv(pad, index=False)
+
+
+## Uitvoer:
+# ===================================
+@pytest.mark.parametrize('processen', [1, 2])
+def test_zip_met_afbeelding_per_goede_rij(tmp_path, processen):
+    _register(tmp_path / 'register.csv')
+    telling = maak_rapport(str(tmp_path / 'register.csv'), str(tmp_path / 'rapport.zip'), processen=processen,
+                           formaat='PNG', blokgrootte=3, taakgrootte=1, naamkolom='code')
+    assert (telling['rijen'], telling['afbeeldingen'], telling['afgekeurd']) == (4, 3, 1)
+    with zipfile.ZipFile(tmp_path / 'rapport.zip') as archief:
+        # Rijnummers vanaf 1, op volgorde, met een veilige bestandsnaam
+        assert archief.namelist() == ['000001_A_1.png', '000003_C3.png', '000004_D4.png']
+        assert all(archief.read(naam).startswith(b'\x89PNG') for naam in archief.namelist())
+    afgekeurd = pd.read_csv(telling['afgekeurd_bestand'])
+    assert afgekeurd['code'].tolist() == ['B/2'] and afgekeurd['fout'].tolist() == ['onbekend profiel']
+
+
+def test_pdf_met_pagina_per_duiker(tmp_path):
+    _register(tmp_path / 'register.csv')
+    maak_rapport(str(tmp_path / 'register.csv'), str(tmp_path / 'rapport.pdf'), processen=1)
+    inhoud = (tmp_path / 'rapport.pdf').read_bytes()
+    assert inhoud.startswith(b'%PDF-1.4') and inhoud.rstrip().endswith(b'%%EOF')
+    assert inhoud.count(b'/Type /Page ') == 3
+    assert b'/Count 3' in inhoud
+
+
+def test_map_en_onbekende_naamkolom(tmp_path):
+    _register(tmp_path / 'register.csv')
+    maak_rapport(str(tmp_path / 'register.csv'), str(tmp_path / 'map'), processen=1)
+    assert sorted(os.listdir(tmp_path / 'map')) == ['000001.jpg', '000003.jpg', '000004.jpg']
+    with pytest.raises(KeyError, match='naam'):
+        maak_rapport(str(tmp_path / 'register.csv'), str(tmp_path / 'map2'), processen=1, naamkolom='naam')
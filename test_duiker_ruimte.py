@@ -0,0 +1,73 @@
+## Tests duiker_ruimte
+# =============================================================================
+#   python -m pytest -q test_duiker_ruimte.py
+
+import numpy as np
+import pytest
+
+from duiker_ruimte import RasterIndex, synthetisch_register
+
+
+def _punten(aantal=3000, seed=0):
+    # Geclusterde punten met dubbele liggingen en een paar zonder ligging
+    rng = np.random.default_rng(seed)
+    x = np.concatenate([rng.normal(0.0, 50.0, aantal//2), rng.uniform(-1000.0, 1000.0, aantal - aantal//2)])
+    y = np.concatenate([rng.normal(200.0, 50.0, aantal//2), rng.uniform(-1000.0, 1000.0, aantal - aantal//2)])
+    x[:20], y[:20] = x[20:40], y[20:40]
+    x[40:45] = np.nan
+    return x, y
+
+
+## Tegen alles doorzoeken:
+# ===================================
+@pytest.mark.parametrize('celgrootte', [None, 7.5, 5000.0])
+def test_rechthoek_en_straal_gelijk_aan_alles_doorzoeken(celgrootte):
+    x, y = _punten()
+    index = RasterIndex(x, y, celgrootte)
+    assert len(index) == len(x) - 5
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        xmin, ymin = rng.uniform(-1200.0, 1000.0, 2)
+        xmax, ymax = xmin + rng.uniform(0.0, 600.0), ymin + rng.uniform(0.0, 600.0)
+        verwacht = np.flatnonzero((x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax))
+        np.testing.assert_array_equal(index.rechthoek(xmin, ymin, xmax, ymax), verwacht)
+
+        px, py, straal = *rng.uniform(-1200.0, 1200.0, 2), rng.uniform(0.0, 300.0)
+        rijen, afstand = index.straal(px, py, straal)
+        alle = np.hypot(x - px, y - py)
+        assert set(rijen.tolist()) == set(np.flatnonzero(alle <= straal).tolist())
+        np.testing.assert_array_equal(afstand, alle[rijen])
+        assert (np.diff(afstand) >= 0).all()
+
+
+@pytest.mark.parametrize('k', [1, 5, 100])
+def test_dichtstbij_gelijk_aan_alles_doorzoeken(k):
+    x, y = _punten()
+    index = RasterIndex(x, y)
+    rng = np.random.default_rng(2)
+    # Ook punten ver buiten het register
+    for px, py in np.vstack([rng.uniform(-1200.0, 1200.0, (30, 2)), [[1e5, -1e5], [0.0, 200.0]]]):
+        alle = np.hypot(x - px, y - py)
+        rijen, afstand = index.dichtstbij(px, py, k)
+        assert len(rijen) == k
+        np.testing.assert_array_equal(afstand, np.sort(alle[np.isfinite(alle)])[:k])
+        np.testing.assert_array_equal(alle[rijen], afstand)
+
+
+def test_lege_en_kleine_index():
+    index = RasterIndex([np.nan], [np.nan])
+    assert len(index) == 0 and len(index.rechthoek(-1, -1, 1, 1)) == 0 and len(index.dichtstbij(0, 0)[0]) == 0
+    rijen, _ = RasterIndex([1.0, 2.0], [1.0, 2.0]).dichtstbij(0.0, 0.0, k=5)
+    assert rijen.tolist() == [0, 1]
+
+
+## Register:
+# ===================================
+def test_register_rekent_alleen_de_uitsnede():
+    register = synthetisch_register(5000, seed=3)
+    uitsnede = register.dichtstbij(25_000.0, 25_000.0, k=10)
+    verwacht = register.duikers.deel(uitsnede.rijen)
+    np.testing.assert_allclose(uitsnede.debiet, verwacht.debiet, rtol=1e-12)
+    np.testing.assert_allclose(uitsnede.stroomsnelheid, verwacht.stroomsnelheid, rtol=1e-12)
+    assert register.berekend == 10
+    assert list(uitsnede.tabel().columns[:3]) == ['x', 'y', 'afstand']
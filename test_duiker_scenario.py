@@ -0,0 +1,65 @@
+## Tests duiker_scenario
+# =============================================================================
+#   python -m pytest -q test_duiker_scenario.py
+
+import numpy as np
+import pytest
+
+from duiker_kern import synthetisch_register
+from duiker_scenario import SCENARIO_RESULTATEN, ScenarioRekenaar, standaard_scenarios
+
+
+def _gelijk(uitkomst, duikers):
+    # Alles opnieuw rekenen met DuikerArray is de referentie
+    for naam in SCENARIO_RESULTATEN:
+        np.testing.assert_allclose(getattr(uitkomst, naam), getattr(duikers, naam), rtol=1e-12, equal_nan=True,
+                                   err_msg=naam)
+
+
+## Tegen DuikerArray:
+# ===================================
+def test_standaard_scenarios_gelijk_aan_vervang():
+    duikers = synthetisch_register(2000, seed=1)
+    rekenaar = ScenarioRekenaar(duikers)
+    for scenario in standaard_scenarios(duikers, 6):
+        _gelijk(rekenaar.bereken(scenario), duikers.vervang(**scenario))
+    assert rekenaar.overgeslagen > 0
+
+
+def test_scenario_op_meerdere_velden_en_profielen():
+    duikers = synthetisch_register(500, seed=2)
+    rng = np.random.default_rng(2)
+    profiel = np.where(rng.uniform(size=500) < 0.5, 'rond', 'rechthoek')
+    scenario = {'profiel': profiel, 'hoogte': duikers.diameter * 0.8,
+                'lengte': np.where(rng.uniform(size=500) < 0.1, duikers.lengte * 2, duikers.lengte),
+                'benedenwaterstand': np.where(rng.uniform(size=500) < 0.05, 1.0, duikers.benedenwaterstand)}
+    uitkomst = ScenarioRekenaar(duikers).bereken(scenario)
+    # Een benedenwaterstand van 1 m geeft negatief verval en dus NaN
+    _gelijk(uitkomst, duikers.vervang(**dict(scenario, profiel=uitkomst.duikers.profiel)))
+    assert np.isnan(uitkomst.debiet).any()
+
+
+## Telling:
+# ===================================
+def test_alleen_verval_rekent_geen_doorsnede():
+    duikers = synthetisch_register(100, seed=3)
+    rekenaar = ScenarioRekenaar(duikers)
+    bovenwaterstand = duikers.bovenwaterstand.copy()
+    bovenwaterstand[:10] += 0.1
+    uitkomst = rekenaar.bereken({'bovenwaterstand': bovenwaterstand})
+    assert set(uitkomst.gewijzigd) == {'bovenwaterstand'}
+    # Bij het opbouwen is alles één keer gerekend
+    assert rekenaar.telling['doorsnede'] == [100, 100] and rekenaar.telling['ruwheid'] == [100, 100]
+    assert rekenaar.telling['opstuwing'] == [110, 90] and rekenaar.telling['debiet'] == [110, 90]
+    assert rekenaar.berekend + rekenaar.overgeslagen == 2 * 5 * 100
+    assert 'totaal' in rekenaar.verslag()
+    # De basis zelf, en een scenario zonder verschil, rekent niets
+    _gelijk(rekenaar.bereken(), duikers)
+    _gelijk(rekenaar.bereken({'manning': duikers.manning.copy()}), duikers)
+    # Opstuwing, debiet en stroomsnelheid van de tien gewijzigde duikers
+    assert rekenaar.berekend == 5 * 100 + 3 * 10
+
+
+def test_onbekend_veld():
+    with pytest.raises(ValueError, match='onbekende velden'):
+        ScenarioRekenaar(synthetisch_register(3)).bereken({'debiet': 1.0})
@@ -0,0 +1,100 @@
+## Tests duiker_service
+# =============================================================================
+#   python -m pytest -q test_duiker_service.py
+
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from duiker_kern import DuikerArray
+from duiker_service import DuikerService, OngeldigVerzoek, kolommen_uit_json
+
+DUIKER = dict(diameter=0.5, lengte=21.0, sliblaag_procent=0.1, intreedweerstand=0.4, uittreedweerstand=1.0,
+              ben_str_nat_opp=10.0, manning=75.0, bovenwaterstand=0.1, benedenwaterstand=0.0)
+
+
+def _verzoek(pad, inhoud, methode='POST'):
+    async def verzoek():
+        return await DuikerService().behandel(methode, pad, json.dumps(inhoud).encode())
+    return asyncio.run(verzoek())
+
+
+## Verzoeken:
+# ===================================
+def test_een_duiker_gelijk_aan_duikerarray():
+    status, antwoord = _verzoek('/duiker', DUIKER)
+    assert status == 200
+    verwacht = DuikerArray(**{veld: np.array([waarde]) for veld, waarde in DUIKER.items()})
+    assert antwoord['debiet'] == pytest.approx(float(verwacht.debiet[0]), rel=1e-12)
+    assert antwoord['metriek']['batch_verzoeken'] >= 1
+
+
+def test_profiel_en_hoogte_worden_meegerekend():
+    rijen = [dict(DUIKER), dict(DUIKER, profiel='rechthoek', hoogte=0.8), dict(DUIKER, profiel='eivorm')]
+    status, antwoord = _verzoek('/duikers', {'duikers': rijen})
+    assert status == 200
+    verwacht = DuikerArray(**{veld: np.array([rij[veld] for rij in rijen]) for veld in DuikerArray.velden},
+                           profiel=['rond', 'rechthoek', 'eivorm'], hoogte=[np.nan, 0.8, np.nan])
+    np.testing.assert_allclose(antwoord['debiet'], verwacht.debiet, rtol=1e-12)
+    # Kolommen geven hetzelfde antwoord als rijen
+    kolommen = {veld: [rij[veld] for rij in rijen] for veld in DuikerArray.velden}
+    kolommen.update(profiel=['rond', 'rechthoek', 'eivorm'], hoogte=[None, 0.8, None])
+    status, per_kolom = _verzoek('/duikers', {'kolommen': kolommen})
+    assert status == 200
+    assert per_kolom['debiet'] == antwoord['debiet']
+
+
+@pytest.mark.parametrize('inhoud', [dict(DUIKER, profiel='driehoek'),
+                                    dict(DUIKER, profiel=3),
+                                    {veld: waarde for veld, waarde in DUIKER.items() if veld != 'manning'},
+                                    dict(DUIKER, lengte='lang')])
+def test_ongeldig_verzoek_geeft_400(inhoud):
+    status, antwoord = _verzoek('/duiker', inhoud)
+    assert status == 400
+    assert antwoord['fout']
+
+
+def test_kolommen_moeten_even_lang_zijn():
+    kolommen = {veld: [waarde, waarde] for veld, waarde in DUIKER.items()}
+    kolommen['manning'] = [75.0]
+    with pytest.raises(OngeldigVerzoek, match='even lang'):
+        kolommen_uit_json({'kolommen': kolommen}, meerdere=True)
+
+
+def test_onbekend_pad_en_gebied_zonder_register():
+    assert _verzoek('/onbekend', {})[0] == 404
+    assert _verzoek('/gebied', None, methode='GET')[0] == 404
+
+
+@pytest.mark.parametrize('pad, inhoud, melding', [('/duikers', {'kolommen': [1, 2]}, "'kolommen' moet een object"),
+                                                  ('/duikers', {'duikers': [DUIKER, 3]}, 'elke duiker'),
+                                                  ('/duikers', {'duikers': 'a'}, 'elke duiker'),
+                                                  ('/duiker', [DUIKER], 'verwacht een object')])
+def test_verkeerde_structuur_geeft_400(pad, inhoud, melding):
+    status, antwoord = _verzoek(pad, inhoud)
+    assert status == 400
+    assert melding in antwoord['fout']
+
+
+## Rekenfouten:
+# ===================================
+def test_rekenfout_geeft_500_zonder_de_batch_mee_te_nemen():
+    service = DuikerService(venster=0.05)
+    reken = service.batcher._reken
+
+    def reken_met_fout(delen):
+        if any((deel['diameter'] == 9.0).any() for deel in delen):
+            raise FloatingPointError('kapot')
+        return reken(delen)
+    service.batcher._reken = reken_met_fout
+
+    async def verzoeken():
+        return await asyncio.gather(*(service.behandel('POST', '/duiker', json.dumps(inhoud).encode())
+                                      for inhoud in (DUIKER, dict(DUIKER, diameter=9.0), DUIKER)))
+    (status_1, goed), (status_2, fout), (status_3, _) = asyncio.run(verzoeken())
+    assert (status_1, status_2, status_3) == (200, 500, 200)
+    assert 'kapot' in fout['fout']
+    assert goed['metriek']['batch_verzoeken'] == 1
+    assert service.metriek.fouten == 1 and service.metriek.verzoeken == 2
@@ -0,0 +1,94 @@
+## Tests duiker_tekening
+# =============================================================================
+#   python -m pytest -q test_duiker_tekening.py
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from duiker_tekening import DuikerRenderer, LRUCache
+
+INVOER = dict(diameter=0.5, lengte=21.0, sliblaag_cm=5, sliblaag_procent=0.1, intreedweerstand=0.4,
+              uittreedweerstand=1.0, ben_str_nat_opp=5.0, manning=75, verval=0.05, bovenwaterstand=0.05,
+              benedenwaterstand=0, keuze_sliblaag='percentage T.O.V. duiker', keuze_verval='Verval')
+
+
+def _oude_visualisatie(diameter, lengte, sliblaag_cm, sliblaag_procent, intreedweerstand, uittreedweerstand,
+                       ben_str_nat_opp, manning, verval, bovenwaterstand, benedenwaterstand, keuze_sliblaag,
+                       keuze_verval):
+    # De oorspronkelijke duiker_visualisatie: alle labels op een doorzichtige
+    # laag en die over de achtergrond, bij elke aanroep opnieuw
+    with Image.open('DuikerSchematisch_V2.jpg').convert('RGBA') as base:
+        txt = Image.new('RGBA', base.size, (255, 255, 255, 0))
+        fnt = ImageFont.truetype(font='AllerBd.TTF', size=15, index=0, encoding='', layout_engine=None)
+        d = ImageDraw.Draw(txt)
+        d.text((760, 280), f'Diameter: {diameter} [m]', font=fnt, fill=(0, 0, 0, 1000))
+        d.text((650, 360), f'Lengte: {lengte} [m]', font=fnt, fill=(0, 0, 0, 1000))
+        if keuze_sliblaag == 'percentage T.O.V. duiker':
+            d.text((1150, 345), f'Sliblaag: {sliblaag_procent * 100} [%]', font=fnt, fill=(0, 0, 0, 1000))
+        elif keuze_sliblaag == 'cm sliblaag':
+            d.text((1150, 345), f'Sliblaag: {sliblaag_cm} [cm]', font=fnt, fill=(0, 0, 0, 1000))
+        d.text((400, 17), f'Intreedweerstand: {intreedweerstand}', font=fnt, fill=(0, 0, 0, 1000))
+        d.text((950, 17), f'Uittreedweerstand: {uittreedweerstand}', font=fnt, fill=(0, 0, 0, 1000))
+        d.text((670, 17), f'Manning: {manning}', font=fnt, fill=(0, 0, 0, 1000))
+        if keuze_verval == 'Verval':
+            d.text((210, 200), 'Bovenwaterstand: N.V.T.', font=fnt, fill=(0, 0, 0, 1000))
+            d.text((1060, 300), 'Benedenwaterstand: N.V.T.', font=fnt, fill=(0, 0, 0, 1000))
+            d.text((1120, 180), f'Verval: {verval*100} [cm]', font=fnt, fill=(0, 0, 0, 1000))
+        elif keuze_verval == 'Werkelijke hoogte in +mNAP':
+            d.text((110, 200), f'Bovenwaterstand: {bovenwaterstand} [+mNAP]', font=fnt, fill=(0, 0, 0, 1000))
+            d.text((1060, 300), f'Benedenwaterstand: {benedenwaterstand} [+mNAP]', font=fnt, fill=(0, 0, 0, 1000))
+            d.text((1120, 180), 'Verval: N.V.T', font=fnt, fill=(0, 0, 0, 1000))
+        return np.asarray(Image.alpha_composite(base, txt).convert('RGB'))
+
+
+## Renderer:
+# ===================================
+def test_renderer_pixelgelijk_aan_oude_tekening():
+    renderer = DuikerRenderer()
+    # Na elkaar, zodat ook het wissen van veranderde labels meetelt
+    reeks = [INVOER,
+             dict(INVOER, diameter=0.8, manning=60),
+             dict(INVOER, keuze_sliblaag='cm sliblaag', keuze_verval='Werkelijke hoogte in +mNAP',
+                  bovenwaterstand=0.25),
+             INVOER]
+    for invoer in reeks:
+        verwacht = _oude_visualisatie(**invoer)
+        np.testing.assert_array_equal(np.asarray(renderer.figuur(**invoer)), verwacht)
+        png = Image.open(io.BytesIO(renderer.render('PNG', **invoer))).convert('RGB')
+        np.testing.assert_array_equal(np.asarray(png), verwacht)
+
+
+def test_renderer_onbekend_formaat():
+    with pytest.raises(ValueError, match='onbekend formaat'):
+        DuikerRenderer().render('BMP', **INVOER)
+
+
+## LRU-cache:
+# ===================================
+def test_cache_houdt_maximum_aantal_items():
+    cache = LRUCache(2)
+    for sleutel in 'abca':
+        cache.ophalen(sleutel, lambda: sleutel)
+    # 'a' was de oudste toen 'c' erbij kwam
+    assert len(cache) == 2 and 'b' not in cache
+    assert (cache.treffers, cache.missers) == (0, 4)
+    assert cache.ophalen('a', lambda: 'nieuw') == 'a' and cache.treffers == 1
+
+
+def test_cache_houdt_byte_budget():
+    cache = LRUCache(100, max_bytes=1000, grootte=len)
+    for sleutel in 'abc':
+        cache.ophalen(sleutel, lambda: b'x' * 400)
+    # Drie keer 400 bytes past niet: de oudste valt eruit
+    assert 'a' not in cache and cache.bytes == 800
+    cache.ophalen('b', lambda: b'')
+    cache.ophalen('d', lambda: b'x' * 300)
+    assert 'c' not in cache and 'b' in cache and cache.bytes == 700
+    # Groter dan het hele budget: wel het antwoord, niet bewaard
+    assert cache.ophalen('e', lambda: b'x' * 2000) == b'x' * 2000
+    assert 'e' not in cache and cache.bytes == 700
+    cache.leeg()
+    assert len(cache) == 0 and cache.bytes == 0
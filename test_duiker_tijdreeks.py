@@ -0,0 +1,72 @@
+## Tests duiker_tijdreeks
+# =============================================================================
+#   python -m pytest -q test_duiker_tijdreeks.py
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from duiker_kern import DuikerArray
+from duiker_tijdreeks import TijdreeksDuiker, bereken_tijdreeks, schrijf_binair
+
+DUIKER = dict(diameter=0.5, lengte=21.0, sliblaag_procent=0.1, intreedweerstand=0.4, uittreedweerstand=1.0,
+              ben_str_nat_opp=10.0, manning=75.0, bovenwaterstand=0.1, benedenwaterstand=0.0)
+
+
+def _reeks(dagen=3, stap=600.0):
+    # Eerst stroming met 10 cm verval, de laatste dag terug met 5 cm
+    tijd = np.arange(0.0, dagen * 86400.0, stap) + 1.7e9 // 86400 * 86400
+    boven = np.where(np.arange(len(tijd)) < len(tijd) - 86400/stap, 0.1, -0.05)
+    return tijd, boven, np.zeros(len(tijd))
+
+
+## Rekenen:
+# ===================================
+def test_debiet_gelijk_aan_duikerarray_in_beide_richtingen():
+    rekenaar = TijdreeksDuiker(DUIKER)
+    voor = DuikerArray(**{veld: np.array([waarde]) for veld, waarde in DUIKER.items()})
+    # Terug: in- en uittreedweerstand verwisseld
+    terug = voor.vervang(intreedweerstand=1.0, uittreedweerstand=0.4)
+    assert rekenaar.debiet(0.1, 0.0) == pytest.approx(float(voor.debiet[0]), rel=1e-12)
+    assert rekenaar.debiet(0.0, 0.1) == pytest.approx(-float(terug.debiet[0]), rel=1e-12)
+    assert rekenaar.debiet(0.2, 0.2) == 0.0
+
+
+def test_dagvolumes_en_pieken(tmp_path):
+    tijd, boven, beneden = _reeks()
+    schrijf_binair(str(tmp_path / 'reeks.bin'), tijd, boven, beneden)
+    resultaat = bereken_tijdreeks(DUIKER, str(tmp_path / 'reeks.bin'), blokgrootte=1000)
+    rekenaar = TijdreeksDuiker(DUIKER)
+    voor, terug = float(rekenaar.debiet(0.1, 0.0)), float(rekenaar.debiet(-0.05, 0.0))
+    assert resultaat.monsters == len(tijd) and resultaat.ontbrekend == 0
+    # Een meting telt voor de tijd sinds de vorige; de eerste heeft er geen
+    np.testing.assert_allclose(resultaat.dagvolumes, [voor * (86400 - 600), voor * 86400, terug * 86400])
+    assert resultaat.piek.debiet == pytest.approx(voor)
+    assert resultaat.piek_terug.debiet == pytest.approx(terug)
+    assert resultaat.piek_terug.tijd == tijd[-144]
+
+
+def test_blokgrootte_en_csv_veranderen_de_uitkomst_niet(tmp_path):
+    tijd, boven, beneden = _reeks(dagen=2)
+    boven[50:60] = np.nan
+    schrijf_binair(str(tmp_path / 'reeks.bin'), tijd, boven, beneden)
+    pd.DataFrame(dict(tijd=pd.to_datetime(tijd, unit='s', utc=True), bovenwaterstand=boven,
+                      benedenwaterstand=beneden)).to_csv(tmp_path / 'reeks.csv', index=False)
+    # Tijd als seconden sinds 1970
+    pd.DataFrame(dict(tijd=tijd, bovenwaterstand=boven,
+                      benedenwaterstand=beneden)).to_csv(tmp_path / 'seconden.csv', index=False)
+    referentie = bereken_tijdreeks(DUIKER, str(tmp_path / 'reeks.bin'), blokgrootte=10**6)
+    for pad, blokgrootte in (('reeks.bin', 7), ('reeks.csv', 100), ('seconden.csv', 100)):
+        resultaat = bereken_tijdreeks(DUIKER, str(tmp_path / pad), blokgrootte=blokgrootte)
+        assert resultaat.ontbrekend == 10
+        np.testing.assert_allclose(resultaat.dagvolumes, referentie.dagvolumes, rtol=1e-12)
+
+
+def test_gat_langer_dan_max_stap_telt_niet_mee(tmp_path):
+    tijd = np.array([0.0, 600.0, 1200.0, 9000.0, 9600.0])
+    schrijf_binair(str(tmp_path / 'reeks.bin'), tijd, np.full(5, 0.1), np.zeros(5))
+    resultaat = bereken_tijdreeks(DUIKER, str(tmp_path / 'reeks.bin'), max_stap=3600.0)
+    assert resultaat.dagvolumes[0] == pytest.approx(3 * 600 * float(TijdreeksDuiker(DUIKER).debiet(0.1, 0.0)))
+    assert math.isnan(resultaat.piek_terug.tijd)
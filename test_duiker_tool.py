@@ -0,0 +1,154 @@
+## Tests DuikerTool
+# =============================================================================
+#   python -m pytest -q test_duiker_tool.py
+#
+# De scalaire Duiker is de referentie voor de snelle paden. Buiten
+# `streamlit run` waarschuwt Streamlit alleen; de app zelf start niet.
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import DuikerTool as dt
+
+DUIKER = dict(diameter=0.5, lengte=21.0, sliblaag_procent=0.1, intreedweerstand=0.4, uittreedweerstand=1.0,
+              ben_str_nat_opp=5.0, manning=75.0, bovenwaterstand=0.05, benedenwaterstand=0.0)
+GROOTHEDEN = ('sliblaag', 'ruwheid', 'opstuwing', 'debiet', 'stroomsnelheid')
+
+
+def _velden(aantal=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return dict(diameter=rng.uniform(0.3, 2.0, aantal),
+                lengte=rng.uniform(5.0, 100.0, aantal),
+                sliblaag_procent=rng.uniform(0.0, 0.6, aantal),
+                intreedweerstand=rng.uniform(0.2, 0.8, aantal),
+                uittreedweerstand=1.0,
+                ben_str_nat_opp=rng.uniform(5.0, 50.0, aantal),
+                manning=rng.uniform(40.0, 80.0, aantal),
+                bovenwaterstand=rng.uniform(0.0, 0.3, aantal),
+                benedenwaterstand=0.0)
+
+
+def _duiker(velden, rij):
+    return dt.Duiker(**{veld: float(np.broadcast_to(waarde, velden['diameter'].shape)[rij])
+                        for veld, waarde in velden.items()})
+
+
+## Snelle paden tegen Duiker:
+# ===================================
+def test_duikerarray_gelijk_aan_duiker():
+    velden = _velden()
+    duikers = dt.DuikerArray(**velden)
+    for rij in range(len(duikers)):
+        duiker = _duiker(velden, rij)
+        for naam in GROOTHEDEN:
+            assert getattr(duikers, naam)[rij] == pytest.approx(getattr(duiker, naam), rel=1e-12)
+    assert duikers.geldig.all()
+
+
+def test_bereken_duiker_en_kern_gelijk_aan_duiker():
+    velden = _velden(50, seed=1)
+    for rij in range(50):
+        duiker = _duiker(velden, rij)
+        invoer = duiker.dict(include=set(dt.DuikerArray.velden))
+        for resultaat in (dt.bereken_duiker(**invoer), dt.DuikerKern(**invoer).bereken(), duiker.bereken()):
+            for naam in GROOTHEDEN:
+                assert getattr(resultaat, naam) == pytest.approx(getattr(duiker, naam), rel=1e-12)
+
+
+def test_diameter_nul():
+    # DuikerArray maskeert met NaN, bereken_duiker geeft een duiker zonder
+    # doorstroming
+    duikers = dt.DuikerArray(**dict(DUIKER, diameter=0.0))
+    assert np.isnan(duikers.debiet[0]) and not duikers.geldig[0]
+    resultaat = dt.bereken_duiker(**dict(DUIKER, diameter=0.0))
+    assert resultaat.debiet == 0.0 and resultaat.stroomsnelheid == 0.0
+
+
+def test_negatief_verval():
+    invoer = dict(DUIKER, bovenwaterstand=-0.05)
+    duikers = dt.DuikerArray(**invoer)
+    assert np.isnan(duikers.debiet[0]) and not duikers.geldig[0]
+    assert duikers.ruwheid[0] == pytest.approx(dt.Duiker(**invoer).ruwheid, rel=1e-12)
+    # bereken_duiker volgt de formule van Duiker, ook buiten het geldige gebied
+    assert dt.bereken_duiker(**invoer).debiet == pytest.approx(dt.Duiker(**invoer).debiet, rel=1e-12)
+
+
+def test_volledig_dichtgeslibd_geeft_nul():
+    invoer = dict(DUIKER, sliblaag_procent=1.0)
+    duikers = dt.DuikerArray(**invoer)
+    assert duikers.debiet[0] == 0.0 and duikers.stroomsnelheid[0] == 0.0
+    assert dt.bereken_duiker(**invoer).debiet == 0.0
+
+
+## Uitvoercache:
+# ===================================
+def test_uitvoer_grootte():
+    tekening = b'x' * 1000
+    figuur = _duiker(_velden(1), 0).plotly_figure()
+    assert dt.uitvoer_grootte(tekening) == 1000
+    assert dt.uitvoer_grootte(figuur) == len(figuur.to_json())
+    assert dt.uitvoer_grootte((figuur, tekening)) > len(figuur.to_json()) + 1000
+
+
+## Meting:
+# ===================================
+def test_rerun_meting_telt_spans_en_tellers_op():
+    meting = dt.RerunMeting()
+    for _ in range(2):
+        with meting.span('model'):
+            time.sleep(0.01)
+    meting.tel('afbeelding_bytes', 100)
+    meting.voeg_toe({'model': 0.5, 'visualisatie': 0.25}, {'afbeelding_bytes': 50})
+    cache = dt.LRUCache(4)
+    with meting.volg_cache('uitvoercache', cache):
+        cache.ophalen('a', lambda: 1)
+        cache.ophalen('a', lambda: 1)
+    meting.afsluiten()
+    regel = meting.als_dict()
+    assert regel['spans']['model'] >= 0.52 and regel['spans']['visualisatie'] == 0.25
+    assert regel['tellers'] == {'afbeelding_bytes': 150, 'uitvoercache_treffers': 1, 'uitvoercache_missers': 1}
+    assert regel['totaal'] >= 0.02
+
+
+def test_geen_meting_doet_niets():
+    meting = dt.GeenMeting()
+    with meting.span('model'):
+        meting.tel('afbeelding_bytes')
+    meting.afsluiten()
+
+
+## RenderPool:
+# ===================================
+def test_nieuwere_rerun_annuleert_vorige():
+    pool = dt.RenderPool(werkers=1)
+    bezig, door = threading.Event(), threading.Event()
+
+    def lang(actueel):
+        bezig.set()
+        door.wait(5)
+        # Stap na het wachten: de rerun is inmiddels vervangen
+        if not actueel():
+            raise dt.VervallenWeergave('lang')
+        return 'oud'
+
+    eerste = pool.indienen('sessie', {'lang': lang, 'wacht': lambda actueel: 'nooit'})
+    assert bezig.wait(5)
+    tweede = pool.indienen('sessie', {'nieuw': lambda actueel: 'nieuw'})
+    door.set()
+    # De wachtende taak is geannuleerd, de lopende stopt bij zijn stap
+    assert eerste['wacht'].cancelled()
+    with pytest.raises(dt.VervallenWeergave):
+        eerste['lang'].result(5)
+    assert tweede['nieuw'].result(5) == 'nieuw'
+    assert pool.geannuleerd == 2
+
+
+def test_andere_sessie_wordt_niet_geannuleerd():
+    pool = dt.RenderPool(werkers=2)
+    a = pool.indienen('a', {'taak': lambda actueel: actueel()})
+    b = pool.indienen('b', {'taak': lambda actueel: actueel()})
+    assert a['taak'].result(5) and b['taak'].result(5)
+    assert pool.geannuleerd == 0